@@ -0,0 +1,170 @@
+/* sigma.js parser for the compact binary graph format generated by
+zurnatikl.apps.network.binary; loads the data with an arraybuffer
+request and reads node and edge values from typed arrays.
+Same signature as sigma.parsers.json, with an optional error callback
+for requests that fail or don't return binary graph data:
+
+    sigma.parsers.binary(url, sigInst, callback, errback)
+*/
+;(function(undefined) {
+  'use strict';
+
+  if (typeof sigma === 'undefined')
+    throw 'sigma is not declared';
+
+  sigma.utils.pkg('sigma.parsers');
+
+  var MAGIC = 'ZNG1',
+      NONE = 0xFFFFFFFF,
+      NO_TYPE = 0xFF;
+
+  function decodeUtf8(bytes) {
+    if (typeof TextDecoder !== 'undefined')
+      return new TextDecoder('utf-8').decode(bytes);
+    // fallback for browsers without TextDecoder
+    var str = '';
+    for (var i = 0; i < bytes.length; i += 8192)
+      str += String.fromCharCode.apply(null, bytes.subarray(i, i + 8192));
+    return decodeURIComponent(escape(str));
+  }
+
+  /**
+   * Decode binary graph data into an object with nodes and edges
+   * in the format expected by sigma graph.read.
+   *
+   * @param  {ArrayBuffer} buffer The binary graph data.
+   * @return {object}             The graph data.
+   */
+  sigma.parsers.decodeBinaryGraph = function(buffer) {
+    var view = new DataView(buffer),
+        magic = String.fromCharCode.apply(null, new Uint8Array(buffer, 0, 4));
+    if (magic !== MAGIC)
+      throw 'sigma.parsers.binary: not binary graph data';
+
+    var metaLength = view.getUint32(4, true),
+        meta = JSON.parse(decodeUtf8(new Uint8Array(buffer, 8, metaLength))),
+        offset = 8 + metaLength,
+        nodeCount = meta.nodes,
+        edgeCount = meta.edges,
+        values = meta.values,
+        i, j, arr, name;
+
+    // array data is little-endian and 4-byte aligned; typed arrays use
+    // platform byte order, which is little-endian on all supported browsers
+    function read(ArrayType, count) {
+      var arr = new ArrayType(buffer, offset, count);
+      offset += arr.byteLength + (-arr.byteLength & 3);
+      return arr;
+    }
+
+    var xs = read(Float32Array, nodeCount),
+        ys = read(Float32Array, nodeCount),
+        types = read(Uint8Array, nodeCount),
+        community = read(Int32Array, nodeCount),
+        nodes = new Array(nodeCount),
+        edges = new Array(edgeCount);
+
+    for (i = 0; i < nodeCount; i++) {
+      nodes[i] = {id: i, x: xs[i], y: ys[i]};
+      if (types[i] !== NO_TYPE)
+        nodes[i].type = meta.types[types[i]];
+      if (community[i] !== -1)
+        nodes[i].community = community[i];
+    }
+    for (j = 0; j < meta.node_values.length; j++) {
+      name = meta.node_values[j];
+      arr = read(Uint32Array, nodeCount);
+      for (i = 0; i < nodeCount; i++)
+        if (arr[i] !== NONE)
+          nodes[i][name] = values[arr[i]];
+    }
+    for (j = 0; j < meta.node_numbers.length; j++) {
+      name = meta.node_numbers[j];
+      arr = read(Float32Array, nodeCount);
+      for (i = 0; i < nodeCount; i++)
+        if (!isNaN(arr[i]))
+          nodes[i][name] = arr[i];
+    }
+
+    var sources = read(Uint32Array, edgeCount),
+        targets = read(Uint32Array, edgeCount);
+    for (i = 0; i < edgeCount; i++)
+      edges[i] = {id: i, source: sources[i], target: targets[i]};
+    for (j = 0; j < meta.edge_values.length; j++) {
+      name = meta.edge_values[j];
+      arr = read(Uint32Array, edgeCount);
+      for (i = 0; i < edgeCount; i++)
+        if (arr[i] !== NONE)
+          edges[i][name] = values[arr[i]];
+    }
+    for (j = 0; j < meta.edge_numbers.length; j++) {
+      name = meta.edge_numbers[j];
+      arr = read(Float32Array, edgeCount);
+      for (i = 0; i < edgeCount; i++)
+        if (!isNaN(arr[i]))
+          edges[i][name] = arr[i];
+    }
+
+    return {
+      directed: meta.directed,
+      multigraph: meta.multigraph,
+      community_detection: meta.community_detection,
+      nodes: nodes,
+      edges: edges
+    };
+  };
+
+  /**
+   * Fetch binary graph data and load it into a sigma instance (or
+   * create a new instance), in the same manner as sigma.parsers.json.
+   *
+   * @param  {string}       url      The url of the binary graph data.
+   * @param  {object|sigma} sig      A sigma configuration object or instance.
+   * @param  {?function}    callback Called with the sigma instance and
+   *                                 the decoded graph data.
+   * @param  {?function}    errback  Called with the request if it fails
+   *                                 or the response can't be decoded;
+   *                                 errors are thrown if not specified.
+   */
+  sigma.parsers.binary = function(url, sig, callback, errback) {
+    var graph,
+        xhr = new XMLHttpRequest();
+
+    xhr.open('GET', url, true);
+    xhr.responseType = 'arraybuffer';
+    xhr.onreadystatechange = function() {
+      if (xhr.readyState === 4) {
+        try {
+          if (xhr.status !== 200)
+            throw 'sigma.parsers.binary: request failed (' + xhr.status + ')';
+          graph = sigma.parsers.decodeBinaryGraph(xhr.response);
+        } catch (err) {
+          if (errback)
+            return errback(xhr, err);
+          throw err;
+        }
+
+        // update the instance's graph
+        if (sig instanceof sigma) {
+          sig.graph.clear();
+          sig.graph.read(graph);
+
+        // ...or instantiate sigma if needed
+        } else if (typeof sig === 'object') {
+          sig.graph = graph;
+          sig = new sigma(sig);
+
+        // ...or it's finally the callback
+        } else if (typeof sig === 'function') {
+          callback = sig;
+          sig = null;
+        }
+
+        // call the callback if specified
+        if (callback)
+          callback(sig || graph, graph);
+      }
+    };
+    xhr.send();
+  };
+}).call(this);
@@ -1,7 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.admin.views import main
-from django.utils.html import format_html
+from django.core.urlresolvers import reverse
+from django.utils.html import format_html, format_html_join
 
+from zurnatikl.apps.geo import location_index
 from zurnatikl.apps.geo.models import Location
 from zurnatikl.apps.journals.models import PlaceName
 
@@ -44,4 +46,26 @@ class LocationAdmin(admin.ModelAdmin):
     ]
     change_form_template = 'geo/admin/location_change_form.html'
 
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        # list similar locations, to make it easier to spot duplicates
+        extra_context = extra_context or {}
+        location = self.get_object(request, object_id)
+        if location is not None:
+            extra_context['similar_locations'] = \
+                location_index.similar_locations(location)
+        return super(LocationAdmin, self).change_view(request, object_id,
+            form_url=form_url, extra_context=extra_context)
+
+    def save_model(self, request, obj, form, change):
+        super(LocationAdmin, self).save_model(request, obj, form, change)
+        if not change:
+            # warn about possible duplicates of a new location
+            similar = location_index.similar_locations(obj)
+            if similar:
+                messages.warning(request, format_html(
+                    u'Similar locations already exist: {}',
+                    format_html_join(u'; ', u'<a href="{}">{}</a>',
+                        ((reverse('admin:geo_location_change', args=[loc.pk]),
+                          loc.label) for loc in similar))))
+
 admin.site.register(Location, LocationAdmin)
@@ -0,0 +1,11 @@
+# zurnatikl/apps/geo/apps.py
+
+from django.apps import AppConfig
+
+class GeoConfig(AppConfig):
+    name = 'zurnatikl.apps.geo'
+
+    def ready(self):
+        # connect signal handlers that keep the in-memory location
+        # index up to date
+        from zurnatikl.apps.geo import signals
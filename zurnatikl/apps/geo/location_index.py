@@ -0,0 +1,266 @@
+# in-memory trigram index of location names, for fuzzy autocompletion
+# in the admin (see :class:`zurnatikl.apps.geo.lookups.LocationLookup`),
+# so that misspelled or run-together names (e.g. "Frisco" or
+# "Sanfrancisco") still find existing locations and near-duplicate
+# addresses can be spotted before new ones are added.  The index is
+# kept in process memory so that lookups don't require any database
+# queries; saved and deleted locations are applied to the index by
+# signal handlers (see :mod:`zurnatikl.apps.geo.signals`), and other
+# processes rebuild their copy of the index the next time it is used
+# (see :mod:`zurnatikl.indexes`).
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+import logging
+import math
+import time
+
+from django.conf import settings
+
+from zurnatikl.indexes import SharedIndex, tokenize
+from .models import Location
+
+
+logger = logging.getLogger(__name__)
+
+#: default minimum trigram similarity for a query word to match
+#: a word in a location name
+SIMILARITY_THRESHOLD = 0.3
+
+#: minimum score for an existing location to be listed as a possible
+#: duplicate (see :meth:`LocationIndex.similar`)
+DUPLICATE_THRESHOLD = 0.7
+
+
+def similarity_threshold():
+    '''Minimum trigram similarity for fuzzy location matches
+    (``LOCATION_SIMILARITY_THRESHOLD`` in django settings), between 0
+    and 1.'''
+    return getattr(settings, 'LOCATION_SIMILARITY_THRESHOLD',
+                   SIMILARITY_THRESHOLD)
+
+
+def trigrams(word):
+    '''Set of three-character sequences in a word, padded so that
+    the start and end of the word count for more.'''
+    padded = '  %s ' % word
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def location_terms(location):
+    '''Terms to index for a location: the words in its street address,
+    city, state name, and country name, and multi-word names with the
+    spaces removed so that run-together names can match.'''
+    terms = set()
+    components = [location.street_address, location.city,
+                  location.state.name if location.state else None,
+                  location.country.name]
+    for component in components:
+        words = tokenize(component)
+        terms.update(words)
+        if len(words) > 1:
+            terms.add(''.join(words))
+    return terms
+
+
+class LocationMatch(namedtuple('LocationMatch', ['pk', 'label'])):
+    '''Indexed location, with its display label.  Stands in for a
+    :class:`~zurnatikl.apps.geo.models.Location` in lookup results.'''
+
+    def __unicode__(self):
+        return self.label
+
+
+class LocationIndex(object):
+    '''Trigram index of the terms in location names.  Query words match
+    terms that start with them, or terms with enough trigrams in common
+    with them (see :func:`similarity_threshold`).'''
+
+    def __init__(self):
+        #: location id to :class:`LocationMatch`
+        self.locations = {}
+        #: location id to indexed terms, for updating locations
+        self.location_terms = {}
+        #: term to set of location ids
+        self.term_locations = {}
+        #: sorted list of indexed terms
+        self.terms = []
+        #: term to set of trigrams
+        self.term_trigrams = {}
+        #: trigram to set of terms
+        self.trigram_terms = defaultdict(set)
+
+    def add_location(self, location):
+        '''Index a :class:`~zurnatikl.apps.geo.models.Location`; state
+        and country should already be loaded.  Replaces any existing
+        entry for the location.'''
+        self.remove_location(location.pk)
+        self.locations[location.pk] = LocationMatch(location.pk,
+                                                    unicode(location))
+        terms = location_terms(location)
+        for term in terms:
+            if term not in self.term_locations:
+                self.term_locations[term] = set()
+                insort(self.terms, term)
+                self.term_trigrams[term] = trigrams(term)
+                for trigram in self.term_trigrams[term]:
+                    self.trigram_terms[trigram].add(term)
+            self.term_locations[term].add(location.pk)
+        self.location_terms[location.pk] = terms
+
+    def remove_location(self, location_id):
+        for term in self.location_terms.pop(location_id, []):
+            locations = self.term_locations[term]
+            locations.discard(location_id)
+            if not locations:
+                del self.term_locations[term]
+                del self.terms[bisect_left(self.terms, term)]
+                for trigram in self.term_trigrams.pop(term):
+                    self.trigram_terms[trigram].discard(term)
+                    if not self.trigram_terms[trigram]:
+                        del self.trigram_terms[trigram]
+        self.locations.pop(location_id, None)
+
+    def matching_terms(self, word, threshold):
+        '''Indexed terms matching a query word, as a dictionary of term
+        to similarity; terms that start with the word are full matches.'''
+        matches = {}
+        i = bisect_left(self.terms, word)
+        while i < len(self.terms) and self.terms[i].startswith(word):
+            matches[self.terms[i]] = 1.0
+            i += 1
+
+        word_trigrams = trigrams(word)
+        shared = defaultdict(int)
+        for trigram in word_trigrams:
+            for term in self.trigram_terms.get(trigram, ()):
+                shared[term] += 1
+        for term, count in shared.iteritems():
+            if term in matches:
+                continue
+            similarity = float(count) / \
+                (len(word_trigrams) + len(self.term_trigrams[term]) - count)
+            if similarity >= threshold:
+                matches[term] = similarity
+        return matches
+
+    def word_scores(self, word, threshold):
+        '''Locations matching a query word, as a dictionary of location
+        id to the best similarity of any of its terms.'''
+        word_scores = {}
+        for term, similarity in \
+                self.matching_terms(word, threshold).iteritems():
+            for location_id in self.term_locations[term]:
+                if similarity > word_scores.get(location_id, 0):
+                    word_scores[location_id] = similarity
+        return word_scores
+
+    def search(self, query, threshold=None):
+        '''Find locations matching all the words in a query, allowing
+        for misspellings.  Returns a list of tuples of
+        :class:`LocationMatch` and score (the average similarity of the
+        query words), best matches first.'''
+        if threshold is None:
+            threshold = similarity_threshold()
+        words = set(tokenize(query))
+        if not words:
+            return []
+        scores = None
+        for word in words:
+            word_scores = self.word_scores(word, threshold)
+            if scores is None:
+                scores = word_scores
+            else:
+                # locations must match every word
+                scores = dict((location_id, score + word_scores[location_id])
+                              for location_id, score in scores.iteritems()
+                              if location_id in word_scores)
+            if not scores:
+                return []
+        results = [(self.locations[location_id], score / len(words))
+                   for location_id, score in scores.iteritems()]
+        return sorted(results, key=lambda r: (-r[1], r[0].label))
+
+    def similar(self, terms, threshold=None,
+                min_score=DUPLICATE_THRESHOLD):
+        '''Find locations sharing most of a set of terms, allowing for
+        misspellings, to identify possible duplicates; unlike
+        :meth:`search`, locations don't have to match every term, so
+        that a duplicate missing part of an address is still found.
+        Terms are weighted by how few locations they match, so that a
+        shared street name counts for more than a shared city or
+        country.  Returns a list of tuples of :class:`LocationMatch`
+        and score (the weighted fraction of the terms matched), best
+        matches first.'''
+        if threshold is None:
+            threshold = similarity_threshold()
+        if not terms or not self.locations:
+            return []
+        total = 0
+        scores = defaultdict(float)
+        for term in terms:
+            word_scores = self.word_scores(term, threshold)
+            weight = 1 + math.log(float(len(self.locations)) /
+                                  max(1, len(word_scores)))
+            total += weight
+            for location_id, similarity in word_scores.iteritems():
+                scores[location_id] += weight * similarity
+        results = [(self.locations[location_id], score / total)
+                   for location_id, score in scores.iteritems()
+                   if score / total >= min_score]
+        return sorted(results, key=lambda r: (-r[1], r[0].label))
+
+
+def build_index():
+    '''Build the location index for all locations from the database.'''
+    start = time.time()
+    index = LocationIndex()
+    for location in Location.objects.select_related('state', 'country') \
+                                    .order_by():
+        index.add_location(location)
+    logger.debug('Built location index (%d locations, %d terms) in %.2f sec',
+                 len(index.locations), len(index.terms), time.time() - start)
+    return index
+
+
+#: location index for the current process
+shared_index = SharedIndex('location-index', build_index)
+
+
+def update_locations(location_ids):
+    '''Update the location index for the specified locations, adding,
+    re-indexing, or removing them as needed.  The index for the current
+    process is updated in place if it is loaded and current; other
+    processes rebuild their index when it is next used.'''
+    location_ids = [pk for pk in location_ids if pk is not None]
+    if not location_ids:
+        return
+
+    def update(index):
+        locations = Location.objects.filter(pk__in=location_ids) \
+                                    .select_related('state', 'country')
+        found = set()
+        for location in locations:
+            index.add_location(location)
+            found.add(location.pk)
+        for location_id in set(location_ids) - found:
+            # location has been deleted
+            index.remove_location(location_id)
+
+    shared_index.changed(update)
+
+
+def search(query):
+    '''Fuzzy search for locations by street address, city, state, and
+    country name.  Returns a list of :class:`LocationMatch`, best
+    matches first.'''
+    with shared_index.use() as index:
+        return [match for match, score in index.search(query)]
+
+
+def similar_locations(location, limit=10):
+    '''Existing locations that may be duplicates of a location, best
+    matches first (see :meth:`LocationIndex.similar`).'''
+    with shared_index.use() as index:
+        results = index.similar(location_terms(location))
+    return [match for match, score in results
+            if match.pk != location.pk][:limit]
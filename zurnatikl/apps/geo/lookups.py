@@ -1,6 +1,5 @@
-import re
-from django.db.models import Q
 from ajax_select import LookupChannel
+from zurnatikl.apps.geo import location_index
 from zurnatikl.apps.geo.models import Location
 
 
@@ -8,7 +7,8 @@ class LocationLookup(LookupChannel):
     '''Custom :class:`~zurnatikl.apps.geo.models.Location` lookup
     for ajax autocompletion on edit forms.  Searches on
     street address, city, state name, and country name (case-insensitive,
-    partial matching).'''
+    partial and fuzzy matching, so that misspelled names still find
+    existing locations).'''
 
     model = Location
 
@@ -16,19 +16,7 @@ class LocationLookup(LookupChannel):
             'on any one of street address, city, state, or country.'
 
     def get_query(self, q, request):
-        words = re.split(',? +', q)
-        locations = Location.objects.all().distinct()
-        # using distinct in case a term matches multiple names
-
-        for w in words:
-            locations = locations.filter(
-                Q(street_address__icontains=w) |
-                Q(city__icontains=w) |
-                Q(state__name__icontains=w) |
-                Q(country__name__icontains=w))
-
-        return locations
-        # not sure what would be meaningful to sort on,
-        # since so many of these fields are optional
-        # so leaving unsorted/default sort
-
+        # search the in-memory trigram index, so that lookups don't
+        # require a multi-table database query; results are ranked
+        # by how closely they match, best matches first
+        return location_index.search(q)
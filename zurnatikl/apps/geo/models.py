@@ -1,3 +1,4 @@
+from collections import defaultdict
 from django.db import models
 
 # for parsing natural key
@@ -87,6 +88,23 @@ class LocationManager(models.Manager):
     def get_by_natural_key(self, street_address, city, zipcode):
         return self.get(street_address=street_address, city=city, zipcode=zipcode)
 
+    def network_data(self):
+        '''Network nodes for all locations, equivalent to
+        :attr:`Location.network_attributes` but generated with a fixed
+        number of queries.  Returns a list of tuples of network id and
+        node attributes, and a list of edges (always empty, since
+        location edges are generated by the related content).'''
+        # names used for each location in places mentioned
+        placenames = defaultdict(list)
+        for location_id, name in self.filter(placename__isnull=False) \
+                .order_by().values_list('id', 'placename__name'):
+            placenames[location_id].append(name)
+
+        nodes = [(loc.network_id,
+                  loc.get_network_attributes(placenames.get(loc.id, [])))
+                 for loc in self.all().select_related('state', 'country')]
+        return nodes, []
+
 
 class Location(models.Model):
     """
@@ -158,19 +176,25 @@ class Location(models.Model):
     @property
     def network_attributes(self):
         #: data to be included as node attributes when generating a network
+        return self.get_network_attributes(
+            [unicode(pn) for pn in self.placename_set.all()])
+
+    def get_network_attributes(self, placenames):
+        # network attributes with place names mentioned retrieved
+        # elsewhere, so they can be generated in bulk
         attrs = {
             'type': self.network_type,
             'label': unicode(self),
             'city': self.city,
             # boolean flag to allow filtering out mentioned places in output
-            'mentioned': self.placename_set.exists()
+            'mentioned': bool(placenames)
         }
         if self.street_address:
             attrs['street address'] = self.street_address
         if self.zipcode:
             attrs['zipcode'] = self.zipcode
-        if self.placename_set.count():
-            attrs['placenames'] = '; '.join(set(unicode(pn) for pn in self.placename_set.all()))
+        if placenames:
+            attrs['placenames'] = '; '.join(set(placenames))
         if self.state:
             attrs.update({
                 'state': self.state.name,
@@ -0,0 +1,18 @@
+# signal handlers to keep the in-memory location index used for
+# autocompletion in sync with the database
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import location_index
+from .models import Location
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def update_location(sender, instance, **kwargs):
+    # update the location index when the current transaction commits, so
+    # other processes never load uncommitted data into the index
+    location_ids = [instance.pk]
+    transaction.on_commit(
+        lambda: location_index.update_locations(location_ids))
@@ -1,7 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from mock import patch
 
+from zurnatikl.apps.geo import location_index
+from zurnatikl.apps.geo.lookups import LocationLookup
 from zurnatikl.apps.geo.models import Location, GeonamesCountry, StateCode
 from zurnatikl.apps.journals.models import PlaceName, Issue, Item
 from zurnatikl.apps.people.models import Person
@@ -107,6 +111,59 @@ class LocationTestCase(TestCase):
         self.assertFalse(self.maz.has_network_edges)
         self.assertFalse(self.bannam.has_network_edges)
 
+    # apply changes to the location index immediately, since test cases
+    # are never committed
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_location_lookup(self):
+        cache.clear()
+        lookup = LocationLookup()
+        location_index.shared_index.load()
+        # index is in memory; lookups don't query the database
+        with self.assertNumQueries(0):
+            results = lookup.get_query('bannam', None)
+        self.assertEqual([self.bannam.pk], [r.pk for r in results])
+        self.assertEqual(unicode(self.bannam), unicode(results[0]))
+        # misspelled and run-together names match
+        for query in ['14 Banam Aley', 'bannam frisco', 'Bannam, Sanfrancisco']:
+            self.assert_(self.bannam.pk in
+                         [r.pk for r in lookup.get_query(query, None)],
+                         'fuzzy query %s should match location' % query)
+        # exact matches rank ahead of fuzzy matches
+        maz2 = Location.objects.create(city='Mazatlam', country=self.mx)
+        self.assertEqual([self.maz.pk, maz2.pk],
+                         [r.pk for r in lookup.get_query('mazatlan', None)])
+        self.assertEqual([], lookup.get_query('bannam mazatlan', None))
+
+        # new locations are checked for near-duplicates
+        dupe = Location.objects.create(street_address='14 Banam Aley',
+            city='Sanfrancisco', state=self.ca, country=self.us)
+        self.assert_(self.bannam.pk in
+                     [loc.pk for loc in location_index.similar_locations(dupe)])
+        self.assertEqual([maz2.pk],
+            [loc.pk for loc in location_index.similar_locations(self.maz)])
+        # duplicates don't have to match every part of the address
+        for partial in [
+                Location(street_address='Bannam Alley', city='San Francisco',
+                         state=self.ca, country=self.us),
+                Location(street_address='14 Bannam Alley',
+                         city='San Francisco', country=self.us)]:
+            partial.save()
+            self.assert_(self.bannam.pk in [loc.pk for loc in
+                         location_index.similar_locations(partial)])
+            self.assert_(partial.pk in [loc.pk for loc in
+                         location_index.similar_locations(self.bannam)])
+            partial.delete()
+        # sharing only a city, state, and country isn't enough
+        grove = Location.objects.create(street_address='12 Grove St',
+            city='San Francisco', state=self.ca, country=self.us)
+        self.assert_(self.bannam.pk not in
+            [loc.pk for loc in location_index.similar_locations(grove)])
+        grove.delete()
+        dupe_id = dupe.pk
+        dupe.delete()
+        self.assert_(dupe_id not in
+                     [r.pk for r in lookup.get_query('sanfrancisco', None)])
+
 
 class LocationAdminViewsTestCase(TestCase):
     fixtures = ['test_network.json']
@@ -0,0 +1 @@
+default_app_config = 'zurnatikl.apps.journals.apps.JournalsConfig'
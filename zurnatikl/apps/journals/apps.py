@@ -0,0 +1,11 @@
+# zurnatikl/apps/journals/apps.py
+
+from django.apps import AppConfig
+
+class JournalsConfig(AppConfig):
+    name = 'zurnatikl.apps.journals'
+
+    def ready(self):
+        # connect signal handlers that keep the cached contributor
+        # network and search index up to date
+        from zurnatikl.apps.journals import signals
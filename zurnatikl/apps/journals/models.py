@@ -1,4 +1,5 @@
-from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
 from django.db import models
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
@@ -7,18 +8,34 @@ from django.utils.safestring import mark_safe
 import itertools
 import logging
 import time
+import uuid
 
 from igraph import Graph
 from django_date_extensions import fields as ddx
 from stdimage.models import StdImageField
 
 from zurnatikl.apps.geo.models import Location
+from zurnatikl.apps.network import artifacts, graph_cache
 from zurnatikl.apps.people.models import Person, School
 
 
 logger = logging.getLogger(__name__)
 
 
+def publication_year(date):
+    '''Year for an approximate publication date, as an
+    :class:`~django_date_extensions.fields.ApproximateDate` or
+    a database value (e.g. ``1963-06-00``).  Returns None if the
+    year is unknown.'''
+    if not date:
+        return None
+    year = getattr(date, 'year', None)
+    if year is None:
+        year = unicode(date)[:4]
+        year = int(year) if year.isdigit() else None
+    return year or None
+
+
 # for parsing natural key
 class PlaceNameManager(models.Manager):
     def get_by_natural_key(self, name, location, item):
@@ -80,6 +97,17 @@ class JournalManager(models.Manager):
     def by_author(self, person):
         return self.get_queryset().by_author(person)
 
+    def network_data(self):
+        '''Network nodes and edges for all journals, equivalent to
+        :attr:`Journal.network_attributes` and :attr:`Journal.network_edges`
+        but generated with a fixed number of queries.  Returns a list
+        of tuples of network id and node attributes, and a list of edges.'''
+        nodes = [(j.network_id, j.network_attributes) for j in self.all()]
+        edges = [('journal:%s' % journal_id, 'school:%s' % school_id)
+                 for journal_id, school_id in self.model.schools.through \
+                    .objects.values_list('journal_id', 'school_id')]
+        return nodes, edges
+
 
 class Journal(models.Model):
     'A Journal or Magazine'
@@ -172,164 +200,553 @@ class Journal(models.Model):
         return [(self.network_id, school.network_id) for school in self.schools.all()]
 
     contributor_network_cache_key = 'journal-contributor-network'
+    #: cache key for the per-issue edge weights that make up the
+    #: cached contributor network, used for incremental updates
+    #: (see :meth:`cached_contributor_edges`)
+    contributor_edges_cache_key = 'journal-contributor-network-edges'
+    #: cache key for the lock that serializes contributor network updates
+    contributor_update_lock_key = 'journal-contributor-network-update'
+    #: cache key flagging that contributor network updates overlapped
+    contributor_update_stale_key = 'journal-contributor-network-stale'
+    #: seconds after which a contributor network update lock expires
+    contributor_update_timeout = 60
+    #: labels for contributor network edges
+    contributor_edge_labels = ['editor', 'co-editor', 'contributor', 'edited',
+                               'co-author', 'translator', 'translated']
+    #: cache key for contributor network edge weights by publication year
+    contributor_years_cache_key = 'journal-contributor-network-years'
 
     @classmethod
     def contributor_network(cls):
         'Network graph of authors, editors, translators, and journals'
 
         # NOTE: this is a bit slow to be generating on the fly.
-        # For now, cache the network after it's generated, but that
-        # should probably be refined
-        graph = cache.get(cls.contributor_network_cache_key)
+        # For now, cache the network after it's generated; the cached
+        # graph is updated in place when contributor data changes
+        # (see :mod:`zurnatikl.apps.journals.signals`)
+        graph = graph_cache.get(cls.contributor_network_cache_key)
         if graph:
             logger.debug('Using cached journal contributor network graph')
             return graph
 
-        graph = Graph()
-        graph.to_directed()   # we want a directed graph
-        full_start = time.time()
-        # gather edges in an ordered dict to avoid generating duplicate
-        # edges, and so edge weights can be added efficiently
-        # - key is a tuple of source & target nodes, edge label, i.e.
-        #   ((source, target), label)
-        # - value is the count or weight of that edge
-        edges = OrderedDict()
+        # use precomputed network data if available
+        graph = artifacts.load('contributor-network')
+        issue_edges = artifacts.load('contributor-network-edges')
+        if graph is None or issue_edges is None:
+            issue_edges = cls.contributor_network_edges()
+            graph = cls.build_contributor_network(issue_edges)
+
+        # store the generated graph in the cache for the next time,
+        # along with the edges it was built from
+        graph_cache.set_many({
+            cls.contributor_network_cache_key: graph,
+            cls.contributor_edges_cache_key:
+                cls.cache_contributor_edges(issue_edges)
+        })
+        return graph
 
-        # helper method to add edges:
-        # set count to 1 if not already present; increase count if present
-        def add_edge(edge):
-            if edge not in edges:
-                edges[edge] = 1
-            else:
-                edges[edge] += 1
-
-        # start = time.time()
-        # prefetch journal contributors all at once, for efficiency
-        journals = Journal.objects.all().prefetch_related(
-            'schools', 'issue_set__editors', 'issue_set__item_set__creators',
-            'issue_set__item_set__translators')
-        # NOTE: this query is currently the slowest step in generating the
-        # graph, nearly ~4s in dev.  It can only be timed here if it is
-        # forced to evaluate via list or similar, but it is slightly more
-        # efficient not to evaluate it that way
-        # logger.debug('Retrieved journal contributor data from db in %.2f sec',
-                    # time.time() - start)
-
-        for j in journals:
-            start = time.time()
-            # starting count, to easily calculate number of nodes & edges added
-            vtx_count = len(graph.vs())
-            edge_count = len(edges)
-            graph.add_vertex(j.network_id, label=unicode(j),
-                             type=j.network_type,
-                             schools=[s.name for s in j.schools.all()])
+    @classmethod
+    def cache_contributor_edges(cls, issue_edges):
+        '''Cache the per-issue edges a contributor network was built from,
+        as returned by :meth:`contributor_network_edges`.  The edges are
+        cached once under their own key, outside the network data version,
+        so that incremental updates only need to store the edges for
+        the issues that changed.  Returns the value to cache with the
+        network under :attr:`contributor_edges_cache_key`: a tuple of
+        the key for the full set of edges and a dictionary of edges for
+        changed issues.'''
+        key = '%s-%s' % (cls.contributor_edges_cache_key, uuid.uuid4().hex)
+        cache.set(key, issue_edges, graph_cache.TIMEOUT)
+        return (key, {})
+
+    @classmethod
+    def cached_contributor_edges(cls, edges_info=None, issue_ids=None):
+        '''Per-issue edges for the cached contributor network, with the
+        edges for changed issues applied.  Takes the value cached under
+        :attr:`contributor_edges_cache_key` (loaded from the cache if not
+        specified) and optionally a list of issue ids to restrict to.
+        Returns None if the edges are no longer cached.'''
+        if edges_info is None:
+            edges_info = graph_cache.get(cls.contributor_edges_cache_key)
+            if edges_info is None:
+                return None
+        key, changed = edges_info
+        issue_edges = cache.get(key)
+        if issue_edges is None:
+            return None
+        if issue_ids is not None:
+            return dict((issue_id, changed.get(issue_id,
+                                               issue_edges.get(issue_id, {})))
+                        for issue_id in issue_ids)
+        issue_edges.update(changed)
+        return issue_edges
+
+    @classmethod
+    def contributor_network_edges(cls, issue_ids=None):
+        '''Calculate the contributor network edges contributed by each
+        issue.  Relationships are read from the editor, creator, and
+        translator through-tables with flat :meth:`values_list` queries,
+        so the number of queries is fixed regardless of the size of the
+        data.  Optionally restrict to a list of issue ids.
+
+        Returns an :class:`~collections.OrderedDict` of issue id to an
+        :class:`~collections.OrderedDict` of
+        ``((source network id, target network id), label)`` to edge weight,
+        ordered by journal and issue.
+        '''
+        start = time.time()
+        issues = Issue.objects.all()
+        editor_rels = Issue.editors.through.objects.all()
+        items = Item.objects.all()
+        creator_rels = CreatorName.objects.all()
+        translator_rels = Item.translators.through.objects.all()
+        if issue_ids is not None:
+            issues = issues.filter(pk__in=issue_ids)
+            editor_rels = editor_rels.filter(issue__in=issue_ids)
+            items = items.filter(issue__in=issue_ids)
+            creator_rels = creator_rels.filter(item__issue__in=issue_ids)
+            translator_rels = translator_rels.filter(item__issue__in=issue_ids)
+
+        # person ordering used for relations, to match the default
+        # ordering of the many-to-many querysets
+        person_order = ('person__last_name', 'person__first_name')
+
+        issue_editors = defaultdict(list)
+        for issue_id, person_id in editor_rels.order_by(*person_order) \
+                .values_list('issue_id', 'person_id'):
+            issue_editors[issue_id].append('person:%s' % person_id)
+
+        issue_items = defaultdict(list)
+        for item_id, issue_id in items.values_list('id', 'issue_id'):
+            issue_items[issue_id].append(item_id)
+
+        item_creators = defaultdict(list)
+        for item_id, person_id in creator_rels.order_by(*person_order) \
+                .values_list('item_id', 'person_id'):
+            item_creators[item_id].append('person:%s' % person_id)
+
+        item_translators = defaultdict(list)
+        for item_id, person_id in translator_rels.order_by(*person_order) \
+                .values_list('item_id', 'person_id'):
+            item_translators[item_id].append('person:%s' % person_id)
+
+        issue_edges = OrderedDict()
+        for issue_id, journal_id in issues.values_list('id', 'journal_id'):
+            journal = 'journal:%s' % journal_id
+            # gather edges in an ordered dict to avoid generating duplicate
+            # edges, and so edge weights can be added efficiently
+            # - key is a tuple of source & target nodes, edge label, i.e.
+            #   ((source, target), label)
+            # - value is the count or weight of that edge
+            edges = issue_edges[issue_id] = OrderedDict()
+
+            # helper method to add edges:
+            # set count to 1 if not already present; increase count if present
+            def add_edge(edge):
+                if edge not in edges:
+                    edges[edge] = 1
+                else:
+                    edges[edge] += 1
 
             # journal editors are at the issue level
-            for issue in j.issue_set.all():
-                editors = issue.editors.all()
-                for i, editor in enumerate(editors):
-                    # only add if not already present
-                    if editor.network_id not in graph.vs['name']:
-                        graph.add_vertex(editor.network_id,
-                                         type=editor.network_type,
-                                         label=editor.firstname_lastname)
-                    add_edge(((editor.network_id, j.network_id), 'editor'))
-
-                    # add a co-editor rel to any other editors on this issue
-                    for co_editor in editors[i+1:]:
-                        add_edge(((editor.network_id, co_editor.network_id),
-                                 'co-editor'))
-
-                # authors and translators are at the item level
-                for item in issue.item_set.all():
-                    authors = item.creators.all()
-                    for i, author in enumerate(authors):
-                        # only add person if not already present in the graph
-                        if author.network_id not in graph.vs['name']:
-                            graph.add_vertex(author.network_id,
-                                             label=author.firstname_lastname,
-                                             type=author.network_type)
-                        # author is a journal contributor
-                        add_edge(((author.network_id, j.network_id),
-                                 'contributor'))
-
-                        # each author is connected to the issue editors who
-                        # edited their work
-                        for editor in editors:
-                            add_edge(((editor.network_id, author.network_id),
-                                     'edited'))
-
-                        # add a co-author to any other authors on this item
-                        for co_author in authors[i+1:]:
-                            add_edge(((author.network_id, co_author.network_id),
-                                     'co-author'))
-
-                    for translator in item.translators.all():
-                        # only add person if not already present in the graph
-                        if translator.network_id not in graph.vs['name']:
-                            graph.add_vertex(translator.network_id,
-                                             label=translator.firstname_lastname,
-                                             type=translator.network_type)
-
-                        # translators are connected to the journal they contributed to
-                        add_edge(((translator.network_id, j.network_id),
-                                 'translator'))
-                        # and to the author whose work they translated
-                        for author in authors:
-                            add_edge(((translator.network_id, author.network_id),
-                                     'translated'))
-
-            logger.debug('Added %d nodes and %d edges for %s in %.2f sec',
-                         len(graph.vs()) - vtx_count, len(edges) - edge_count,
-                         j, time.time() - start)
-
-        # add person-school associations
+            editors = issue_editors.get(issue_id, [])
+            for i, editor in enumerate(editors):
+                add_edge(((editor, journal), 'editor'))
+                # add a co-editor rel to any other editors on this issue
+                for co_editor in editors[i+1:]:
+                    add_edge(((editor, co_editor), 'co-editor'))
+
+            # authors and translators are at the item level
+            for item_id in issue_items.get(issue_id, []):
+                authors = item_creators.get(item_id, [])
+                for i, author in enumerate(authors):
+                    # author is a journal contributor
+                    add_edge(((author, journal), 'contributor'))
+                    # each author is connected to the issue editors who
+                    # edited their work
+                    for editor in editors:
+                        add_edge(((editor, author), 'edited'))
+                    # add a co-author to any other authors on this item
+                    for co_author in authors[i+1:]:
+                        add_edge(((author, co_author), 'co-author'))
+
+                for translator in item_translators.get(item_id, []):
+                    # translators are connected to the journal they contributed to
+                    add_edge(((translator, journal), 'translator'))
+                    # and to the author whose work they translated
+                    for author in authors:
+                        add_edge(((translator, author), 'translated'))
+
+        logger.debug('Calculated contributor network edges for %d issues in %.2f sec',
+                     len(issue_edges), time.time() - start)
+        return issue_edges
+
+    @classmethod
+    def contributor_network_issue_years(cls, issue_ids=None):
+        '''Publication year for each issue, as a dictionary keyed on
+        issue id.  Year is None for issues without a publication date.
+        Optionally restrict to a list of issue ids.'''
+        issues = Issue.objects.all()
+        if issue_ids is not None:
+            issues = issues.filter(pk__in=issue_ids)
+        return dict((issue_id, publication_year(date)) for issue_id, date
+                    in issues.values_list('id', 'publication_date'))
+
+    @classmethod
+    def contributor_network_year_edges(cls, issue_edges=None, issue_years=None):
+        '''Contributor network edge weights grouped by the publication year
+        of the issues they came from, so that the network for a range of
+        years can be generated by adding up the edges for each year in the
+        range, without querying the database.  Takes optional edges as
+        returned by :meth:`contributor_network_edges` and issue years as
+        returned by :meth:`contributor_network_issue_years`.
+
+        Returns an :class:`~collections.OrderedDict` of year to
+        a dictionary of ``((source network id, target network id), label)``
+        to edge weight, in order by year.  Edges from issues without a
+        publication date are not included.'''
+        if issue_edges is None:
+            issue_edges = cls.contributor_network_edges()
+        if issue_years is None:
+            issue_years = cls.contributor_network_issue_years()
+        years = defaultdict(lambda: defaultdict(int))
+        for issue_id, edges in issue_edges.iteritems():
+            year = issue_years.get(issue_id)
+            if year is None:
+                continue
+            for edge, weight in edges.iteritems():
+                years[year][edge] += weight
+        return OrderedDict((year, dict(years[year])) for year in sorted(years))
+
+    @classmethod
+    def contributor_network_years(cls):
+        '''Cached contributor network edge weights by publication year
+        (see :meth:`contributor_network_year_edges`), generated from
+        precomputed network data or from the edges of the cached
+        contributor network if available.'''
+        year_edges = graph_cache.get(cls.contributor_years_cache_key)
+        if year_edges is not None:
+            return year_edges
+
+        year_edges = artifacts.load('contributor-network-years')
+        if year_edges is None:
+            # make sure the per-issue edges are cached, so only issue
+            # publication dates need to be queried
+            cls.contributor_network()
+            year_edges = cls.contributor_network_year_edges(
+                cls.cached_contributor_edges())
+        graph_cache.set(cls.contributor_years_cache_key, year_edges)
+        return year_edges
+
+    @classmethod
+    def contributor_network_timeslice(cls, start=None, end=None, graph=None):
+        '''Contributor network for issues published in a range of years,
+        inclusive; either start or end can be omitted for an open-ended
+        range.  Edge weights are added up from the edges for each year
+        (see :meth:`contributor_network_years`).  Vertices are taken from
+        the full contributor network, or from the specified graph (e.g.,
+        an annotated copy); only vertices with edges in the range of years
+        are included.'''
+        if graph is None:
+            graph = cls.contributor_network()
+        year_edges = cls.contributor_network_years()
+        years = year_edges.keys()
+        first = bisect_left(years, start) if start is not None else 0
+        last = bisect_right(years, end) if end is not None else len(years)
+
+        edges = defaultdict(int)
+        for year in years[first:last]:
+            for edge, weight in year_edges[year].iteritems():
+                edges[edge] += weight
+
+        # vertices in the full network, with only edges for the slice
+        vertex_index = dict((name, i) for i, name in enumerate(graph.vs['name']))
+        timeslice = Graph(n=len(graph.vs), directed=True)
+        for attr in graph.vs.attribute_names():
+            timeslice.vs[attr] = graph.vs[attr]
+        if edges:
+            edges = sorted(((vertex_index[source], vertex_index[target]), label, weight)
+                           for ((source, target), label), weight in edges.iteritems()
+                           if source in vertex_index and target in vertex_index)
+            edge_src_target, edge_labels, edge_weights = zip(*edges)
+            timeslice.add_edges(edge_src_target)
+            timeslice.es['label'] = edge_labels
+            timeslice.es['weight'] = edge_weights
+        timeslice.delete_vertices(timeslice.vs.select(_degree=0))
+        return timeslice
+
+    @classmethod
+    def contributor_network_vertices(cls, journal_ids=None, person_ids=None):
+        '''Vertex attributes for journals and contributors in the
+        contributor network, as a dictionary keyed on network id.
+        Optionally restrict to a list of journal and person ids; by
+        default, includes all journals and all journal contributors.'''
+        journals = Journal.objects.all()
+        journal_schools = Journal.schools.through.objects.all()
+        people = Person.objects.journal_contributors()
+        person_schools = Person.schools.through.objects.all()
+        if journal_ids is not None:
+            journals = journals.filter(pk__in=journal_ids)
+            journal_schools = journal_schools.filter(journal__in=journal_ids)
+        if person_ids is not None:
+            people = Person.objects.filter(pk__in=person_ids)
+            person_schools = person_schools.filter(person__in=person_ids)
+
+        vertices = OrderedDict()
+        for journal_id, title in journals.values_list('id', 'title'):
+            vertices['journal:%s' % journal_id] = {
+                'label': title, 'type': cls.network_type, 'schools': []
+            }
+        for person_id, first_name, last_name in people.order_by() \
+                .values_list('id', 'first_name', 'last_name'):
+            vertices['person:%s' % person_id] = {
+                'label': ' '.join(n for n in [first_name, last_name] if n),
+                'type': Person.network_type, 'schools': None
+            }
+
+        # add school names to journals and people
         # - only a fairly small number of people are associated with
         # schools, so it should be most efficient to handle separately
-        start = time.time()
-        schooled_people = Person.objects.filter(schools__isnull=False) \
-                                .prefetch_related('schools')
-        for person in schooled_people:
-            try:
-                graph.vs.find(name=person.network_id)['schools'] = \
-                    [s.name for s in person.schools.all()]
-
-            except ValueError:
+        school_names = itertools.chain(
+            (('journal:%s' % j, s) for j, s in journal_schools
+                .order_by('school__name').values_list('journal_id', 'school__name')),
+            (('person:%s' % p, s) for p, s in person_schools
+                .order_by('school__name').values_list('person_id', 'school__name'))
+        )
+        for network_id, school in school_names:
+            if network_id not in vertices:
                 # it's possible we have people associated with schools
                 # who are not contributors to our journals, so this is
-                # not an error, but providea  warning.
+                # not an error, but provide a warning.
                 logger.warn('School-associated person %s not found in contributor network graph',
-                            person)
-        logger.debug('Added school associations for %d people in %.2f sec',
-                     schooled_people.count(), time.time() - start)
+                            network_id)
+                continue
+            if vertices[network_id]['schools'] is None:
+                vertices[network_id]['schools'] = []
+            vertices[network_id]['schools'].append(school)
+
+        return vertices
+
+    @classmethod
+    def build_contributor_network(cls, issue_edges=None):
+        '''Generate the network graph of authors, editors, translators,
+        and journals from the database, bypassing the cache.
+        Vertices are tracked by a dictionary of network id to
+        vertex index, and vertices and edges are added to the graph
+        in bulk.  Takes an optional set of edges as returned by
+        :meth:`contributor_network_edges`.
+        '''
+        full_start = time.time()
+        if issue_edges is None:
+            issue_edges = cls.contributor_network_edges()
+        vertices = cls.contributor_network_vertices()
 
         start = time.time()
-        # split edge information into source/target tuple and edge label
-        edge_src_target, edge_labels = zip(*edges.keys())
-        # add the edges to the graph
-        graph.add_edges(edge_src_target)
-        # set the edge labels
-        graph.es['label'] = edge_labels
-        # set edge weight based on number of occurrences
-        graph.es['weight'] = edges.values()
-
-        logger.debug('Added edges and edge sizes in %.2f sec',
+        # combine issue edges; edge key is converted from network ids
+        # to vertex indexes
+        vertex_index = dict((network_id, i) for i, network_id
+                            in enumerate(vertices.iterkeys()))
+        edges = OrderedDict()
+        for issue in issue_edges.itervalues():
+            for ((source, target), label), weight in issue.iteritems():
+                edge = ((vertex_index[source], vertex_index[target]), label)
+                edges[edge] = edges.get(edge, 0) + weight
+
+        graph = Graph(n=len(vertices), directed=True)
+        graph.vs['name'] = vertices.keys()
+        for attr in ['label', 'type', 'schools']:
+            graph.vs[attr] = [v[attr] for v in vertices.itervalues()]
+        if edges:
+            # split edge information into source/target tuple and edge label
+            edge_src_target, edge_labels = zip(*edges.keys())
+            # add the edges to the graph
+            graph.add_edges(edge_src_target)
+            # set the edge labels
+            graph.es['label'] = edge_labels
+            # set edge weight based on number of occurrences
+            graph.es['weight'] = edges.values()
+
+        logger.debug('Added nodes, edges and edge sizes in %.2f sec',
                      time.time() - start)
 
         logger.debug('Complete journal contributor graph (%d nodes, %d edges) generated in %.2f sec',
-                     len(graph.vs()), len(graph.es()), time.time() - full_start)
-
-        # store the generated graph in the cache for the next time
-        # for now, set cached graph to never time out
-        cache.set(cls.contributor_network_cache_key, graph, None)
+                     len(graph.vs), len(graph.es), time.time() - full_start)
         return graph
 
+    @classmethod
+    def update_contributor_network(cls, issue_ids=None, vertex_ids=None):
+        '''Update the cached contributor network in place, without
+        rebuilding it.  Edges contributed by any of the specified issue
+        ids are recalculated and the difference is applied to
+        the cached graph edge weights, adding or removing edges and
+        contributor vertices as needed.  Attributes for any vertices
+        specified by network id are refreshed from the database, and
+        journal vertices are added or removed.  Should only be called
+        once changes are committed (see :mod:`zurnatikl.apps.journals.signals`).
+        The updated graph is cached under a new network data version,
+        since any layouts or other data derived from the previous graph
+        are no longer valid; if the network is not currently cached,
+        only the version is updated.
+
+        Updates are serialized between processes with a lock in the
+        cache.  If another update is already in progress, the changes
+        can't be applied without one of the updates overwriting the
+        other, so the cached network is discarded instead and will be
+        regenerated the next time it is needed.'''
+        if not cache.add(cls.contributor_update_lock_key, True,
+                         cls.contributor_update_timeout):
+            logger.debug('Contributor network update already in progress; '
+                         'discarding cached network')
+            # flag the update in progress, in case it has already read
+            # the cached graph, then discard the current cached graph
+            cache.set(cls.contributor_update_stale_key, True,
+                      cls.contributor_update_timeout)
+            graph_cache.bump_network_version()
+            return
+        try:
+            cls._update_contributor_network(issue_ids, vertex_ids)
+        finally:
+            cache.delete(cls.contributor_update_lock_key)
+
+    @classmethod
+    def _update_contributor_network(cls, issue_ids=None, vertex_ids=None):
+        # apply changes to the cached network; see
+        # :meth:`update_contributor_network`
+        cached = graph_cache.get_many([cls.contributor_network_cache_key,
+                                       cls.contributor_edges_cache_key])
+        graph = cached.get(cls.contributor_network_cache_key)
+        if graph is None:
+            # nothing to update, but other network data may have changed
+            graph_cache.bump_network_version()
+            return
+        edges_info = cached.get(cls.contributor_edges_cache_key)
+        previous_edges = {}
+        if edges_info is not None and issue_ids:
+            previous_edges = cls.cached_contributor_edges(edges_info, issue_ids)
+        if edges_info is None or previous_edges is None:
+            # no way to calculate the difference; discard the cached
+            # graph so it will be regenerated the next time it is needed
+            graph_cache.bump_network_version()
+            return
+
+        start = time.time()
+        vertex_ids = set(vertex_ids or [])
+        # calculate the change in weight for all edges for these issues
+        delta = defaultdict(int)
+        edges_key, changed_edges = edges_info
+        if issue_ids:
+            updated_edges = cls.contributor_network_edges(issue_ids)
+            for issue_id in issue_ids:
+                for edge, weight in previous_edges[issue_id].iteritems():
+                    delta[edge] -= weight
+                changed_edges[issue_id] = updated_edges.get(issue_id, {})
+            for issue_id, edges in updated_edges.iteritems():
+                for edge, weight in edges.iteritems():
+                    delta[edge] += weight
+        edge_vertices = set()
+        for (source, target), label in delta.iterkeys():
+            edge_vertices.update([source, target])
+        vertex_ids |= edge_vertices
+
+        # refresh vertex attributes from the database, adding any
+        # journals or contributors that are new to the graph
+        vertex_index = dict((name, i) for i, name in enumerate(graph.vs['name']))
+        journal_ids = [v.split(':')[1] for v in vertex_ids if v.startswith('journal:')]
+        person_ids = [v.split(':')[1] for v in vertex_ids if v.startswith('person:')]
+        vertices = cls.contributor_network_vertices(journal_ids, person_ids)
+        for network_id, attrs in vertices.iteritems():
+            if network_id not in vertex_index:
+                if attrs['type'] == Person.network_type and \
+                   network_id not in edge_vertices:
+                    continue
+                vertex_index[network_id] = len(graph.vs)
+                graph.add_vertex(network_id)
+            graph.vs[vertex_index[network_id]].update_attributes(attrs)
+
+        # adjust weights of existing edges; add any new edges
+        new_edges = []
+        removed_edges = []
+        for ((source, target), label), weight in delta.iteritems():
+            if weight == 0:
+                continue
+            src, tgt = vertex_index[source], vertex_index[target]
+            for eid in graph.incident(src, mode='out'):
+                edge = graph.es[eid]
+                if edge.target == tgt and edge['label'] == label:
+                    edge['weight'] += weight
+                    if edge['weight'] <= 0:
+                        removed_edges.append(eid)
+                    break
+            else:
+                if weight > 0:
+                    new_edges.append(((src, tgt), label, weight))
+        if new_edges:
+            edge_src_target, edge_labels, edge_weights = zip(*new_edges)
+            first_eid = len(graph.es)
+            graph.add_edges(edge_src_target)
+            graph.es[first_eid:]['label'] = edge_labels
+            graph.es[first_eid:]['weight'] = edge_weights
+        graph.delete_edges(removed_edges)
+
+        # remove deleted journals and people who are no longer contributors
+        removed = [vertex_index[v] for v in vertex_ids
+                   if v in vertex_index and
+                   (v not in vertices or (v.startswith('person:') and
+                                          graph.degree(vertex_index[v]) == 0))]
+        graph.delete_vertices(removed)
+
+        version = graph_cache.bump_network_version()
+        graph_cache.set_many({
+            cls.contributor_network_cache_key: graph,
+            cls.contributor_edges_cache_key: (edges_key, changed_edges)
+        }, version=version)
+        if cache.get(cls.contributor_update_stale_key):
+            # another update started while this one was in progress and
+            # is missing from the updated graph; discard it
+            cache.delete(cls.contributor_update_stale_key)
+            graph_cache.bump_network_version()
+        logger.debug('Updated journal contributor graph (%d nodes, %d edges) in %.2f sec',
+                     len(graph.vs), len(graph.es), time.time() - start)
+
 
 class IssueManager(models.Manager):
     def get_by_natural_key(self, volume, issue, season, journal):
         j = Journal.objects.get(title=journal)
         return self.get(volume=volume, issue=issue, season=season, journal=j)
 
+    def network_data(self):
+        '''Network nodes and edges for all issues, equivalent to
+        :attr:`Issue.network_attributes` and :attr:`Issue.network_edges`
+        but generated with a fixed number of queries.  Returns a list
+        of tuples of network id and node attributes, and a list of edges.'''
+        nodes = []
+        edges = []
+        for issue in self.all().select_related('journal'):
+            nodes.append((issue.network_id, issue.network_attributes))
+            edges.append((issue.network_id, 'journal:%s' % issue.journal_id))
+            if issue.publication_address_id:
+                edges.append((issue.network_id,
+                              'location:%s' % issue.publication_address_id,
+                              {'label': 'publication address'}))
+            if issue.print_address_id:
+                edges.append((issue.network_id,
+                              'location:%s' % issue.print_address_id,
+                              {'label': 'print address'}))
+
+        related = [
+            (self.model.editors.through, 'person', 'editor'),
+            (self.model.contributing_editors.through, 'person',
+             'contributing editor'),
+            (self.model.mailing_addresses.through, 'location',
+             'mailing address'),
+        ]
+        for through, target, label in related:
+            edges.extend(('issue:%s' % issue_id, '%s:%s' % (target, target_id),
+                          {'label': label})
+                         for issue_id, target_id in through.objects
+                            .values_list('issue_id', '%s_id' % target))
+        return nodes, edges
+
 
 class Issue(models.Model):
     'Single issue in a :class:`Journal`'
@@ -503,6 +920,41 @@ class ItemManager(models.Manager):
     def get_by_natural_key(self, title):
         return self.get(title=title)
 
+    def network_data(self):
+        '''Network nodes and edges for all items, equivalent to
+        :attr:`Item.network_attributes` and :attr:`Item.network_edges`
+        but generated with a fixed number of queries.  Returns a list
+        of tuples of network id and node attributes, and a list of edges.'''
+        genres = defaultdict(list)
+        for item_id, genre in self.model.genre.through.objects \
+                .order_by('genre__name').values_list('item_id', 'genre__name'):
+            genres[item_id].append(genre)
+
+        nodes = []
+        edges = []
+        for item in self.all().select_related('issue', 'issue__journal'):
+            nodes.append((item.network_id,
+                          item.get_network_attributes(genres.get(item.id, []))))
+            edges.append((item.network_id, 'issue:%s' % item.issue_id))
+
+        related = [
+            (CreatorName.objects.all(), 'person', {'label': 'creator'}),
+            (self.model.translators.through.objects.all(), 'person',
+             {'label': 'translator'}),
+            (self.model.persons_mentioned.through.objects.all(), 'person',
+             {'label': 'mentioned'}),
+            (self.model.addresses.through.objects.all(), 'location', None),
+            # only placenames with a location can contribute a network edge
+            (PlaceName.objects.filter(location__isnull=False), 'location',
+             {'label': 'mentioned'}),
+        ]
+        for relations, target, attrs in related:
+            for item_id, target_id in relations.values_list('item_id',
+                                                            '%s_id' % target):
+                edge = ('item:%s' % item_id, '%s:%s' % (target, target_id))
+                edges.append(edge + (attrs, ) if attrs else edge)
+        return nodes, edges
+
 class Item(models.Model):
     'Item in a :class:`Issue`'
 
@@ -573,6 +1025,11 @@ class Item(models.Model):
     @property
     def network_attributes(self):
         #: data to be included as node attributes when generating a network
+        return self.get_network_attributes([g.name for g in self.genre.all()])
+
+    def get_network_attributes(self, genres):
+        # network attributes with genre names retrieved elsewhere,
+        # so they can be generated in bulk
         attrs = {
             'type': self.network_type,
             'label': self.title,
@@ -580,8 +1037,8 @@ class Item(models.Model):
             'no creator': self.no_creator,
             'issue': unicode(self.issue)
         }
-        if self.genre.exists():
-            attrs['genre'] = ', '.join([g.name for g in self.genre.all()])
+        if genres:
+            attrs['genre'] = ', '.join(genres)
         return attrs
 
     @property
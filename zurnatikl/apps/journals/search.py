@@ -0,0 +1,275 @@
+# inverted index for searching journal items by title and creator
+# name, so that keyword searches don't require a multi-table join
+# and scan for every word in the query.  The index is built with a
+# fixed number of flat queries and kept in process memory (see
+# :mod:`zurnatikl.indexes`); it is updated for individual items when
+# items or creator names change (see :mod:`zurnatikl.apps.journals.signals`).
+# The index also holds journal, genre and decade facet values for each
+# item, so that search results can be counted and narrowed without
+# querying the database.
+from bisect import bisect_left, insort
+from collections import defaultdict
+import hashlib
+import itertools
+import logging
+import math
+import time
+
+from django.core.cache import cache
+
+from zurnatikl.apps.people.models import Name, PenName, Person
+from zurnatikl.indexes import SharedIndex, tokenize
+
+
+logger = logging.getLogger(__name__)
+
+#: how long search results are cached, in seconds
+RESULTS_TIMEOUT = 60 * 60
+
+#: relative weight of matches on each field
+FIELD_WEIGHTS = {
+    'title': 1.0,
+    'name': 2.0,
+    'alternate_name': 1.5,
+    'pen_name': 1.5,
+}
+
+#: relative weight of a term that starts with a query word, compared
+#: to a term that matches it exactly
+PREFIX_WEIGHT = 0.5
+
+#: facets for narrowing search results; values are journal id,
+#: genre ids, and publication decade
+FACETS = ['journal', 'genre', 'decade']
+
+
+class SearchIndex(object):
+    '''Inverted index of journal items, with the weight of each term
+    for each item.  Terms are kept in sorted order so that query words
+    can match terms that start with them.'''
+
+    def __init__(self):
+        #: term to dictionary of item id to weight
+        self.postings = {}
+        #: sorted list of indexed terms
+        self.terms = []
+        #: item id to list of indexed terms, for updating items
+        self.item_terms = {}
+        #: item id to dictionary of facet name to list of values
+        self.item_facets = {}
+
+    def add_item(self, item_id, fields, facets=None):
+        '''Index an item, given a list of tuples of field name and text,
+        and optionally a dictionary of facet values (see :data:`FACETS`).
+        Replaces any existing entry for the item.'''
+        self.remove_item(item_id)
+        self.item_facets[item_id] = facets or {}
+        weights = defaultdict(float)
+        for field, text in fields:
+            for term in tokenize(text):
+                weights[term] += FIELD_WEIGHTS[field]
+        for term, weight in weights.iteritems():
+            if term not in self.postings:
+                self.postings[term] = {}
+                insort(self.terms, term)
+            self.postings[term][item_id] = weight
+        self.item_terms[item_id] = weights.keys()
+
+    def remove_item(self, item_id):
+        self.item_facets.pop(item_id, None)
+        for term in self.item_terms.pop(item_id, []):
+            postings = self.postings[term]
+            postings.pop(item_id, None)
+            if not postings:
+                del self.postings[term]
+                del self.terms[bisect_left(self.terms, term)]
+
+    def matching_terms(self, word):
+        # indexed terms that start with a query word
+        i = bisect_left(self.terms, word)
+        while i < len(self.terms) and self.terms[i].startswith(word):
+            yield self.terms[i]
+            i += 1
+
+    def search(self, query):
+        '''Search for items matching all the words in a query, ranked by
+        relevance.  Words match terms that start with them, with exact
+        matches, rare terms, and matches on creator names ranked higher.
+        Returns a list of tuples of item id and score, most relevant first.'''
+        words = tokenize(query)
+        if not words:
+            return []
+        total = float(len(self.item_terms)) or 1.0
+        scores = None
+        for word in set(words):
+            word_scores = defaultdict(float)
+            for term in self.matching_terms(word):
+                postings = self.postings[term]
+                idf = math.log(1 + total / len(postings))
+                factor = idf if term == word else idf * PREFIX_WEIGHT
+                for item_id, weight in postings.iteritems():
+                    word_scores[item_id] = max(word_scores[item_id],
+                                               weight * factor)
+            if scores is None:
+                scores = word_scores
+            else:
+                # items must match every word
+                scores = dict((item_id, score + word_scores[item_id])
+                              for item_id, score in scores.iteritems()
+                              if item_id in word_scores)
+            if not scores:
+                return []
+        return sorted(scores.iteritems(), key=lambda s: (-s[1], s[0]))
+
+
+def item_fields(item_ids=None):
+    '''Text to be indexed for journal items, as a dictionary of item id
+    to list of tuples of field name and text.  Includes item titles and
+    all names for item creators.  Uses a fixed number of queries;
+    optionally restrict to a list of item ids.'''
+    from .models import CreatorName, Item
+    items = Item.objects.all()
+    creators = CreatorName.objects.all()
+    if item_ids is not None:
+        items = items.filter(pk__in=item_ids)
+        creators = creators.filter(item__in=item_ids)
+
+    fields = dict((item_id, [('title', title)]) for item_id, title
+                  in items.order_by().values_list('id', 'title'))
+    item_creators = defaultdict(list)
+    for item_id, person_id in creators.order_by() \
+            .values_list('item_id', 'person_id'):
+        if item_id in fields:
+            item_creators[person_id].append(item_id)
+
+    people = Person.objects.all()
+    names = Name.objects.all()
+    pen_names = PenName.objects.all()
+    if item_ids is not None:
+        person_ids = item_creators.keys()
+        people = people.filter(pk__in=person_ids)
+        names = names.filter(person__in=person_ids)
+        pen_names = pen_names.filter(person__in=person_ids)
+
+    all_names = itertools.chain(
+        (('name', person_id, u'%s %s' % (first_name, last_name))
+         for person_id, first_name, last_name in people.order_by()
+            .values_list('id', 'first_name', 'last_name')),
+        (('alternate_name', person_id, u'%s %s' % (first_name, last_name))
+         for person_id, first_name, last_name in names.order_by()
+            .values_list('person_id', 'first_name', 'last_name')),
+        (('pen_name', person_id, name) for person_id, name
+         in pen_names.order_by().values_list('person_id', 'name'))
+    )
+    for field, person_id, name in all_names:
+        for item_id in item_creators.get(person_id, []):
+            fields[item_id].append((field, name))
+    return fields
+
+
+def item_facets(item_ids=None):
+    '''Facet values for journal items (see :data:`FACETS`), as a
+    dictionary of item id to dictionary of facet name to list of values.
+    Uses a fixed number of queries; optionally restrict to a list of
+    item ids.'''
+    from .models import Item, publication_year
+    items = Item.objects.all()
+    genres = Item.genre.through.objects.all()
+    if item_ids is not None:
+        items = items.filter(pk__in=item_ids)
+        genres = genres.filter(item__in=item_ids)
+
+    facets = {}
+    for item_id, journal_id, date in items.order_by() \
+            .values_list('id', 'issue__journal_id', 'issue__publication_date'):
+        year = publication_year(date)
+        facets[item_id] = {
+            'journal': [journal_id],
+            'genre': [],
+            'decade': [year - year % 10] if year else []
+        }
+    for item_id, genre_id in genres.values_list('item_id', 'genre_id'):
+        if item_id in facets:
+            facets[item_id]['genre'].append(genre_id)
+    return facets
+
+
+def build_index():
+    '''Build the search index for all journal items from the database.'''
+    start = time.time()
+    index = SearchIndex()
+    facets = item_facets()
+    for item_id, fields in item_fields().iteritems():
+        index.add_item(item_id, fields, facets.get(item_id))
+    logger.debug('Built item search index (%d items, %d terms) in %.2f sec',
+                 len(index.item_terms), len(index.terms), time.time() - start)
+    return index
+
+
+#: search index for the current process
+shared_index = SharedIndex('journal-item-search-index', build_index)
+
+
+def update_items(item_ids):
+    '''Update the search index for the specified items, adding,
+    re-indexing, or removing them as needed.  Cached search results
+    are invalidated, since they are cached for the index version.'''
+    item_ids = [pk for pk in item_ids if pk is not None]
+    if not item_ids:
+        return
+
+    def update(index):
+        fields = item_fields(item_ids)
+        facets = item_facets(item_ids)
+        for item_id in item_ids:
+            if item_id in fields:
+                index.add_item(item_id, fields[item_id], facets.get(item_id))
+            else:
+                # item has been deleted
+                index.remove_item(item_id)
+
+    shared_index.changed(update)
+
+
+def search_results(query):
+    '''Search journal items by title and creator name.  Returns a list of
+    tuples of item id and facet values, most relevant first.  Results are
+    cached for the current version of the search index, so that paging
+    through or narrowing results doesn't repeat the search.'''
+    words = ' '.join(sorted(set(tokenize(query))))
+    cache_key = 'journal-item-search-results-%s-%s' % \
+        (shared_index.current_version(), hashlib.md5(words).hexdigest())
+    results = cache.get(cache_key)
+    if results is None:
+        with shared_index.use() as index:
+            results = [(item_id, index.item_facets.get(item_id, {}))
+                       for item_id, score in index.search(query)]
+        cache.set(cache_key, results, RESULTS_TIMEOUT)
+    return results
+
+
+def search(query):
+    '''Search journal items by title and creator name.  Returns a list of
+    item ids, most relevant first.'''
+    return [item_id for item_id, facets in search_results(query)]
+
+
+def filter_results(results, filters):
+    '''Narrow search results from :meth:`search_results` to items
+    with all of the specified facet values, given as a dictionary of
+    facet name to value.'''
+    return [(item_id, facets) for item_id, facets in results
+            if all(value in facets.get(facet, [])
+                   for facet, value in filters.iteritems())]
+
+
+def facet_counts(results):
+    '''Number of items in search results from :meth:`search_results`
+    with each value of each facet, as a dictionary of facet name to
+    dictionary of value to count.'''
+    counts = dict((facet, defaultdict(int)) for facet in FACETS)
+    for item_id, facets in results:
+        for facet, values in facets.iteritems():
+            for value in values:
+                counts[facet][value] += 1
+    return counts
@@ -0,0 +1,238 @@
+# signal handlers to keep the cached journal contributor network
+# and item search index in sync with the database, without requiring
+# a full rebuild
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, \
+    post_delete, m2m_changed
+from django.dispatch import receiver
+
+from zurnatikl.apps.people.models import Name, PenName, Person, School
+from . import search
+from .models import Journal, Issue, Item, CreatorName
+
+
+# Contributor network edges are calculated per issue, so any change to
+# editors, creators, or translators is handled by recalculating the edges
+# for the affected issues.  Where the affected issues can't be determined
+# after a change (e.g. a record has been deleted or moved), they are
+# collected beforehand and stored on the instance.  The cached network
+# is only updated once the change is committed, so that a rolled back
+# change doesn't leave it out of sync with the database, and other
+# processes don't cache network data generated from uncommitted data.
+
+def update_contributor_network(issue_ids=None, vertex_ids=None):
+    # update the cached network when the current transaction commits
+    transaction.on_commit(lambda: Journal.update_contributor_network(
+        issue_ids, vertex_ids=vertex_ids))
+
+
+def contributor_issues(instance):
+    '''Ids of the issues a journal, issue, item, creator, or person
+    currently contributes to the contributor network.'''
+    if isinstance(instance, Journal):
+        return set(instance.issue_set.values_list('id', flat=True))
+    if isinstance(instance, Issue):
+        return set([instance.pk])
+    if isinstance(instance, Item):
+        return set(Item.objects.filter(pk=instance.pk)
+                       .values_list('issue_id', flat=True))
+    if isinstance(instance, CreatorName):
+        return set(CreatorName.objects.filter(pk=instance.pk)
+                              .values_list('item__issue_id', flat=True))
+    if isinstance(instance, Person):
+        return set(Issue.objects.filter(editors=instance)
+                        .values_list('id', flat=True)) | \
+            set(Item.objects.filter(creators=instance)
+                    .values_list('issue_id', flat=True)) | \
+            set(Item.objects.filter(translators=instance)
+                    .values_list('issue_id', flat=True))
+    return set()
+
+
+@receiver(pre_save, sender=Item)
+@receiver(pre_save, sender=CreatorName)
+@receiver(pre_delete, sender=Journal)
+@receiver(pre_delete, sender=Issue)
+@receiver(pre_delete, sender=Item)
+@receiver(pre_delete, sender=CreatorName)
+@receiver(pre_delete, sender=Person)
+def collect_contributor_issues(sender, instance, **kwargs):
+    # store issues affected by the record before it is changed or removed
+    if instance.pk is not None:
+        instance._contributor_network_issues = contributor_issues(instance)
+
+
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=CreatorName)
+def update_saved_contributor_issues(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created and sender is not CreatorName:
+        # new issues and items don't have any contributors yet, but
+        # the network data version still needs to be updated
+        update_contributor_network()
+        return
+    issue_ids = getattr(instance, '_contributor_network_issues', set()) | \
+        contributor_issues(instance)
+    update_contributor_network(issue_ids)
+
+
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=CreatorName)
+@receiver(post_delete, sender=Person)
+def update_deleted_contributor_issues(sender, instance, **kwargs):
+    update_contributor_network(
+        getattr(instance, '_contributor_network_issues', None))
+
+
+@receiver(post_save, sender=Journal)
+@receiver(post_save, sender=Person)
+def update_contributor_vertex(sender, instance, **kwargs):
+    # add new journals and update labels
+    if not kwargs.get('raw'):
+        update_contributor_network(vertex_ids=[instance.network_id])
+
+
+@receiver(post_delete, sender=Journal)
+def remove_journal_vertex(sender, instance, **kwargs):
+    update_contributor_network(
+        getattr(instance, '_contributor_network_issues', None),
+        vertex_ids=[instance.network_id])
+
+
+def school_vertices(school):
+    # network ids of the journals and people associated with a school
+    return [j.network_id for j in school.journal_set.all()] + \
+        [p.network_id for p in school.person_set.all()]
+
+
+@receiver(pre_delete, sender=School)
+def collect_school_vertices(sender, instance, **kwargs):
+    # store the journals and people associated with a school before
+    # the associations are removed
+    instance._school_vertices = school_vertices(instance)
+
+
+@receiver(post_save, sender=School)
+@receiver(post_delete, sender=School)
+def update_school_names(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        vertex_ids = getattr(instance, '_school_vertices', None)
+        if vertex_ids is None:
+            vertex_ids = school_vertices(instance)
+        update_contributor_network(vertex_ids=vertex_ids)
+
+
+def m2m_issues(instance, model, pk_set, action, reverse):
+    # issues affected by a change to editors or translators
+    if reverse:
+        # instance is a person; pk_set is issues or items
+        if action == 'pre_clear':
+            return contributor_issues(instance)
+        if model is Item:
+            return set(Item.objects.filter(pk__in=pk_set)
+                           .values_list('issue_id', flat=True))
+        return set(pk_set or [])
+    return contributor_issues(instance)
+
+
+@receiver(m2m_changed, sender=Issue.editors.through)
+@receiver(m2m_changed, sender=Item.translators.through)
+def update_contributor_m2m(sender, instance, action, reverse, model, pk_set,
+                           **kwargs):
+    if action.startswith('pre_'):
+        instance._contributor_network_issues = \
+            m2m_issues(instance, model, pk_set, action, reverse)
+    else:
+        issue_ids = getattr(instance, '_contributor_network_issues', set())
+        if action != 'post_clear':
+            issue_ids |= m2m_issues(instance, model, pk_set, action, reverse)
+        update_contributor_network(issue_ids)
+
+
+@receiver(m2m_changed, sender=Journal.schools.through)
+@receiver(m2m_changed, sender=Person.schools.through)
+def update_contributor_schools(sender, instance, action, reverse, model,
+                               pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # instance is a school; collect the journals or people before
+        # they are removed
+        instance._contributor_network_vertices = \
+            [obj.network_id for obj in model.objects.filter(schools=instance)]
+    elif action.startswith('post_'):
+        if not reverse:
+            vertex_ids = [instance.network_id]
+        elif action == 'post_clear':
+            vertex_ids = getattr(instance, '_contributor_network_vertices', [])
+        else:
+            vertex_ids = [obj.network_id
+                          for obj in model.objects.filter(pk__in=pk_set)]
+        update_contributor_network(vertex_ids=vertex_ids)
+
+
+# Keep the cached item search index up to date; items are re-indexed
+# when their title, genres, issue, or any of their creators' names change.
+
+def update_search_items(item_ids):
+    # update the search index when the current transaction commits, so
+    # other processes never load uncommitted data into the index
+    item_ids = list(item_ids)
+    transaction.on_commit(lambda: search.update_items(item_ids))
+
+
+@receiver(pre_save, sender=CreatorName)
+def collect_search_item(sender, instance, **kwargs):
+    # store the item a creator name was attached to before it changes
+    if instance.pk is not None:
+        instance._search_items = set(CreatorName.objects.filter(pk=instance.pk)
+                                                .values_list('item_id', flat=True))
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def update_search_item(sender, instance, **kwargs):
+    update_search_items([instance.pk])
+
+
+@receiver(post_save, sender=CreatorName)
+@receiver(post_delete, sender=CreatorName)
+def update_search_creator(sender, instance, **kwargs):
+    update_search_items(getattr(instance, '_search_items', set()) |
+                        set([instance.item_id]))
+
+
+@receiver(post_save, sender=Issue)
+def update_search_issue(sender, instance, **kwargs):
+    # issue journal and publication date are used for search facets
+    update_search_items(list(instance.item_set.values_list('id', flat=True)))
+
+
+@receiver(m2m_changed, sender=Item.genre.through)
+def update_search_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # instance is an item
+        if action.startswith('post_'):
+            update_search_items([instance.pk])
+    elif action == 'pre_clear':
+        # instance is a genre; collect items before they are removed
+        instance._search_items = set(instance.item_set.values_list('id', flat=True))
+    elif action == 'post_clear':
+        update_search_items(getattr(instance, '_search_items', set()))
+    elif action.startswith('post_'):
+        update_search_items(pk_set)
+
+
+@receiver(post_save, sender=Person)
+def update_search_person(sender, instance, **kwargs):
+    update_search_items(list(instance.items_created.values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=Name)
+@receiver(post_delete, sender=Name)
+@receiver(post_save, sender=PenName)
+@receiver(post_delete, sender=PenName)
+def update_search_person_name(sender, instance, **kwargs):
+    update_search_items(list(Item.objects.filter(creators=instance.person_id)
+                                         .values_list('id', flat=True)))
@@ -1,14 +1,25 @@
 from collections import defaultdict
+import hashlib
+import json
 from django.db.models import Q, Count
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from mock import patch
 
 from zurnatikl.apps.geo.models import Location
+from zurnatikl.apps.network import graph_cache, layouts, metrics
 from zurnatikl.apps.people.models import School, Person
 
-from .models import Journal, Issue, Item, PlaceName
+from . import search
+from .models import Journal, Issue, Item, PlaceName, CreatorName, Genre
 from .templatetags.journal_extras import readable_list, all_except
-from .views import JournalIssuesCSV, JournalItemsCSV
+from .views import ContributorNetworkJSON, JournalIssuesCSV, \
+    JournalItemsCSV, SearchView, contributor_layout_cache_key, \
+    contributor_network_layout
 
 
 class JournalTestCase(TestCase):
@@ -178,6 +189,141 @@ class JournalTestCase(TestCase):
                          'expected %d co-author edges, found %d' %
                          (co_authors, graph_co_auth_count))
 
+    def test_build_contributor_network(self):
+        # graph should be built with a fixed number of queries,
+        # regardless of the number of journals, issues, and people
+        with self.assertNumQueries(9):
+            graph = Journal.build_contributor_network()
+        self.assert_(graph.is_directed())
+        # vertex names should be unique
+        self.assertEqual(len(graph.vs), len(set(graph.vs['name'])))
+        # all edges should have a label and a weight
+        for edge in graph.es:
+            self.assert_(edge['label'])
+            self.assert_(edge['weight'] >= 1)
+
+    # test cases run in a transaction that is never committed; apply
+    # changes to the cached network immediately
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_contributor_network_updates(self):
+        cache.clear()
+        Journal.contributor_network()
+
+        def graph_data(graph):
+            # vertex labels and edges by name, for comparison
+            vertices = dict(zip(graph.vs['name'], graph.vs['label']))
+            edges = sorted((graph.vs[e.source]['name'], graph.vs[e.target]['name'],
+                            e['label'], e['weight']) for e in graph.es)
+            return vertices, edges
+
+        def assert_cache_current():
+            self.assertEqual(graph_data(Journal.build_contributor_network()),
+                             graph_data(Journal.contributor_network()))
+
+        # add and remove an editor
+        issue = Issue.objects.filter(editors__isnull=False).first()
+        person = Person.objects.exclude(issues_edited=issue).first()
+        issue.editors.add(person)
+        assert_cache_current()
+        issue.editors.remove(person)
+        assert_cache_current()
+
+        # add a new contributor as creator
+        new_person = Person.objects.create(first_name='Jane', last_name='Doe')
+        item = Item.objects.filter(creators__isnull=False).first()
+        CreatorName.objects.create(item=item, person=new_person)
+        assert_cache_current()
+        # rename
+        new_person.first_name = 'Janet'
+        new_person.save()
+        assert_cache_current()
+
+        # translator
+        item.translators.add(new_person)
+        assert_cache_current()
+        item.translators.clear()
+        assert_cache_current()
+
+        # school associations
+        school = School.objects.first()
+        new_person.schools.add(school)
+        assert_cache_current()
+
+        # delete content
+        new_person.delete()
+        assert_cache_current()
+        item.delete()
+        assert_cache_current()
+        issue.delete()
+        assert_cache_current()
+
+
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_contributor_network_overlapping_updates(self):
+        cache.clear()
+        Journal.contributor_network()
+        issue = Issue.objects.filter(editors__isnull=False).first()
+        person = Person.objects.exclude(issues_edited=issue).first()
+        issue.editors.add(person)
+        # only the edges for the changed issue are stored with the graph
+        edges_key, changed = graph_cache.get(Journal.contributor_edges_cache_key)
+        self.assertEqual([issue.pk], changed.keys())
+        self.assert_(any(person.network_id in edge
+                         for edge, label in changed[issue.pk]))
+        self.assertEqual(changed[issue.pk],
+                         Journal.cached_contributor_edges()[issue.pk])
+
+        # an update that overlaps with one in progress discards the graph
+        cache.add(Journal.contributor_update_lock_key, True)
+        issue.editors.remove(person)
+        self.assertEqual(None,
+                         graph_cache.get(Journal.contributor_network_cache_key))
+        self.assert_(cache.get(Journal.contributor_update_stale_key))
+
+        # the update in progress discards its result when it finishes
+        cache.delete(Journal.contributor_update_lock_key)
+        Journal.contributor_network()
+        Journal.update_contributor_network(vertex_ids=[person.network_id])
+        self.assertEqual(None,
+                         graph_cache.get(Journal.contributor_network_cache_key))
+        self.assertEqual(None, cache.get(Journal.contributor_update_stale_key))
+        self.assertEqual(None, cache.get(Journal.contributor_update_lock_key))
+
+
+class ContributorNetworkTransactionTestCase(TransactionTestCase):
+    fixtures = ['test_network.json']
+    # restore data loaded by migrations (e.g. countries) after each test
+    serialized_rollback = True
+
+    def test_rolled_back_update(self):
+        cache.clear()
+        person = Person.objects.create(first_name='Jane', last_name='Doe')
+        graph = Journal.contributor_network()
+        edges = sorted((graph.vs[e.source]['name'], graph.vs[e.target]['name'],
+                        e['label'], e['weight']) for e in graph.es)
+        issue = Issue.objects.first()
+
+        class RollBack(Exception):
+            pass
+
+        # changes that are rolled back don't change the cached network
+        try:
+            with transaction.atomic():
+                issue.editors.add(person)
+                raise RollBack
+        except RollBack:
+            pass
+        graph = Journal.contributor_network()
+        self.assertNotIn(person.network_id, graph.vs['name'])
+        self.assertEqual(edges,
+            sorted((graph.vs[e.source]['name'], graph.vs[e.target]['name'],
+                    e['label'], e['weight']) for e in graph.es))
+
+        # committed changes are applied
+        issue.editors.add(person)
+        self.assertIn(person.network_id,
+                      Journal.contributor_network().vs['name'])
+
 
 class IssueTestCase(TestCase):
     fixtures = ['test_network.json']
@@ -323,9 +469,193 @@ class ItemTestCase(TestCase):
                 'issue edge to placename should be labeled')
 
 
+# graph views calculate layouts on request in tests, instead of
+# queueing them for the layout worker
+@override_settings(NETWORK_LAYOUT_QUEUE=None)
 class JournalViewsTestCase(TestCase):
     fixtures = ['test_network.json']
 
+    @override_settings(NETWORK_DATA_DIR=None)
+    def test_contributor_network_layout(self):
+        cache.clear()
+        graph = Journal.contributor_network()
+        layout_key = '%s-layout' % reverse('journals:contributor-network-json')
+        # last layout for different vertices is not used
+        cache.set(layouts.last_layout_key(layout_key),
+                  {'names': ['person:0'], 'layout': [[0, 0]]})
+        self.assertEqual(None, contributor_network_layout())
+        self.assertEqual(None, graph_cache.get(contributor_layout_cache_key))
+
+        # layout for the current version is used and cached
+        coords = [[i, i] for i in range(graph.vcount())]
+        graph_cache.set(layout_key, coords)
+        layout = contributor_network_layout()
+        self.assertEqual({'names': graph.vs['name'], 'layout': coords}, layout)
+        self.assertEqual(layout, graph_cache.get(contributor_layout_cache_key))
+
+        # last layout for the same vertices is used for a new version,
+        # but not cached as current
+        graph_cache.bump_network_version(
+            carry_over=[Journal.contributor_network_cache_key])
+        cache.set(layouts.last_layout_key(layout_key), layout)
+        self.assertEqual(layout, contributor_network_layout())
+        self.assertEqual(None, graph_cache.get(contributor_layout_cache_key))
+
+    def test_contributor_network_filters(self):
+        cache.clear()
+        url = reverse('journals:contributor-network-json')
+        full = json.loads(self.client.get(url).content)
+
+        # filter by edge label
+        data = json.loads(self.client.get(url, {'edge_label': 'editor'}).content)
+        self.assert_(data['edges'])
+        self.assert_(len(data['edges']) < len(full['edges']))
+        self.assert_(all(e['label'] == 'editor' for e in data['edges']))
+
+        # minimum weight
+        data = json.loads(self.client.get(url, {'min_weight': 2}).content)
+        self.assert_(all(e['weight'] >= 2 for e in data['edges']))
+
+        # node type
+        data = json.loads(self.client.get(url, {'type': 'Person'}).content)
+        self.assert_(all(n['type'] == 'Person' for n in data['nodes']))
+
+        # journal subset: one journal and its contributors
+        intrepid = Journal.objects.get(title='Intrepid')
+        data = json.loads(self.client.get(url, {'journal': intrepid.slug}).content)
+        journals = [n for n in data['nodes'] if n['type'] == 'Journal']
+        self.assertEqual([intrepid.title], [n['label'] for n in journals])
+
+        # filtered graphs are cached for each normalized set of filters
+        self.assert_(graph_cache.get('contributor-network-filtered-%s' %
+                                     hashlib.md5('edge_label=editor').hexdigest()))
+        with self.assertNumQueries(0):
+            self.client.get(url, {'edge_label': ['editor', 'editor', '']})
+        # unknown values are ignored
+        with self.assertNumQueries(0):
+            self.client.get(url, {'edge_label': ['editor', 'bogus']})
+
+        # requests for only unknown values are not found
+        for params in [{'edge_label': 'bogus'}, {'type': 'School'},
+                       {'journal': 'no-such-journal'},
+                       {'school': u'No Such School \u2603'}]:
+            self.assertEqual(404, self.client.get(url, params).status_code)
+        # minimum weights above the largest weight are all the same
+        self.assertEqual(json.loads(self.client.get(url, {'min_weight': 1000}).content),
+                         json.loads(self.client.get(url, {'min_weight': 2000}).content))
+
+        # export also supports filters
+        response = self.client.get(
+            reverse('journals:contributor-network-export', kwargs={'fmt': 'graphml'}),
+            {'edge_label': 'editor'})
+        self.assertContains(response, 'editor')
+        self.assertNotContains(response, 'co-author')
+
+    def test_contributor_network_timeslice(self):
+        cache.clear()
+        graph = Journal.contributor_network()
+        years = Journal.contributor_network_years()
+        self.assertEqual(sorted(years.keys()), years.keys())
+        # all dated issues together make up the full network
+        issue_years = Journal.contributor_network_issue_years()
+        self.assert_(all(issue_years.values()))
+        timeslice = Journal.contributor_network_timeslice()
+        self.assertEqual(sum(graph.es['weight']), sum(timeslice.es['weight']))
+
+        # only edges from issues published in the range are included
+        first_year = min(years)
+        later = Journal.contributor_network_timeslice(start=first_year + 1)
+        self.assertEqual(sum(graph.es['weight']) -
+                         sum(years[first_year].itervalues()),
+                         sum(later.es['weight']))
+        self.assert_(all(later.degree()))
+        self.assertEqual(0, len(Journal.contributor_network_timeslice(
+            end=first_year - 1).vs))
+
+        # year range via request parameters; cached with the filters
+        url = reverse('journals:contributor-network-json')
+        data = json.loads(self.client.get(url, {'from': first_year + 1}).content)
+        self.assertEqual(len(later.vs), len(data['nodes']))
+        self.assert_(graph_cache.get('contributor-network-filtered-%s' %
+            hashlib.md5('from=%d' % (first_year + 1)).hexdigest()))
+        # invalid years are ignored
+        response = self.client.get(url, {'from': 'bogus'})
+        self.assertEqual(len(graph.vs), len(json.loads(response.content)['nodes']))
+
+        # years outside the range of publication years are clamped, so
+        # they share a cache key
+        last_year = max(years)
+        view = ContributorNetworkJSON()
+        view.request = RequestFactory().get(url, {'from': 1, 'to': 99999})
+        self.assertEqual({'from': [first_year - 1], 'to': [last_year + 1]},
+                         dict(view.graph_filters()))
+        view = ContributorNetworkJSON()
+        view.request = RequestFactory().get(url, {'from': first_year + 1})
+        self.assertEqual({'from': [first_year + 1]}, dict(view.graph_filters()))
+
+    def test_contributor_network_metrics(self):
+        cache.clear()
+        url = reverse('journals:contributor-network-json')
+        data = json.loads(self.client.get(url).content)
+        for metric in metrics.METRICS:
+            self.assert_(all(metric in n for n in data['nodes']))
+        # filtered graphs have metrics for the full network
+        filtered = json.loads(self.client.get(url, {'type': 'Person'}).content)
+        full_pagerank = dict((n['name'], n['pagerank']) for n in data['nodes'])
+        for node in filtered['nodes']:
+            self.assertEqual(full_pagerank[node['name']], node['pagerank'])
+        # graphml export includes metrics
+        response = self.client.get(
+            reverse('journals:contributor-network-export', kwargs={'fmt': 'graphml'}))
+        self.assertContains(response, 'attr.name="betweenness"')
+
+        # served without metrics while they are being calculated,
+        # and not cached
+        cache.clear()
+        with patch('zurnatikl.apps.journals.views.contributor_network_metrics',
+                   return_value=None):
+            data = json.loads(self.client.get(url).content)
+            self.assert_(not any('pagerank' in n for n in data['nodes']))
+            self.client.get(url, {'type': 'Person'})
+        data = json.loads(self.client.get(url).content)
+        self.assert_(all('pagerank' in n for n in data['nodes']))
+        filtered = json.loads(self.client.get(url, {'type': 'Person'}).content)
+        self.assert_(all('pagerank' in n for n in filtered['nodes']))
+
+    def test_contributor_communities(self):
+        cache.clear()
+        graph = Journal.contributor_network()
+        full = json.loads(self.client.get(
+            reverse('journals:contributor-network-json')).content)
+        community_count = full['community_detection']['communities']
+
+        # coarse graph has one node per community
+        response = self.client.get(reverse('journals:contributor-communities-json'))
+        data = json.loads(response.content)
+        self.assertEqual(community_count, len(data['nodes']))
+        self.assertEqual(len(graph.vs), sum(n['size'] for n in data['nodes']))
+        self.assert_(all(n['type'] == 'Community' for n in data['nodes']))
+
+        # drill down into each community
+        members = []
+        for community in range(community_count):
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse(
+                    'journals:contributor-community-json',
+                    kwargs={'community': community}))
+            data = json.loads(response.content)
+            members.extend(n['name'] for n in data['nodes'])
+            # members are all in the same community in the full network
+            self.assertEqual(
+                set([community]),
+                set(n['community'] for n in full['nodes'] if n['name'] in
+                    set(node['name'] for node in data['nodes'])))
+        self.assertEqual(sorted(graph.vs['name']), sorted(members))
+
+        response = self.client.get(reverse('journals:contributor-community-json',
+                                           kwargs={'community': community_count}))
+        self.assertEqual(404, response.status_code)
+
     def test_list_journals(self):
         response = self.client.get(reverse('journals:list'))
         journals = Journal.objects.all()
@@ -438,6 +768,7 @@ class JournalViewsTestCase(TestCase):
         self.assertEqual(404, response.status_code)
 
     def test_search(self):
+        cache.clear()
         search_url = reverse('journals:search')
 
         # no search term
@@ -468,6 +799,163 @@ class JournalViewsTestCase(TestCase):
                         'id': item.issue.id}),
             msg_prefix='search results should link to issue the item belongs to')
 
+        # search index is cached; searching doesn't query item creators
+        with self.assertNumQueries(0):
+            search.search('maple bridge zhang')
+        # partial words match
+        self.assertEqual([item.pk], search.search('mapl brid zha'))
+
+    def test_search_pagination(self):
+        cache.clear()
+        search_url = reverse('journals:search')
+        issue = Issue.objects.first()
+        howls = [Item.objects.create(issue=issue, title='Howl %d' % i,
+                                     start_page=i, end_page=i)
+                 for i in range(5)]
+        item_ids = search.search('howl')
+        self.assertEqual(set(item.pk for item in howls), set(item_ids))
+
+        with patch.object(SearchView, 'paginate_by', 2):
+            response = self.client.get(search_url, {'keyword': 'howl'})
+            self.assertContains(response, 'Found 5 items')
+            self.assertEqual(item_ids[:2],
+                             [item.pk for item in response.context['items']])
+            self.assertEqual(None, response.context['previous_url'])
+            # pages follow on from the last item on the previous page
+            response = self.client.get(search_url + response.context['next_url'])
+            self.assertEqual(item_ids[2:4],
+                             [item.pk for item in response.context['items']])
+            self.assertEqual(3, response.context['page_start'])
+            previous_url = response.context['previous_url']
+            response = self.client.get(search_url + response.context['next_url'])
+            self.assertEqual(item_ids[4:],
+                             [item.pk for item in response.context['items']])
+            self.assertEqual(None, response.context['next_url'])
+            response = self.client.get(search_url + previous_url)
+            self.assertEqual(item_ids[:2],
+                             [item.pk for item in response.context['items']])
+            # a link after the last item shows the last page
+            response = self.client.get(search_url,
+                {'keyword': 'howl', 'after': item_ids[-1]})
+            self.assertEqual(item_ids[4:],
+                             [item.pk for item in response.context['items']])
+            self.assertEqual(5, response.context['page_start'])
+            # a stale link for an item no longer in the results
+            # shows the first page
+            response = self.client.get(search_url,
+                {'keyword': 'howl', 'after': 0})
+            self.assertEqual(item_ids[:2],
+                             [item.pk for item in response.context['items']])
+
+        # items on a page are loaded in a fixed number of queries
+        query_counts = []
+        for page_size in [1, 5]:
+            with patch.object(SearchView, 'paginate_by', page_size):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(search_url, {'keyword': 'howl'})
+                query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_search_many_results(self):
+        # more results than sqlite allows as query parameters
+        issue = Issue.objects.first()
+        Item.objects.bulk_create([
+            Item(issue=issue, title='Howl %d' % i, start_page=i, end_page=i)
+            for i in range(1200)])
+        # bulk create doesn't send signals; rebuild the search index
+        cache.clear()
+        response = self.client.get(reverse('journals:search'),
+                                   {'keyword': 'howl'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1200, response.context['total'])
+        self.assertEqual(SearchView.paginate_by,
+                         len(response.context['items']))
+
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_search_facets(self):
+        cache.clear()
+        search_url = reverse('journals:search')
+        issue1959, issue1963 = Issue.objects.get(pk=1), Issue.objects.get(pk=2)
+        howls = [Item.objects.create(issue=issue, title='Howl %d' % i,
+                                     start_page=i, end_page=i)
+                 for i, issue in enumerate([issue1959, issue1959, issue1963])]
+        poem = Genre.objects.get(name='Poem')
+        howls[0].genre.add(poem)
+
+        response = self.client.get(search_url, {'keyword': 'howl'})
+        facets = dict((facet['label'], facet['values'])
+                      for facet in response.context['facets'])
+        self.assertEqual([(issue1959.journal.title, 2),
+                          (issue1963.journal.title, 1)],
+                         [(v['label'], v['count']) for v in facets['Journal']])
+        self.assertEqual([(poem.name, 1)],
+                         [(v['label'], v['count']) for v in facets['Genre']])
+        self.assertEqual([('1950s', 2), ('1960s', 1)],
+                         [(v['label'], v['count']) for v in facets['Decade']])
+        self.assertContains(response, '1950s')
+
+        # narrowing results uses the cached search results
+        with patch.object(search.SearchIndex, 'search') as mock_search:
+            response = self.client.get(search_url, {'keyword': 'howl',
+                                                    'decade': 1960})
+            self.assertFalse(mock_search.called)
+        self.assertEqual([howls[2].pk],
+                         [item.pk for item in response.context['items']])
+        self.assertContains(response, 'Found 1 item ')
+        facets = response.context['facets']
+        self.assertEqual([True], [v['selected'] for v in facets[2]['values']])
+        response = self.client.get(search_url + facets[2]['clear_url'])
+        self.assertEqual(3, response.context['total'])
+        response = self.client.get(search_url, {'keyword': 'howl',
+            'decade': 1950, 'genre': poem.pk})
+        self.assertEqual([howls[0].pk],
+                         [item.pk for item in response.context['items']])
+
+        # facets are updated when items change
+        howls[0].genre.clear()
+        response = self.client.get(search_url, {'keyword': 'howl',
+                                                'genre': poem.pk})
+        self.assertEqual(0, response.context['total'])
+
+    def test_search_index(self):
+        index = search.SearchIndex()
+        index.add_item(1, [('title', u'Howl'), ('name', u'Allen Ginsberg')])
+        index.add_item(2, [('title', u'Ginsberg at the Gallery'),
+                           ('name', u'Jos\xe9 Garcia')])
+        index.add_item(3, [('title', u'Howling Wind'), ('pen_name', u'Ginsy')])
+        # name matches rank higher than title matches
+        self.assertEqual([1, 2], [i for i, s in index.search('ginsberg')])
+        # exact matches rank higher than prefix matches
+        self.assertEqual([1, 3], [i for i, s in index.search('howl')])
+        # all words must match; accents are ignored
+        self.assertEqual([2], [i for i, s in index.search('jose ginsberg')])
+        self.assertEqual([], index.search('howl garcia'))
+        # items can be updated and removed
+        index.add_item(1, [('title', u'Kaddish')])
+        self.assertEqual([2], [i for i, s in index.search('ginsberg')])
+        index.remove_item(2)
+        self.assertEqual([], index.search('ginsberg'))
+        self.assertNotIn('gallery', index.terms)
+
+    # apply changes to the search index immediately, since test cases
+    # are never committed
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_search_index_updates(self):
+        cache.clear()
+        search.shared_index.load()
+        item = Item.objects.get(title='[Maple Bridge Night Mooring]')
+        item.title = 'Night Ferry'
+        item.save()
+        self.assertEqual([], search.search('maple'))
+        self.assertEqual([item.pk], search.search('ferry zhang'))
+        # changing a creator's name updates their items
+        creator = item.creators.get(last_name='Zhang')
+        creator.last_name = 'Chang'
+        creator.save()
+        self.assertEqual([item.pk], search.search('ferry chang'))
+        item.delete()
+        self.assertEqual([], search.search('ferry'))
+
     def test_issue_csv_export(self):
         response = self.client.get(reverse('journals:csv-issues'))
         self.assertEqual(response['content-type'],
@@ -8,8 +8,14 @@ urlpatterns = [
     # journal contributor network urls
     url(r'^network/$', views.ContributorNetwork.as_view(), name='contributor-network'),
     url(r'^network.json$', views.ContributorNetworkJSON.as_view(), name='contributor-network-json'),
-    url(r'^contributors.(?P<fmt>graphml|gml)$', views.ContributorNetworkExport.as_view(),
+    url(r'^network.bin$', views.ContributorNetworkJSON.as_view(data_format='binary'),
+        name='contributor-network-binary'),
+    url(r'^contributors.(?P<fmt>graphml|gml|gexf)$', views.ContributorNetworkExport.as_view(),
         name='contributor-network-export'),
+    url(r'^network/communities.json$', views.ContributorCommunitiesJSON.as_view(),
+        name='contributor-communities-json'),
+    url(r'^network/communities/(?P<community>\d+).json$',
+        views.ContributorCommunityJSON.as_view(), name='contributor-community-json'),
     # greedier matching url patterns must come last
     url(r'^(?P<slug>[\w-]+)/$', views.JournalDetail.as_view(), name='journal'),
     url(r'^(?P<journal_slug>[\w-]+)/(?P<id>\d+)/$', views.IssueDetail.as_view(), name='issue'),
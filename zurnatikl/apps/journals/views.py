@@ -1,14 +1,21 @@
-import re
+from collections import OrderedDict
+import hashlib
 
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
 from django.http import Http404
 from django.shortcuts import render
 from django.views.generic import View, ListView, DetailView, TemplateView
 
 
+from zurnatikl.apps.network import artifacts, graph_cache, layouts, metrics
 from zurnatikl.apps.network.base_views import NetworkGraphExportView, \
     SigmajsJSONView, CsvView
-from .models import Journal, Issue, Item
+from zurnatikl.apps.network.communities import contract_communities
+from zurnatikl.apps.network.utils import filter_graph
+from zurnatikl.apps.people.models import Person, School
+from . import search
+from .models import Journal, Issue, Item, Genre
 from .forms import SearchForm
 
 
@@ -53,32 +60,142 @@ class IssueDetail(DetailView):
 
 
 class SearchView(View):
-    'Search items by title or creator name'
+    '''Search items by title or creator name.  Results are listed in
+    order of relevance, one page at a time; pages are requested with an
+    **after** (or **before**) parameter giving the id of the last (or
+    first) item on the adjacent page, so that page links stay stable
+    and only the items on the current page are loaded.
+
+    Results can be narrowed by journal, genre, or publication decade
+    with **journal**, **genre**, and **decade** request parameters,
+    e.g. ``?keyword=howl&decade=1950``; the number of results for each
+    facet value is displayed.  Facets are counted and applied using
+    the cached search results, without repeating the search.'''
     form_class = SearchForm
     template_name = 'journals/search_results.html'
+    #: number of items to display per page
+    paginate_by = 50
+    #: facets for narrowing search results, with display labels
+    #: (see :data:`zurnatikl.apps.journals.search.FACETS`)
+    facets = OrderedDict([
+        ('journal', 'Journal'),
+        ('genre', 'Genre'),
+        ('decade', 'Decade'),
+    ])
+
+    def page_url(self, **params):
+        # url for the current search with different page or facet
+        # parameters; parameters set to None are removed
+        query = self.request.GET.copy()
+        for param in ['after', 'before']:
+            query.pop(param, None)
+        for param, value in params.iteritems():
+            if value is None:
+                query.pop(param, None)
+            else:
+                query[param] = value
+        return '?%s' % query.urlencode()
+
+    def page_start(self, item_ids):
+        # position of the first item on the requested page
+        try:
+            if 'after' in self.request.GET:
+                start = item_ids.index(int(self.request.GET['after'])) + 1
+                if start >= len(item_ids):
+                    # nothing after the last item; show the last page
+                    start = ((len(item_ids) - 1) // self.paginate_by) * \
+                        self.paginate_by
+                return start
+            if 'before' in self.request.GET:
+                return max(0, item_ids.index(int(self.request.GET['before'])) -
+                           self.paginate_by)
+        except ValueError:
+            # invalid id, or item no longer in the results
+            pass
+        return 0
+
+    def get_filters(self):
+        # facet values requested via request parameters
+        filters = OrderedDict()
+        for facet in self.facets:
+            try:
+                filters[facet] = int(self.request.GET[facet])
+            except (KeyError, ValueError):
+                pass
+        return filters
+
+    def facet_labels(self, facet, values):
+        # display labels for facet values
+        if facet == 'journal':
+            return dict(Journal.objects.filter(pk__in=values)
+                                       .values_list('id', 'title'))
+        if facet == 'genre':
+            return dict(Genre.objects.filter(pk__in=values)
+                                     .values_list('id', 'name'))
+        return dict((value, '%ds' % value) for value in values)
+
+    def get_facets(self, results, filters):
+        '''Facet values for search results with labels, counts, and urls
+        to narrow the results, for display.  Values are listed by number
+        of results; decades are listed in order.'''
+        counts = search.facet_counts(results)
+        facets = []
+        for facet, label in self.facets.iteritems():
+            value_counts = counts[facet]
+            labels = self.facet_labels(facet, value_counts.keys())
+            if facet == 'decade':
+                values = sorted(value_counts)
+            else:
+                values = sorted(value_counts, key=lambda v: (-value_counts[v],
+                                                             labels.get(v)))
+            facets.append({
+                'label': label,
+                'clear_url': self.page_url(**{facet: None}),
+                'values': [{
+                    'label': labels.get(value, value),
+                    'count': value_counts[value],
+                    'selected': filters.get(facet) == value,
+                    'url': self.page_url(**{facet: value}),
+                } for value in values],
+            })
+        return facets
 
     def get(self, request, *args, **kwargs):
         form = self.form_class(request.GET)
         ctx = {'form': form}
         # currently keyword is the only field and is required
         if form.is_valid():
-            # search for items by author or title
+            # search for items by author or title, using the search
+            # index; items must match all words in the query
             kw = form.cleaned_data.get('keyword')
-            # split the query into words on spaces or comma space
-            # and match any field on any word
-            words = re.split(',? +', kw)
-            items = Item.objects.all().distinct()
-            # distinct required in case a term matches multiple fields
-            for w in words:
-                items = items.filter(
-                    Q(title__icontains=w) |
-                    Q(creators__last_name__icontains=w) |
-                    Q(creators__first_name__icontains=w) |
-                    Q(creators__name__first_name__icontains=w) |
-                    Q(creators__name__last_name__icontains=w) |
-                    Q(creators__penname__name__icontains=w))
-
-            ctx['items'] = items
+            results = search.search_results(kw)
+            # narrow the cached results by any requested facets
+            filters = self.get_filters()
+            if filters:
+                results = search.filter_results(results, filters)
+            item_ids = [item_id for item_id, facets in results]
+            start = self.page_start(item_ids)
+            page_ids = item_ids[start:start + self.paginate_by]
+            end = start + len(page_ids)
+
+            # load only the items on the current page, with everything
+            # needed to display them in a fixed number of queries
+            items = Item.objects.filter(pk__in=page_ids) \
+                        .select_related('issue__journal') \
+                        .prefetch_related('creators', 'translators')
+            # return items in order of relevance
+            rank = dict((pk, i) for i, pk in enumerate(page_ids))
+            ctx.update({
+                'items': sorted(items, key=lambda item: rank[item.pk]),
+                'total': len(item_ids),
+                'page_start': start + 1,
+                'page_end': end,
+                'previous_url': self.page_url(before=page_ids[0])
+                                if start > 0 else None,
+                'next_url': self.page_url(after=page_ids[-1])
+                            if end < len(item_ids) else None,
+                'facets': self.get_facets(results, filters),
+            })
 
         return render(request, self.template_name, ctx)
 
@@ -87,13 +204,230 @@ class ContributorNetwork(TemplateView):
     template_name = 'journals/contributor_network.html'
 
 
+#: cache key for the full contributor network layout used to position
+#: vertices in subgraphs (see :func:`contributor_network_layout`)
+contributor_layout_cache_key = 'contributor-network-slice-layout'
+
+
+def contributor_network_layout():
+    '''Layout for the full contributor network, as a dictionary of vertex
+    names and layout coordinates, for positioning vertices in subgraphs.
+    Uses the layout calculated for the current network data version,
+    or the precomputed layout or the last good layout if they were
+    generated for the same vertices as the current network.  Layouts
+    for the current version are cached, so precomputed data is only
+    loaded from disk once per version.  Returns None if there is no
+    layout.'''
+    layout = graph_cache.get(contributor_layout_cache_key)
+    if layout is not None:
+        return layout
+
+    graph = Journal.contributor_network()
+    names = graph.vs['name']
+    layout_key = '%s-layout' % reverse('journals:contributor-network-json')
+    coords = graph_cache.get(layout_key)
+    if coords is None:
+        coords = artifacts.aligned(
+            graph, artifacts.load('contributor-network-layout', stale=True),
+            'layout')
+    if coords is not None:
+        layout = {'names': names, 'layout': coords}
+        graph_cache.set(contributor_layout_cache_key, layout)
+        return layout
+
+    # a layout for a previous version can only be used if the
+    # network still has the same vertices
+    coords = artifacts.aligned(
+        graph, cache.get(layouts.last_layout_key(layout_key)), 'layout')
+    if coords is not None:
+        return {'names': names, 'layout': coords}
+
+
+def contributor_network_metrics():
+    '''Centrality metrics for the full contributor network (see
+    :mod:`zurnatikl.apps.network.metrics`), or None if they are still
+    being calculated.'''
+    return metrics.graph_metrics('contributor-network',
+                                 Journal.contributor_network)
+
+
+def contributor_network_max_weight():
+    '''Largest edge weight in the full contributor network, cached for
+    the network data version.'''
+    weight = graph_cache.get('contributor-network-max-weight')
+    if weight is None:
+        weight = max(Journal.contributor_network().es['weight'] or [1])
+        graph_cache.set('contributor-network-max-weight', weight)
+    return weight
+
+
+def contributor_network_year_range():
+    '''First and last publication years in the contributor network,
+    cached for the network data version.  Returns None if no issues
+    have a publication date.'''
+    year_range = graph_cache.get('contributor-network-year-range')
+    if year_range is None:
+        years = Journal.contributor_network_years()
+        # cache an empty tuple when there are no years
+        year_range = (min(years), max(years)) if years else ()
+        graph_cache.set('contributor-network-year-range', year_range)
+    return year_range or None
+
+
+def contributor_network():
+    '''Full contributor network, with vertices annotated with
+    centrality metrics once they have been calculated.'''
+    graph = Journal.contributor_network()
+    data = contributor_network_metrics()
+    if data is not None:
+        metrics.annotate_metrics(graph, data)
+    return graph
+
+
 class ContributorNetworkBaseView(TemplateView):
     '''Base view to generate full journal contributor network
-    for use in disseminating the graph as JSON, GEXF, or GraphML.'''
+    for use in disseminating the graph as JSON, GEXF, or GraphML.
+
+    The network can be filtered with request parameters:
+    **edge_label** (e.g. editor, co-author, translated),
+    **min_weight**, **journal** (journal slug), **type** (node type,
+    i.e. Journal or Person), and **school** (school name).  All
+    except minimum weight can be specified multiple times.  The network
+    can also be restricted to issues published in a range of years with
+    **from** and **to** (e.g. ``?from=1958&to=1965``); years are ignored
+    if no issues have a publication date.
+    Filtered graphs are cached for each set of filters; values that
+    don't exist in the network are ignored, and requests where none of
+    the values for a filter exist are not found.  Vertices are annotated
+    with centrality metrics for the full network when they are available;
+    graphs without metrics are not cached.'''
+
+    #: request parameters for filtering the graph, with filter_graph
+    #: keyword argument
+    filter_params = OrderedDict([
+        ('edge_label', 'edge_labels'),
+        ('min_weight', 'min_weight'),
+        ('journal', 'focus'),
+        ('type', 'vertex_types'),
+        ('school', 'schools'),
+    ])
+    #: request parameters for publication year range, with
+    #: :meth:`~zurnatikl.apps.journals.models.Journal.contributor_network_timeslice`
+    #: keyword argument
+    year_params = OrderedDict([
+        ('from', 'start'),
+        ('to', 'end'),
+    ])
+
+    #: normalized filters for the current request
+    _graph_filters = None
+
+    def graph_filters(self):
+        '''Filters requested via request parameters, normalized as an
+        :class:`~collections.OrderedDict` of parameter name and sorted
+        list of values.  Filters with no values are not included.
+        Unknown values are ignored (see :meth:`known_filter_values`);
+        raises :class:`~django.http.Http404` if none of the values
+        requested for a filter are known.'''
+        if self._graph_filters is not None:
+            return self._graph_filters
+        filters = OrderedDict()
+        year_range = None
+        for param in self.year_params:
+            # single year
+            try:
+                year = int(self.request.GET[param])
+            except (KeyError, ValueError):
+                continue
+            if year_range is None:
+                year_range = contributor_network_year_range()
+                if year_range is None:
+                    break
+            # clamp to just outside the years in the network, since all
+            # years beyond that give the same graph
+            first, last = year_range
+            filters[param] = [max(first - 1, min(year, last + 1))]
+        for param in self.filter_params:
+            if param == 'min_weight':
+                # single numeric value; all edges have a weight of at least 1
+                try:
+                    min_weight = int(self.request.GET.get(param, 0))
+                except ValueError:
+                    min_weight = 0
+                # higher minimums all filter out every edge
+                if min_weight > 1:
+                    min_weight = min(min_weight, contributor_network_max_weight() + 1)
+                values = [min_weight] if min_weight > 1 else []
+            else:
+                values = set(v for v in self.request.GET.getlist(param) if v)
+                if values:
+                    values = sorted(self.known_filter_values(param, values))
+                    if not values:
+                        raise Http404
+            if values:
+                filters[param] = values
+        self._graph_filters = filters
+        return filters
+
+    def known_filter_values(self, param, values):
+        '''Requested values for a filter that exist in the network:
+        contributor network edge labels, journal or person vertex
+        types, journal slugs, or school names.'''
+        if param == 'edge_label':
+            return values.intersection(Journal.contributor_edge_labels)
+        if param == 'type':
+            return values.intersection([Journal.network_type,
+                                        Person.network_type])
+        if param == 'journal':
+            return set(Journal.objects.filter(slug__in=values)
+                                      .values_list('slug', flat=True))
+        if param == 'school':
+            return set(School.objects.filter(name__in=values)
+                                     .values_list('name', flat=True))
+        return set()
+
+    def filter_key(self):
+        # normalized filters, hashed for use in cache keys, since
+        # school names may include spaces and non-ascii characters
+        filters = '&'.join('%s=%s' % (param, ','.join(unicode(v) for v in values))
+                           for param, values in self.graph_filters().iteritems())
+        return hashlib.md5(filters.encode('utf-8')).hexdigest()
 
     def get_context_data(self, **kwargs):
-        # full journal-contributor network
-        return Journal.contributor_network()
+        filters = self.graph_filters().copy()
+        if not filters:
+            # full journal-contributor network
+            graph = contributor_network()
+            self.data_current = metrics.has_metrics(graph)
+            return graph
+
+        cache_key = 'contributor-network-filtered-%s' % self.filter_key()
+        graph = graph_cache.get(cache_key)
+        if graph is None:
+            graph = contributor_network()
+            # metrics are still being calculated; don't cache the graph
+            self.data_current = metrics.has_metrics(graph)
+            # restrict to a range of publication years
+            year_args = dict((self.year_params[param], filters.pop(param)[0])
+                             for param in self.year_params if param in filters)
+            if year_args:
+                graph = Journal.contributor_network_timeslice(graph=graph,
+                                                              **year_args)
+
+            filter_args = dict((self.filter_params[param], values)
+                               for param, values in filters.iteritems())
+            if 'min_weight' in filter_args:
+                filter_args['min_weight'] = filter_args['min_weight'][0]
+            if 'focus' in filter_args:
+                filter_args['focus'] = [
+                    'journal:%s' % pk for pk in Journal.objects \
+                        .filter(slug__in=filter_args['focus']) \
+                        .values_list('id', flat=True)]
+            if filter_args:
+                graph = filter_graph(graph, **filter_args)
+            if self.data_current:
+                graph_cache.set(cache_key, graph)
+        return graph
 
 
 class ContributorNetworkJSON(SigmajsJSONView, ContributorNetworkBaseView):
@@ -101,10 +435,121 @@ class ContributorNetworkJSON(SigmajsJSONView, ContributorNetworkBaseView):
     with Sigma.js'''
 
     community_detection = True
-    # full network graph layout takes ~4s to calculate, so cache it
-    cache_layout = True
-    # FIXME: how do we make sure the cached graph layout stays in sync
-    # with the cached graph?
+    artifact_name = 'contributor-network'
+
+    def cache_key_prefix(self):
+        # cache json data separately for each set of filters
+        if self.graph_filters():
+            return '%s?%s' % (self.graph_path(), self.filter_key())
+        return self.graph_path()
+
+    def get_artifact_name(self):
+        # precomputed data is only for the full network
+        if not self.graph_filters():
+            return self.artifact_name
+
+    def get_graph_layout(self, graph):
+        # position filtered graph vertices based on the full network layout
+        if self.graph_filters():
+            layout = layouts.slice_layout(graph, contributor_network_layout())
+            if layout is not None:
+                return layout
+        return super(ContributorNetworkJSON, self).get_graph_layout(graph)
+
+
+class ContributorCommunitiesBaseView(TemplateView):
+    '''Base view for a level-of-detail version of the full contributor
+    network, based on communities detected in the full network.
+    The coarse graph, with each community contracted to a single
+    vertex, and the subgraphs for each community are loaded from
+    precomputed network data for the default community detection
+    algorithm if available, or generated together, and are cached for
+    the network data version.  Should be combined with
+    :class:`~zurnatikl.apps.network.base_views.SigmajsJSONView`.'''
+
+    #: cache key for the coarse graph; community subgraphs are cached
+    #: with the community number appended
+    communities_cache_key = 'contributor-network-communities-%s'
+
+    def community_cache_key(self):
+        # use the same clustering as the full network view
+        return '%s-community-%s' % (reverse('journals:contributor-network-json'),
+                                    self.get_community_algorithm())
+
+    def get_artifact_name(self):
+        return 'contributor-network'
+
+    def get_community_graphs(self):
+        '''Coarse graph of contributor network communities; loads or
+        generates and caches the community subgraphs along with the
+        coarse graph.'''
+        algorithm = self.get_community_algorithm()
+        key = self.communities_cache_key % algorithm
+        coarse = graph_cache.get(key)
+        if coarse is not None:
+            return coarse
+
+        subgraphs = None
+        if algorithm == self.community_algorithm:
+            # precomputed for the default algorithm (see build_networks)
+            coarse = artifacts.load('contributor-network-communities')
+            subgraphs = artifacts.load('contributor-network-community-subgraphs')
+        if coarse is None or subgraphs is None:
+            graph = Journal.contributor_network()
+            cluster = self.get_graph_clustering(graph)
+            coarse = contract_communities(graph, cluster.membership)
+            subgraphs = cluster.subgraphs()
+        data = {key: coarse}
+        for community, subgraph in enumerate(subgraphs):
+            data['%s-%d' % (key, community)] = subgraph
+        graph_cache.set_many(data)
+        return coarse
+
+    def get_graph(self):
+        return self.get_community_graphs()
+
+    def get_context_data(self, **kwargs):
+        return self.get_graph()
+
+
+class ContributorCommunitiesJSON(SigmajsJSONView, ContributorCommunitiesBaseView):
+    '''Contributor network with each community contracted into a
+    single vertex, in a JSON format appropriate for use with Sigma.js.
+    Community detection algorithm can be specified with a
+    **community** request parameter.'''
+
+    def cache_key_prefix(self):
+        return '%s-%s' % (self.graph_path(), self.get_community_algorithm())
+
+
+class ContributorCommunityJSON(SigmajsJSONView, ContributorCommunitiesBaseView):
+    '''Subgraph of the contributor network for the members of a single
+    community, in a JSON format appropriate for use with Sigma.js.'''
+
+    def cache_key_prefix(self):
+        return '%s-%s' % (self.graph_path(), self.get_community_algorithm())
+
+    def get_graph(self):
+        # community subgraphs are generated along with the coarse graph
+        coarse = self.get_community_graphs()
+        community = int(self.kwargs['community'])
+        if community >= coarse.vcount():
+            raise Http404
+        subgraph = graph_cache.get('%s-%d' % (
+            self.communities_cache_key % self.get_community_algorithm(),
+            community))
+        if subgraph is None:
+            # subgraph was evicted from the cache; regenerate
+            graph = Journal.contributor_network()
+            subgraph = self.get_graph_clustering(graph).subgraph(community)
+        return subgraph
+
+    def get_graph_layout(self, graph):
+        # position community members based on the full network layout
+        layout = layouts.slice_layout(graph, contributor_network_layout())
+        if layout is not None:
+            return layout
+        return super(ContributorCommunityJSON, self).get_graph_layout(graph)
 
 
 class ContributorNetworkExport(NetworkGraphExportView, ContributorNetworkBaseView):
@@ -0,0 +1,11 @@
+# zurnatikl/apps/network/apps.py
+
+from django.apps import AppConfig
+
+class NetworkConfig(AppConfig):
+    name = 'zurnatikl.apps.network'
+
+    def ready(self):
+        # connect signal handlers that update the network data version,
+        # and register the shared cache check
+        from zurnatikl.apps.network import checks, signals
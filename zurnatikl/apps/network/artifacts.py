@@ -0,0 +1,122 @@
+# precomputed network graphs and derived data stored on disk, so that
+# expensive graphs, layouts, and community clusterings can be generated
+# offline (see the build_networks manage command) instead of on request
+import cPickle as pickle
+from datetime import datetime
+import json
+import logging
+import os
+import shutil
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+#: name of the symlink to the current set of network data
+CURRENT = 'current'
+#: manifest file with details about a set of network data
+MANIFEST = 'manifest.json'
+#: file marking a set of network data as out of date
+STALE = 'stale'
+
+
+def data_dir():
+    '''Configured base directory for network data files, if any
+    (``NETWORK_DATA_DIR`` in django settings).'''
+    return getattr(settings, 'NETWORK_DATA_DIR', None)
+
+
+def current_dir():
+    '''Directory with the current set of network data, or None if
+    network data is not configured or has not been generated.'''
+    base_dir = data_dir()
+    if base_dir is None:
+        return None
+    path = os.path.join(base_dir, CURRENT)
+    if os.path.isdir(path):
+        return path
+
+
+def load(name, stale=False):
+    '''Load a single item of network data by name from the current set
+    of network data.  Returns None if not available, or if the network
+    data is out of date (see :func:`invalidate`) unless ``stale`` is
+    specified; data loaded from an out of date set should only be used
+    if it matches the current graph (see :func:`aligned`).'''
+    path = current_dir()
+    if path is None:
+        return None
+    if not stale and os.path.exists(os.path.join(path, STALE)):
+        return None
+    filename = os.path.join(path, '%s.pickle' % name)
+    if not os.path.exists(filename):
+        return None
+    start = time.time()
+    with open(filename, 'rb') as datafile:
+        data = pickle.load(datafile)
+    logger.debug('Loaded network data %s from %s in %.2f sec',
+                 name, path, time.time() - start)
+    return data
+
+
+def write(data, keep=2):
+    '''Write a dictionary of network data, keyed on name, to a new
+    versioned directory and make it the current set of network data.
+    The current version is swapped atomically, so requests never see
+    a partially written set of data.  Removes all but the most recent
+    ``keep`` versions.  Returns the path of the new directory.'''
+    base_dir = data_dir()
+    if base_dir is None:
+        raise ValueError('NETWORK_DATA_DIR is not configured')
+    if not os.path.isdir(base_dir):
+        os.makedirs(base_dir)
+
+    build = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    path = os.path.join(base_dir, build)
+    tmp_path = '%s.tmp' % path
+    os.makedirs(tmp_path)
+    for name, value in data.iteritems():
+        with open(os.path.join(tmp_path, '%s.pickle' % name), 'wb') as datafile:
+            pickle.dump(value, datafile, pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(tmp_path, MANIFEST), 'w') as manifest:
+        json.dump({'build': build, 'names': sorted(data.keys())}, manifest)
+    os.rename(tmp_path, path)
+
+    # replace the current link with a link to the new directory;
+    # rename is atomic
+    tmp_link = os.path.join(base_dir, '%s.tmp' % CURRENT)
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(build, tmp_link)
+    os.rename(tmp_link, os.path.join(base_dir, CURRENT))
+
+    # remove older versions
+    builds = sorted(d for d in os.listdir(base_dir)
+                    if d.isdigit() and os.path.isdir(os.path.join(base_dir, d)))
+    for old_build in builds[:-keep]:
+        shutil.rmtree(os.path.join(base_dir, old_build))
+
+    return path
+
+
+def invalidate():
+    '''Mark the current set of network data as out of date, e.g. when
+    the data it was generated from has changed.  Graphs are no longer
+    loaded from it until network data is generated again, but layouts,
+    community clusterings, and metrics can still be loaded and used
+    as long as they match the current graph (see :func:`load`).'''
+    path = current_dir()
+    if path is not None and not os.path.exists(os.path.join(path, STALE)):
+        open(os.path.join(path, STALE), 'a').close()
+        logger.info('Network data in %s is out of date',
+                    os.path.realpath(path))
+
+
+def aligned(graph, data, key):
+    '''Return vertex data (e.g. layout coordinates or community
+    membership) from stored network data, only if it was generated
+    for a graph with the same vertices as the specified graph.'''
+    if data is not None and data['names'] == graph.vs['name']:
+        return data[key]
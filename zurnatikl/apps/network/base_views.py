@@ -1,25 +1,60 @@
 import codecs
+from collections import OrderedDict
 from cStringIO import StringIO
-from datetime import datetime
 from django.conf import settings
-from django.core.cache import cache
-from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, \
+    JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django.utils.text import compress_string
 from django.views.generic import TemplateView, View
 import logging
+import hashlib
 import itertools
+import json
 import os
 import re
-import tempfile
 import time
 import unicodecsv
+from igraph import VertexClustering
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-from .utils import annotate_graph, node_link_data, to_ascii, encode_unicode
-from zurnatikl import __version__
+from . import artifacts, binary, communities, graph_cache, layouts, \
+    serializers
+from .utils import annotate_graph, node_link_data
 
 
 logger = logging.getLogger(__name__)
 
 
+def accepted_encodings(accept_encoding):
+    '''Parse an Accept-Encoding header into a dictionary of content
+    coding to quality value, e.g. ``gzip;q=0.5, br`` gives
+    ``{'gzip': 0.5, 'br': 1.0}``.  Codings with a malformed quality
+    value are ignored.'''
+    encodings = {}
+    for coding in accept_encoding.split(','):
+        params = coding.strip().split(';')
+        name = params[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = None
+        if quality is not None:
+            encodings[name] = quality
+    return encodings
+
+
 # JSON mixin and view borrowed from
 # https://docs.djangoproject.com/en/1.8/topics/class-based-views/mixins/#jsonresponsemixin-example
 
@@ -52,7 +87,10 @@ class SigmajsJSONView(JSONView):
     get_context_data to return the graph to be converted.
 
     Graph layout, community detection, and layout caching can be
-    configured by extending classes.
+    configured by extending classes.  Cached layouts, community
+    clusterings, and encoded JSON content are stored under the current
+    network data version (see :mod:`zurnatikl.apps.network.graph_cache`),
+    so they are never out of sync with the graph they were generated from.
     '''
 
     #: annotate nodes with graph data; by default, annotate with degree
@@ -66,43 +104,165 @@ class SigmajsJSONView(JSONView):
     # > 1000 uses Fruchterman-Reingold
     # graphs larger than that use drl
 
-    #: enable layout caching
-    cache_layout = False
+    #: enable layout caching; layouts are cached for the network data
+    #: version, and queued for the layout worker if a layout queue
+    #: is configured
+    cache_layout = True
+
+    #: start layouts from the last good layout for the graph, so
+    #: vertices keep their positions when the graph changes
+    warm_start_layout = True
+
+    #: set to False when a provisional layout is used while the graph
+    #: layout is calculated in the background
+    layout_current = True
+
+    #: set to False when the graph is served without data that is still
+    #: being calculated in the background (e.g., centrality metrics)
+    data_current = True
 
     #: enable community detection
     community_detection = False
 
+    #: default community detection algorithm; see
+    #: :data:`zurnatikl.apps.network.communities.ALGORITHMS`
+    community_algorithm = 'walktrap'
+
+    #: format for the graph data, either json or binary; the binary
+    #: format (see :mod:`zurnatikl.apps.network.binary`) is more compact
+    #: and faster for the browser to load for large graphs
+    data_format = 'json'
+
+    #: content types for supported data formats
+    content_types = {
+        'json': 'application/json',
+        'binary': binary.CONTENT_TYPE,
+    }
+
+    #: enable caching of encoded and compressed JSON content; also
+    #: enables conditional requests based on the cached etag
+    cache_data = True
+
+    #: name of precomputed network data to use for layout and
+    #: community detection, if available
+    #: (see :mod:`zurnatikl.apps.network.artifacts`)
+    artifact_name = None
+
+    def get_artifact_name(self):
+        return self.artifact_name
+
+    def load_artifact(self, graph, kind, key):
+        # load precomputed layout or clustering for this graph, if any
+        name = self.get_artifact_name()
+        if name is not None:
+            return artifacts.aligned(
+                graph, artifacts.load('%s-%s' % (name, kind), stale=True), key)
+
+    def graph_path(self):
+        # request path for the graph, independent of data format, so
+        # layouts and clusterings are shared by json and binary views
+        return re.sub(r'\.bin$', '.json', self.request.path)
+
+    def cache_key_prefix(self):
+        # extending views that generate different graphs for the same
+        # path should include the distinguishing options here
+        return self.graph_path()
+
     def layout_cache_key(self):
-        return '%s-layout' % self.request.path
+        return '%s-layout' % self.cache_key_prefix()
 
-    def get_graph_layout(self, graph):
-        # calculate a graph layout
-        # NOTE: full contributor network layout takes ~4s to calculate
-        # the layout should probably be cached, for that graph at least
-
-        # if layout caching is configured, check for a cached layout
-        if self.cache_layout:
-            # for now, set cache to never timeout; may need to be
-            # more configurable later on
-            layout = cache.get(self.layout_cache_key(), None)
-            # if layout was cached, return it immediately
-            if layout is not None:
-                logger.debug('Using cached graph layout for %s',
-                             self.request.path)
-                return layout
+    def community_cache_key(self):
+        return '%s-community-%s' % (self.cache_key_prefix(),
+                                    self.get_community_algorithm())
 
-        # generate layout if caching is not turned on or not in cache
-        start = time.time()
-        layout = graph.layout(self.layout)
-        logger.debug('Calculated graph layout in %.2f sec',
-                     time.time() - start)
+    def content_cache_key_prefix(self):
+        # json content depends on the community detection algorithm
+        if self.community_detection:
+            return '%s-%s' % (self.cache_key_prefix(),
+                              self.get_community_algorithm())
+        return self.cache_key_prefix()
 
-        # if caching is configured, store the generated layout
-        if self.cache_layout:
-            cache.set(self.layout_cache_key(), layout)
+    def data_cache_key(self):
+        return '%s-%s-content' % (self.content_cache_key_prefix(),
+                                  self.data_format)
 
+    def etag_cache_key(self):
+        return '%s-%s-etag' % (self.content_cache_key_prefix(),
+                               self.data_format)
+
+    def get_graph_layout(self, graph):
+        # calculate a graph layout
+        # NOTE: full contributor network layout takes ~4s to calculate,
+        # so layouts are calculated in the background when configured
+        # (see :mod:`zurnatikl.apps.network.layouts`)
+        if not self.cache_layout:
+            start = time.time()
+            layout = graph.layout(self.layout)
+            logger.debug('Calculated graph layout in %.2f sec',
+                         time.time() - start)
+            return layout
+
+        # use precomputed layout if available
+        layout = graph_cache.get(self.layout_cache_key())
+        if layout is None:
+            layout = self.load_artifact(graph, 'layout', 'layout')
+            if layout is not None:
+                graph_cache.set(self.layout_cache_key(), layout)
+        if layout is not None:
+            return layout
+
+        layout, current = layouts.get_layout(
+            self.layout_cache_key(), graph, self.layout,
+            warm_start=self.warm_start_layout)
+        if not current:
+            # provisional layout; don't cache generated data
+            logger.debug('Using provisional graph layout for %s',
+                         self.request.path)
+            self.layout_current = False
         return layout
 
+    def get_community_algorithm(self):
+        '''Community detection algorithm to use; can be specified with a
+        **community** request parameter, otherwise the view default
+        is used.'''
+        algorithm = self.request.GET.get('community', self.community_algorithm)
+        if algorithm not in communities.ALGORITHMS:
+            algorithm = self.community_algorithm
+        return algorithm
+
+    def get_graph_clustering(self, graph):
+        # community detection; cluster membership is cached for each
+        # algorithm, since it doesn't change unless the graph does
+        algorithm = self.get_community_algorithm()
+        clustering = graph_cache.get(self.community_cache_key())
+        if clustering is None and self.get_artifact_name() is not None:
+            # use precomputed clustering if available for this algorithm
+            artifact = artifacts.load('%s-community' % self.get_artifact_name(),
+                                      stale=True)
+            membership = artifacts.aligned(graph, artifact, 'membership')
+            if membership is not None and \
+                    artifact.get('algorithm', 'walktrap') == algorithm:
+                clustering = {
+                    'algorithm': algorithm,
+                    'membership': membership,
+                    'modularity': artifact.get('modularity')
+                }
+                graph_cache.set(self.community_cache_key(), clustering)
+        if clustering is not None:
+            logger.debug('Using cached %s community clustering for %s',
+                         algorithm, self.request.path)
+        else:
+            clustering = communities.detect_communities(graph, algorithm)
+            graph_cache.set(self.community_cache_key(), clustering)
+
+        self.community_metadata = OrderedDict([
+            ('algorithm', clustering['algorithm']),
+            ('modularity', clustering.get('modularity')),
+            ('communities', max(clustering['membership']) + 1
+                            if clustering['membership'] else 0)
+        ])
+        return VertexClustering(graph, clustering['membership'])
+
     def get_context_data(self, **kwargs):
         graph = super(SigmajsJSONView, self).get_context_data(**kwargs)
 
@@ -119,85 +279,122 @@ class SigmajsJSONView(JSONView):
         # community detetion, if requested
         cluster = None
         if self.community_detection:
-            start = time.time()
-            # fastgreedy only works on undirected
-            # dend = graph.community_fastgreedy(weights='weight')
-            # cluster = graph.community_infomap(edge_weights='weight')
-
-            # leading eigenvector community looks nice
-            # cluster = graph.community_leading_eigenvector(weights='weight')
-            # NOTE: generates warning, developed for undirected graphs
-
-            # this one looks pretty good too
-            cluster = graph.community_walktrap(weights='weight').as_clustering()
-
-            logger.debug('Community detection in %.2f sec', time.time() - start)
+            cluster = self.get_graph_clustering(graph)
 
         start = time.time()
         data = node_link_data(graph, layout, cluster)
-        logger.debug('Generated json in %.2f sec' %
+        if cluster is not None:
+            # report community detection details with the data
+            data['community_detection'] = self.community_metadata
+        logger.debug('Generated json data in %.2f sec' %
                      (time.time() - start))
         return data
 
+    def encode_data(self, data):
+        # serialize graph data in the configured format
+        if self.data_format == 'binary':
+            return binary.encode(data)
+        return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+    def get_json_payload(self, **kwargs):
+        '''Encoded content for the graph in the configured data format,
+        as a dictionary with the content for each supported content
+        encoding (identity, gzip, and br if brotli is installed) and an
+        etag based on the network data version and the content.  If data caching is enabled, the payload
+        is cached, so that serving the same graph again does not require
+        generating, serializing, or compressing the data.'''
+        if self.cache_data:
+            payload = graph_cache.get(self.data_cache_key())
+            if payload is not None:
+                logger.debug('Using cached %s for %s', self.data_format,
+                             self.request.path)
+                return payload
+
+        version = graph_cache.network_version()
+        data = self.get_context_data(**kwargs)
+        start = time.time()
+        content = self.encode_data(data)
+        payload = {
+            'etag': '%s-%s' % (version, hashlib.sha1(content).hexdigest()),
+            'identity': content,
+            'gzip': compress_string(content),
+        }
+        if brotli is not None:
+            payload['br'] = brotli.compress(content)
+        logger.debug('Serialized and compressed %s in %.2f sec' %
+                     (self.data_format, time.time() - start))
+        # don't cache content generated with a provisional layout or
+        # incomplete graph data
+        if self.cache_data and self.layout_current and self.data_current:
+            graph_cache.set_many({self.data_cache_key(): payload,
+                                  self.etag_cache_key(): payload['etag']})
+        return payload
+
+    def content_encoding(self):
+        '''Choose the content encoding with the highest quality value in
+        the request Accept-Encoding header, preferring brotli (if
+        installed), then gzip, then no encoding when quality values are
+        equal.  Encodings with a quality value of 0 are never used.'''
+        accepted = accepted_encodings(
+            self.request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        encodings = ['gzip', 'br'] if brotli is not None else ['gzip']
+        best, best_quality = 'identity', accepted.get('identity', 0)
+        # in increasing order of preference, so preferred encodings
+        # win when quality values are equal
+        for encoding in encodings:
+            quality = accepted.get(encoding, accepted.get('*', 0))
+            if quality > 0 and quality >= best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def encoded_etag(self, etag, encoding):
+        # each encoding of the content needs a distinct etag
+        if encoding == 'identity':
+            return etag
+        return '%s-%s' % (etag, encoding)
+
+    def etag_matches(self, etag):
+        # check if the request etag matches the negotiated encoding
+        # of the content
+        request_etags = parse_etags(self.request.META.get('HTTP_IF_NONE_MATCH', ''))
+        return '*' in request_etags or etag in request_etags
+
+    def get(self, request, *args, **kwargs):
+        encoding = self.content_encoding()
+        # if the client already has the current version of the content,
+        # respond without loading or generating the graph data
+        if self.cache_data and 'HTTP_IF_NONE_MATCH' in request.META:
+            etag = graph_cache.get(self.etag_cache_key())
+            if etag is not None:
+                etag = self.encoded_etag(etag, encoding)
+                if self.etag_matches(etag):
+                    response = HttpResponseNotModified()
+                    response['ETag'] = quote_etag(etag)
+                    patch_vary_headers(response, ['Accept-Encoding'])
+                    return response
+
+        payload = self.get_json_payload(**kwargs)
+        response = HttpResponse(payload[encoding],
+                                content_type=self.content_types[self.data_format])
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        response['ETag'] = quote_etag(self.encoded_etag(payload['etag'], encoding))
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
 
 class NetworkGraphExportMixin(object):
-    export_format = 'graphml'     # also supports graphml
+    export_format = 'graphml'     # also supports gml and gexf
     filename = 'graph'         # default filename for download
 
     def render_to_network_export(self, context, **response_kwargs):
         graph = context
-        # write out in requested format and return
-        # NOTE: python-igraph is a wrapper around c libraries,
-        # so it cannot operate on stringio buffers here; using
-        # tempfile instead
-
-        # NOTE: igraph outputs all node attributes for all nodes,
-        # whether that node has a value for that attribute or note
-        # - convert None to empty string before exporting
-        # - convert to unicode or ascii based on format
-        for vtx in graph.vs:
-            vtx_attr = vtx.attributes()
-            if self.export_format == 'graphml':
-                vtx_attr = encode_unicode(vtx_attr)
-            elif self.export_format == 'gml':
-                vtx_attr = to_ascii(vtx_attr)
-            for key, val in vtx_attr.iteritems():
-                if val is None:
-                    vtx[key] = ''
-                else:
-                    vtx[key] = val
-
-        buf = tempfile.TemporaryFile(suffix=self.export_format)
-        if self.export_format == 'graphml':
-            # cytoscape seems to look for name instead of label ...
-            # in igraph, node name is internal network id
-            graph.write_graphml(buf)
-            buf.seek(0)
-            content = buf.read()
-            # NOTE: output includes empty data elements, e.g.
-            #   <data key="v_genre"/>
-            #   <data key="v_volume"/>
-            #   <data key="v_publisher"/>
-            # could use either regex or lxml.etree to find and remove them
-
-            mimetype = 'application/graphml+xml'
-            # NOTE: could not find an authoritative mimetype for graphml
-
-        elif self.export_format == 'gml':
-            graph.write_gml(buf, creator='/ zurnatikl %s %s' %
-                            (__version__, datetime.now()))
-            graph.write_gml(buf)
-            mimetype = 'text/plain'
-            # gml is an ascii format; unclear if it has a unique mimetype
-            buf.seek(0)
-            content = buf.read()
-            # use regexes to remove empty attributes from the output
-            content = re.sub(r'^\s+\w+\s""\s*$', '', content,
-                             flags=re.MULTILINE)
-            # consolidate multiple blank lines
-            content = re.sub(r'\n+', "\n", content)
-
-        response = HttpResponse(content, content_type=mimetype)
+        # serialize in the requested format and stream the output,
+        # without converting or modifying the graph attributes;
+        # empty attributes are omitted by the serializers
+        serialize, mimetype = serializers.FORMATS[self.export_format]
+        response = StreamingHttpResponse(serialize(graph),
+                                         content_type=mimetype)
         # response['Content-Disposition'] = 'attachment; filename=%s.%s' %  \
         response['Content-Disposition'] = 'filename=%s.%s' %  \
             (self.filename, self.export_format)
@@ -205,11 +402,11 @@ class NetworkGraphExportMixin(object):
 
 
 class NetworkGraphExportView(NetworkGraphExportMixin, View):
-    '''Re-usable view to export a graph as GraphML or GML.
-    To support both formats, configure your url with a **fmt** parameter,
+    '''Re-usable view to export a graph as GraphML, GML, or GEXF.
+    To support multiple formats, configure your url with a **fmt** parameter,
     along these lines::
 
-       url(r'^data.(?P<fmt>graphml|gml)$', MyNetworkExport.as_view()),
+       url(r'^data.(?P<fmt>graphml|gml|gexf)$', MyNetworkExport.as_view()),
 
     Defaults to graphml if format is not specified.  Set filename on
     extended class to customize default filename for download.
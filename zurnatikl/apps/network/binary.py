@@ -0,0 +1,211 @@
+# compact binary transport format for network graph data, as an
+# alternative to sigma.js json; node and edge values are stored as
+# typed arrays that can be used directly by the browser, with strings
+# and other non-numeric values in a separate deduplicated table.
+# See sitemedia/js/sigma/plugins/sigma.parsers.binary.js for the
+# matching decoder.
+#
+# Format (all values little-endian):
+#   - 4 byte magic string (ZNG1)
+#   - uint32 length of the json metadata
+#   - json metadata, padded with spaces to a multiple of 4 bytes
+#   - node arrays: float32 x, float32 y, uint8 type code (padded to a
+#     multiple of 4 bytes), int32 community (-1 for none), then uint32
+#     value table index for each node value attribute and float32 for
+#     each node numeric attribute (NaN for none), in the order listed
+#     in the metadata
+#   - edge arrays: uint32 source, uint32 target, then uint32 value
+#     table index for each edge value attribute and float32 for each
+#     edge numeric attribute
+import array
+import json
+import math
+import struct
+import sys
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+MAGIC = 'ZNG1'
+#: value table index used for missing values
+NONE = 0xFFFFFFFF
+#: type code used for nodes without a type
+NO_TYPE = 0xFF
+#: numeric value used for missing numeric attributes
+NAN = float('nan')
+#: content type for binary graph data
+CONTENT_TYPE = 'application/octet-stream'
+
+# node and edge attributes stored in dedicated arrays
+NODE_FIELDS = ['id', 'x', 'y', 'type', 'community']
+EDGE_FIELDS = ['id', 'source', 'target']
+
+
+def typed_array(typecode, values):
+    # pack values as a little-endian typed array
+    arr = array.array(typecode, values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tostring()
+
+
+def padded(content, fill='\0'):
+    # pad content to a multiple of four bytes, so that the following
+    # arrays are aligned for use as typed arrays
+    return content + fill * (-len(content) % 4)
+
+
+def is_number(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+
+def number(value):
+    return NAN if value is None else value
+
+
+def attribute_kinds(items, exclude):
+    '''Split attributes into numeric attributes, stored as float32
+    arrays, and value attributes (strings, lists, booleans), stored as
+    indexes into the value table.  Attributes where every value is
+    numeric or None are numeric.'''
+    numbers = set()
+    values = set()
+    for item in items:
+        for name, value in item.iteritems():
+            if name in exclude or value is None:
+                continue
+            if is_number(value):
+                numbers.add(name)
+            else:
+                values.add(name)
+    return sorted(numbers - values), sorted(values)
+
+
+class ValueTable(object):
+    # deduplicated table of values, indexed in order added
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def add(self, value):
+        if value is None:
+            return NONE
+        key = json.dumps(value, cls=DjangoJSONEncoder, sort_keys=True)
+        if key not in self.index:
+            self.index[key] = len(self.values)
+            self.values.append(value)
+        return self.index[key]
+
+
+def encode(data):
+    '''Encode sigma.js graph data as generated by
+    :meth:`zurnatikl.apps.network.utils.node_link_data` in the binary
+    format.  Returns a byte string.'''
+    nodes = data['nodes']
+    edges = data['edges']
+    table = ValueTable()
+
+    types = sorted(set(n['type'] for n in nodes if n.get('type') is not None))
+    type_codes = dict((t, i) for i, t in enumerate(types))
+    node_numbers, node_values = attribute_kinds(nodes, NODE_FIELDS)
+    edge_numbers, edge_values = attribute_kinds(edges, EDGE_FIELDS)
+
+    parts = [
+        typed_array('f', [n.get('x', 0) for n in nodes]),
+        typed_array('f', [n.get('y', 0) for n in nodes]),
+        padded(typed_array('B', [type_codes.get(n.get('type'), NO_TYPE)
+                                 for n in nodes])),
+        typed_array('i', [n['community'] if n.get('community') is not None
+                          else -1 for n in nodes]),
+    ]
+    parts.extend(typed_array('I', [table.add(n.get(name)) for n in nodes])
+                 for name in node_values)
+    parts.extend(typed_array('f', [number(n.get(name)) for n in nodes])
+                 for name in node_numbers)
+    parts.append(typed_array('I', [e['source'] for e in edges]))
+    parts.append(typed_array('I', [e['target'] for e in edges]))
+    parts.extend(typed_array('I', [table.add(e.get(name)) for e in edges])
+                 for name in edge_values)
+    parts.extend(typed_array('f', [number(e.get(name)) for e in edges])
+                 for name in edge_numbers)
+
+    meta = dict((k, v) for k, v in data.iteritems()
+                if k not in ['nodes', 'edges'])
+    meta.update({
+        'nodes': len(nodes),
+        'edges': len(edges),
+        'types': types,
+        'node_values': node_values,
+        'node_numbers': node_numbers,
+        'edge_values': edge_values,
+        'edge_numbers': edge_numbers,
+        'values': table.values,
+    })
+    meta = padded(json.dumps(meta, cls=DjangoJSONEncoder,
+                             separators=(',', ':')), ' ')
+    return ''.join([MAGIC, struct.pack('<I', len(meta)), meta] + parts)
+
+
+def decode(content):
+    '''Decode binary graph data into sigma.js graph data, as generated
+    by :meth:`zurnatikl.apps.network.utils.node_link_data`.  Intended
+    for testing and debugging; numeric values are decoded as floats.'''
+    if content[:4] != MAGIC:
+        raise ValueError('Not binary graph data')
+    meta_length = struct.unpack('<I', content[4:8])[0]
+    meta = json.loads(content[8:8 + meta_length])
+    offset = [8 + meta_length]
+
+    def read(typecode, count, pad=False):
+        arr = array.array(typecode)
+        length = arr.itemsize * count
+        arr.fromstring(content[offset[0]:offset[0] + length])
+        if sys.byteorder == 'big':
+            arr.byteswap()
+        offset[0] += length + (-length % 4 if pad else 0)
+        return arr.tolist()
+
+    node_count = meta.pop('nodes')
+    edge_count = meta.pop('edges')
+    values = meta.pop('values')
+    types = meta.pop('types')
+    node_values = meta.pop('node_values')
+    node_numbers = meta.pop('node_numbers')
+    edge_values = meta.pop('edge_values')
+    edge_numbers = meta.pop('edge_numbers')
+
+    xs = read('f', node_count)
+    ys = read('f', node_count)
+    type_codes = read('B', node_count, pad=True)
+    community = read('i', node_count)
+    nodes = [{'id': i, 'x': xs[i], 'y': ys[i]} for i in range(node_count)]
+    for i, node in enumerate(nodes):
+        if type_codes[i] != NO_TYPE:
+            node['type'] = types[type_codes[i]]
+        if community[i] != -1:
+            node['community'] = community[i]
+    for name in node_values:
+        for node, index in zip(nodes, read('I', node_count)):
+            if index != NONE:
+                node[name] = values[index]
+    for name in node_numbers:
+        for node, value in zip(nodes, read('f', node_count)):
+            if not math.isnan(value):
+                node[name] = value
+
+    sources = read('I', edge_count)
+    targets = read('I', edge_count)
+    edges = [{'id': i, 'source': sources[i], 'target': targets[i]}
+             for i in range(edge_count)]
+    for name in edge_values:
+        for edge, index in zip(edges, read('I', edge_count)):
+            if index != NONE:
+                edge[name] = values[index]
+    for name in edge_numbers:
+        for edge, value in zip(edges, read('f', edge_count)):
+            if not math.isnan(value):
+                edge[name] = value
+
+    meta.update({'nodes': nodes, 'edges': edges})
+    return meta
@@ -0,0 +1,26 @@
+# system checks for configuration needed to keep cached network data
+# and other cached indexes in sync between server processes
+from django.conf import settings
+from django.core import checks
+
+
+#: cache backends that are not shared between server processes
+LOCAL_CACHE_BACKENDS = [
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+]
+
+
+@checks.register()
+def check_shared_cache(app_configs, **kwargs):
+    '''Warn if the default cache is not shared between processes in
+    production, since network data versions and search and autocomplete
+    indexes are synchronized through the cache.'''
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS and not settings.DEBUG:
+        return [checks.Warning(
+            'The default cache is not shared between server processes',
+            hint='Configure CACHES to use a shared cache such as memcached '
+                 '(see DEPLOYNOTES)',
+            id='network.W001')]
+    return []
@@ -0,0 +1,115 @@
+# community detection for network graphs, with a choice of algorithms;
+# algorithms that are only defined for undirected graphs are run on an
+# undirected, weighted projection of the graph
+from collections import Counter, OrderedDict
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def undirected_projection(graph):
+    '''Undirected copy of a graph, with multiple edges between the same
+    vertices collapsed into a single edge; weights are summed.'''
+    projection = graph.copy()
+    if 'weight' not in projection.es.attribute_names():
+        projection.es['weight'] = 1
+    projection.to_undirected(mode='collapse', combine_edges={'weight': 'sum'})
+    return projection
+
+
+def edge_weights(graph):
+    return 'weight' if 'weight' in graph.es.attribute_names() else None
+
+
+def walktrap(graph):
+    return graph.community_walktrap(weights=edge_weights(graph)).as_clustering()
+
+
+def infomap(graph):
+    return graph.community_infomap(edge_weights=edge_weights(graph))
+
+
+def multilevel(graph):
+    # multilevel (louvain) modularity optimization; fast on large graphs
+    return graph.community_multilevel(weights=edge_weights(graph))
+
+
+def fastgreedy(graph):
+    return graph.community_fastgreedy(weights=edge_weights(graph)).as_clustering()
+
+
+def leading_eigenvector(graph):
+    return graph.community_leading_eigenvector(weights=edge_weights(graph))
+
+
+def label_propagation(graph):
+    return graph.community_label_propagation(weights=edge_weights(graph))
+
+
+#: available community detection algorithms; method and whether the
+#: algorithm requires an undirected graph
+ALGORITHMS = OrderedDict([
+    ('walktrap', (walktrap, False)),
+    ('infomap', (infomap, False)),
+    ('multilevel', (multilevel, True)),
+    ('fastgreedy', (fastgreedy, True)),
+    ('leading_eigenvector', (leading_eigenvector, True)),
+    ('label_propagation', (label_propagation, True)),
+])
+
+
+def detect_communities(graph, algorithm='walktrap'):
+    '''Detect communities in a graph with the specified algorithm
+    (one of :data:`ALGORITHMS`).  Returns a dictionary with cluster
+    membership for each vertex, the algorithm used, and the modularity
+    of the clustering, which can be cached and reported along with
+    the graph.'''
+    method, undirected = ALGORITHMS[algorithm]
+    start = time.time()
+    if undirected and graph.is_directed():
+        graph = undirected_projection(graph)
+    cluster = method(graph)
+    logger.debug('Community detection with %s in %.2f sec',
+                 algorithm, time.time() - start)
+    return {
+        'algorithm': algorithm,
+        'membership': cluster.membership,
+        'modularity': graph.modularity(cluster.membership,
+                                       weights=edge_weights(graph)),
+    }
+
+
+def contract_communities(graph, membership):
+    '''Coarse version of a graph, with the vertices in each community
+    contracted into a single undirected vertex.  Edges between
+    communities are combined, with weights summed; edges within a
+    community are removed.  Community vertices are labeled with the
+    most connected member and the number of members, and sized by the
+    number of members.'''
+    coarse = graph.copy()
+    if 'weight' not in coarse.es.attribute_names():
+        coarse.es['weight'] = 1
+    coarse.contract_vertices(membership)
+    coarse.to_undirected(mode='collapse', combine_edges={'weight': 'sum'})
+    coarse.simplify(multiple=False, loops=True)
+
+    # use the vertex with the highest degree to label each community
+    sizes = Counter(membership)
+    degree = graph.degree()
+    most_connected = {}
+    for index, community in enumerate(membership):
+        if community not in most_connected or \
+                degree[index] > degree[most_connected[community]]:
+            most_connected[community] = index
+
+    communities = range(coarse.vcount())
+    coarse.vs['name'] = ['community:%d' % i for i in communities]
+    coarse.vs['community'] = communities
+    coarse.vs['type'] = 'Community'
+    coarse.vs['size'] = [sizes[i] for i in communities]
+    coarse.vs['label'] = [u'%s (%d)' % (graph.vs[most_connected[i]]['label'],
+                                         sizes[i])
+                          for i in communities]
+    return coarse
@@ -0,0 +1,123 @@
+# versioned cache for network graphs and data derived from them
+# (layouts, community clusterings, json), so that derived data never
+# gets out of sync with the graph it was generated from.  Values are
+# stored under the current network data version; values for previous
+# versions are never read again, and expire or are pushed out of the
+# cache.  The version is shared between server processes, so the
+# django cache must be shared between them (e.g., memcached).
+from collections import OrderedDict
+import logging
+import threading
+
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+#: cache key for the current network data generation number
+VERSION_KEY = 'network-data-version'
+#: default timeout for cached network data, in seconds; values cached
+#: for previous versions expire after this if they are not pushed out
+#: of the cache sooner
+TIMEOUT = 7 * 24 * 60 * 60
+
+
+def network_version():
+    '''Current network data generation number.  All network graphs
+    and derived data are cached under this version.'''
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_network_version(carry_over=None):
+    '''Increment the network data generation number, so that any network
+    data cached for the previous version is no longer used.  Optionally
+    takes a list of keys for values that are still current and should be
+    copied to the new version (e.g., a graph that has been updated in
+    place).  Returns the new version.'''
+    old_version = network_version()
+    carried = {}
+    if carry_over:
+        carried = cache.get_many(carry_over, version=old_version)
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        # version was removed from the cache since it was checked
+        version = old_version + 1
+        cache.set(VERSION_KEY, version, None)
+
+    if carried:
+        cache.set_many(carried, TIMEOUT, version=version)
+    logger.debug('Network data version updated to %s', version)
+    return version
+
+
+def get(key, default=None):
+    'Get a value cached for the current network data version.'
+    return cache.get(key, default, version=network_version())
+
+
+def get_many(keys):
+    'Get multiple values cached for the current network data version.'
+    return cache.get_many(keys, version=network_version())
+
+
+def set(key, value, timeout=TIMEOUT, version=None):
+    '''Cache a value for the current network data version.  A specific
+    version can be given for values generated in the background, which
+    may finish after the version changes.'''
+    if version is None:
+        version = network_version()
+    cache.set(key, value, timeout, version=version)
+
+
+def set_many(data, timeout=TIMEOUT, version=None):
+    '''Cache multiple values for the current network data version, or
+    for a specific version (e.g., one returned by
+    :func:`bump_network_version`).'''
+    if version is None:
+        version = network_version()
+    cache.set_many(data, timeout, version=version)
+
+
+def delete(key):
+    'Remove a value cached for the current network data version.'
+    cache.delete(key, version=network_version())
+
+
+class LRUCache(object):
+    '''Small in-process least-recently-used cache, for values derived
+    from network graphs that are requested often enough that loading
+    them from the shared cache on every request is too slow (e.g.,
+    egographs for popular people).  Keys should include the network
+    data version, so that values for an old version are never used
+    and are eventually pushed out.'''
+
+    def __init__(self, size=128):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return default
+            # re-insert as the most recently used value
+            self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
@@ -0,0 +1,323 @@
+# graph layouts computed in the background, so that requests never wait
+# on a force-directed layout; while a layout is being calculated, the
+# last good layout for the same graph (or a quick fallback) is used.
+# Layout calculations are queued as files in a directory and run by a
+# separate worker process (see the layout_worker manage command), since
+# forking processes from inside web server processes is not safe.
+import cPickle as pickle
+import glob
+import logging
+import os
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import graph_cache
+
+
+logger = logging.getLogger(__name__)
+
+#: quick layout used while a layout is calculated, if there is no
+#: previous layout for the graph
+FALLBACK_LAYOUT = 'circle'
+
+#: maximum number of iterations for force-directed layouts started
+#: from a previous layout, by algorithm short name; DrL uses its
+#: refinement settings instead
+WARM_START_ITERATIONS = {'fr': 100, 'kk': 100}
+
+#: minimum portion of vertices that must have a previous position to
+#: start a layout from the previous layout
+WARM_START_MIN_KNOWN = 0.5
+
+#: how long a layout calculation is expected to take, in seconds; if
+#: a calculation has not finished by then, it will be started again
+PENDING_TIMEOUT = 10 * 60
+
+#: how long to keep the last good layout for a graph, in seconds
+LAST_LAYOUT_TIMEOUT = graph_cache.TIMEOUT
+
+#: minimum number of vertices for a graph's last good layout to be kept;
+#: smaller graphs are quick to lay out from scratch, and keeping layouts
+#: for them (e.g., every egograph) would fill up the cache
+LAST_LAYOUT_MIN_VERTICES = 100
+
+#: file extensions for queued layout jobs and jobs claimed by a worker
+JOB_EXTENSION = '.job'
+RUNNING_EXTENSION = '.running'
+
+
+def queue_dir():
+    '''Configured directory for queueing layout calculations to be run
+    by the layout_worker manage command (``NETWORK_LAYOUT_QUEUE`` in
+    django settings).  If set to None, layouts are calculated on
+    request, which is only suitable for development.'''
+    return getattr(settings, 'NETWORK_LAYOUT_QUEUE', None)
+
+
+def layout_algorithm(graph, algorithm):
+    # resolve auto layout to a specific algorithm based on graph size,
+    # the same way igraph does, so it can be started from a seed layout
+    if algorithm != 'auto':
+        return algorithm
+    if graph.vcount() <= 100:
+        return 'kk'
+    if graph.vcount() <= 1000:
+        return 'fr'
+    return 'drl'
+
+
+def warm_start_layout(graph, algorithm, seed):
+    '''Calculate a force-directed layout starting from seed coordinates
+    with a limited number of iterations.  Returns None if the algorithm
+    does not support a seed layout.'''
+    algorithm = layout_algorithm(graph, algorithm)
+    if algorithm in ['fr', 'fruchterman_reingold']:
+        try:
+            return graph.layout('fr', seed=seed,
+                                niter=WARM_START_ITERATIONS['fr'])
+        except TypeError:
+            # older versions of igraph use maxiter instead of niter
+            return graph.layout('fr', seed=seed,
+                                maxiter=WARM_START_ITERATIONS['fr'])
+    if algorithm in ['kk', 'kamada_kawai']:
+        return graph.layout('kk', seed=seed,
+                            maxiter=WARM_START_ITERATIONS['kk'])
+    if algorithm == 'drl':
+        return graph.layout('drl', seed=seed, options='refine')
+
+
+def compute_layout(graph, algorithm, seed=None):
+    '''Calculate a layout for a graph and return the coordinates.
+    If seed coordinates are specified and the algorithm supports it,
+    the layout is started from the seed with a limited number of
+    iterations.  Runs in a worker process; returns None if the layout
+    fails, since errors are otherwise not reported back.'''
+    start = time.time()
+    try:
+        layout = None
+        if seed is not None:
+            layout = warm_start_layout(graph, algorithm, seed)
+        if layout is None:
+            layout = graph.layout(algorithm)
+        coords = layout.coords
+    except Exception:
+        logger.exception('Error calculating %s graph layout', algorithm)
+        return None
+    logger.debug('Calculated %s graph layout%s in %.2f sec', algorithm,
+                 ' from previous layout' if seed is not None else '',
+                 time.time() - start)
+    return coords
+
+
+def seed_layout(graph, last):
+    '''Initial coordinates for a graph based on a previous layout, with
+    vertices matched by name.  Vertices without a previous position are
+    placed near their positioned neighbors, or at random within the
+    layout bounds if they have none.  Returns None if too few vertices
+    have a previous position.'''
+    if last is None or 'name' not in graph.vs.attribute_names():
+        return None
+    positions = dict(zip(last['names'], last['layout']))
+    coords = [positions.get(name) for name in graph.vs['name']]
+    known = [c for c in coords if c is not None]
+    if not known or len(known) < WARM_START_MIN_KNOWN * len(coords):
+        return None
+
+    xs, ys = zip(*[c[:2] for c in known])
+    span = max(max(xs) - min(xs), max(ys) - min(ys)) or 1.0
+    jitter = span * 0.01
+    missing = [i for i, c in enumerate(coords) if c is None]
+    # repeat so that new vertices connected only to other new
+    # vertices are placed near them once they have a position
+    while missing:
+        unplaced = []
+        for i in missing:
+            neighbors = [coords[n] for n in graph.neighbors(i)
+                         if coords[n] is not None]
+            if neighbors:
+                coords[i] = [
+                    sum(c[0] for c in neighbors) / len(neighbors) +
+                    random.uniform(-jitter, jitter),
+                    sum(c[1] for c in neighbors) / len(neighbors) +
+                    random.uniform(-jitter, jitter)
+                ]
+            else:
+                unplaced.append(i)
+        if len(unplaced) == len(missing):
+            for i in unplaced:
+                coords[i] = [random.uniform(min(xs), max(xs)),
+                             random.uniform(min(ys), max(ys))]
+            break
+        missing = unplaced
+    return [list(c[:2]) for c in coords]
+
+
+def last_layout_key(key):
+    return '%s-last' % key
+
+
+def pending_key(key):
+    return '%s-pending' % key
+
+
+def store_layout(key, names, coords, version):
+    '''Cache a calculated layout for the network data version it was
+    generated for, unless the network data has changed since then, and
+    keep it as the last good layout for the graph, independent of
+    version, if the graph is large enough to need a warm start (see
+    :data:`LAST_LAYOUT_MIN_VERTICES`).'''
+    if version == graph_cache.network_version():
+        graph_cache.set(key, coords, version=version)
+    if names is not None and len(coords) >= LAST_LAYOUT_MIN_VERTICES:
+        cache.set(last_layout_key(key), {'names': names, 'layout': coords},
+                  LAST_LAYOUT_TIMEOUT)
+
+
+def rescale(coords):
+    '''Scale layout coordinates to fit within -1 to 1, preserving the
+    aspect ratio of the layout.'''
+    if not coords:
+        return coords
+    xs, ys = zip(*[c[:2] for c in coords])
+    center_x = (max(xs) + min(xs)) / 2.0
+    center_y = (max(ys) + min(ys)) / 2.0
+    scale = (max(max(xs) - min(xs), max(ys) - min(ys)) / 2.0) or 1.0
+    return [[(x - center_x) / scale, (y - center_y) / scale]
+            for x, y in zip(xs, ys)]
+
+
+def slice_layout(graph, layout, refine=False):
+    '''Layout for a subgraph based on the layout of a larger graph
+    (as a dictionary of vertex names and layout coordinates), rescaled
+    to fit the display area.  Vertices not in the larger layout are
+    placed near their neighbors.  Optionally refine the layout with
+    a short force-directed pass.  Returns None if the subgraph is
+    not covered by the layout.'''
+    coords = seed_layout(graph, layout)
+    if coords is None:
+        return None
+    if refine and graph.vcount() > 1:
+        coords = warm_start_layout(graph, 'fr', coords).coords
+    return rescale(coords)
+
+
+def queue_job(key, version, **job):
+    '''Queue a calculation for the layout worker, to be cached under
+    the specified key for the network data version, unless it is
+    already queued or being calculated.  Returns True if the job
+    was queued.'''
+    # use the cache to avoid queueing the same calculation more than
+    # once, even across processes
+    if not cache.add(pending_key(key), True, PENDING_TIMEOUT, version=version):
+        return False
+    path = queue_dir()
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    job.update({'key': key, 'version': version})
+    # name jobs so they sort in the order they were queued, and write
+    # to a temporary file so workers never read a partial job
+    filename = os.path.join(path, '%017.6f-%s' % (time.time(),
+                                                  uuid.uuid4().hex))
+    with open('%s.tmp' % filename, 'wb') as jobfile:
+        pickle.dump(job, jobfile, pickle.HIGHEST_PROTOCOL)
+    os.rename('%s.tmp' % filename, '%s%s' % (filename, JOB_EXTENSION))
+    return True
+
+
+def schedule_layout(key, graph, algorithm, version, seed=None):
+    '''Queue a layout calculation for the layout worker, unless it is
+    already queued or being calculated.'''
+    if queue_job(key, version, graph=graph, algorithm=algorithm, seed=seed):
+        logger.debug('Queued %s graph layout for %s', algorithm, key)
+
+
+def queued_jobs():
+    '''Filenames of queued layout jobs, oldest first.'''
+    path = queue_dir()
+    if path is None:
+        return []
+    return sorted(glob.glob(os.path.join(path, '*%s' % JOB_EXTENSION)))
+
+
+def claim_job(filename):
+    '''Claim a queued layout job for the current worker.  Returns the
+    new filename of the job, or None if another worker claimed it.'''
+    claimed = '%s%s' % (filename[:-len(JOB_EXTENSION)], RUNNING_EXTENSION)
+    try:
+        # rename is atomic, so only one worker can claim a job
+        os.rename(filename, claimed)
+    except OSError:
+        return None
+    return claimed
+
+
+def run_job(filename):
+    '''Run a claimed job and cache the calculated layout, or the graph
+    metrics for metrics jobs (see :mod:`zurnatikl.apps.network.metrics`).
+    Jobs for a previous network data version are skipped, since the graph
+    has changed and the current graph's layout is queued separately
+    when it is requested.  Returns True if anything was calculated.'''
+    with open(filename, 'rb') as jobfile:
+        job = pickle.load(jobfile)
+    os.remove(filename)
+    key, graph, version = job['key'], job['graph'], job['version']
+    try:
+        if version != graph_cache.network_version():
+            logger.debug('Skipping job for %s; network data has changed',
+                         key)
+            return False
+        if graph_cache.get(key) is not None:
+            # already calculated by another job
+            return False
+        if job.get('metrics'):
+            # imported here, since metrics queues its jobs with this module
+            from .metrics import compute_metrics
+            graph_cache.set(key, compute_metrics(graph), version=version)
+            return True
+        coords = compute_layout(graph, job['algorithm'], job['seed'])
+        if coords is None:
+            return False
+        names = graph.vs['name'] if 'name' in graph.vs.attribute_names() else None
+        store_layout(key, names, coords, version)
+        return True
+    finally:
+        cache.delete(pending_key(key), version=version)
+
+
+def get_layout(key, graph, algorithm='auto', warm_start=True):
+    '''Get a layout for a graph, cached under the specified key for the
+    current network data version.  If the layout is not cached,
+    a layout calculation is queued for the layout worker and the last
+    good layout (or a fallback layout) is returned until it is ready;
+    layouts are only calculated on request if the layout queue is
+    disabled (see :func:`queue_dir`).  If warm start is enabled, layouts are calculated
+    starting from the last good layout for the graph, so that vertices
+    keep their positions when the graph changes.  Returns a tuple of
+    layout coordinates and a boolean indicating whether the layout
+    is current.'''
+    layout = graph_cache.get(key)
+    if layout is not None:
+        return layout, True
+
+    version = graph_cache.network_version()
+    names = graph.vs['name'] if 'name' in graph.vs.attribute_names() else None
+    # previous layout positions for the same graph, if any
+    seed = seed_layout(graph, cache.get(last_layout_key(key)))
+    if queue_dir() is None:
+        coords = compute_layout(graph, algorithm,
+                                seed if warm_start else None)
+        if coords is not None:
+            store_layout(key, names, coords, version)
+            return coords, True
+    else:
+        schedule_layout(key, graph, algorithm, version,
+                        seed if warm_start else None)
+
+    # use the previous layout until the new one is ready
+    if seed is not None:
+        return seed, False
+    return graph.layout(FALLBACK_LAYOUT).coords, False
@@ -0,0 +1,91 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from igraph import VertexClustering
+
+from zurnatikl.apps.journals.models import Journal
+from zurnatikl.apps.network import artifacts, communities, graph_cache, \
+    metrics
+from zurnatikl.apps.network.base_views import SigmajsJSONView
+from zurnatikl.apps.network.views import generate_network_graph
+from zurnatikl.apps.people.models import School
+
+
+class Command(BaseCommand):
+    '''Generate network graphs, layouts, community clusterings, and
+    centrality metrics and save them to disk, so that they can be loaded by the site
+    instead of being generated from the database on request.
+    Output is written to a new versioned directory in the configured
+    ``NETWORK_DATA_DIR``, which replaces the current network data
+    once all data has been written.'''
+    help = 'Generate network graphs, layouts, clusterings, and metrics and save them to disk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=2,
+            help='Number of previous versions of network data to keep ' +
+                 '(default: %(default)s)')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if artifacts.data_dir() is None:
+            raise CommandError('NETWORK_DATA_DIR is not configured')
+
+        data = {}
+        # the stored edges must match the graph built from them
+        issue_edges = Journal.contributor_network_edges()
+        self.add_graph(data, 'contributor-network',
+                       Journal.build_contributor_network(issue_edges),
+                       community_detection=True, centrality=True)
+        self.add_communities(data, 'contributor-network')
+        data['contributor-network-edges'] = issue_edges
+        data['contributor-network-years'] = \
+            Journal.contributor_network_year_edges(issue_edges)
+
+        start = time.time()
+        data['full-network'] = generate_network_graph()
+        self.report('full-network', data['full-network'], start)
+
+        for categorizer in School.CATEGORIZERS.iterkeys():
+            self.add_graph(data, 'schools-network-%s' % categorizer,
+                School.schools_network(School.objects.filter(categorizer=categorizer)))
+
+        path = artifacts.write(data, keep=options['keep'])
+        # cached network data should be reloaded from the new files
+        graph_cache.bump_network_version()
+        self.stdout.write('Network data written to %s' % path)
+
+    def add_graph(self, data, name, graph, community_detection=False,
+                  centrality=False):
+        # add a graph, its layout, and optionally community clustering
+        # and centrality metrics
+        start = time.time()
+        data[name] = graph
+        names = graph.vs['name']
+        data['%s-layout' % name] = {
+            'names': names,
+            'layout': graph.layout(SigmajsJSONView.layout).coords
+        }
+        if community_detection:
+            clustering = communities.detect_communities(
+                graph, SigmajsJSONView.community_algorithm)
+            data['%s-community' % name] = dict(clustering, names=names)
+        if centrality:
+            data['%s-metrics' % name] = metrics.compute_metrics(graph)
+        self.report(name, graph, start)
+
+    def add_communities(self, data, name):
+        # add the coarse graph with each detected community contracted
+        # to a single vertex, and the subgraph for each community
+        start = time.time()
+        graph = data[name]
+        membership = data['%s-community' % name]['membership']
+        coarse = communities.contract_communities(graph, membership)
+        data['%s-communities' % name] = coarse
+        data['%s-community-subgraphs' % name] = \
+            VertexClustering(graph, membership).subgraphs()
+        self.report('%s-communities' % name, coarse, start)
+
+    def report(self, name, graph, start):
+        if int(self.verbosity) > 1:
+            self.stdout.write('Generated %s (%d nodes, %d edges) in %.2f sec' %
+                (name, len(graph.vs), len(graph.es), time.time() - start))
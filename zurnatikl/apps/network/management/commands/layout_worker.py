@@ -0,0 +1,61 @@
+import multiprocessing
+import time
+
+from django import db
+from django.core.management.base import BaseCommand, CommandError
+
+from zurnatikl.apps.network import layouts
+
+
+def run_job(filename):
+    # run a layout or metrics job in a worker process
+    try:
+        return layouts.run_job(filename)
+    except Exception:
+        layouts.logger.exception('Error running job %s', filename)
+        return False
+
+
+class Command(BaseCommand):
+    '''Calculate network graph layouts and metrics queued by the site in
+    the configured ``NETWORK_LAYOUT_QUEUE`` directory, so that they are
+    never calculated in web server processes.  Runs until interrupted,
+    checking the queue for new jobs, unless ``--once`` is specified.'''
+    help = 'Calculate queued network graph layouts and metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+            help='Number of layouts to calculate in parallel ' +
+                 '(default: %(default)s)')
+        parser.add_argument('--interval', type=float, default=1.0,
+            help='Seconds to wait between checks for new jobs ' +
+                 '(default: %(default)s)')
+        parser.add_argument('--once', action='store_true',
+            help='Run the jobs currently queued and exit')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if layouts.queue_dir() is None:
+            raise CommandError('NETWORK_LAYOUT_QUEUE is not configured')
+
+        # don't share database connections with the worker processes
+        db.connections.close_all()
+        pool = multiprocessing.Pool(options['processes'])
+        try:
+            while True:
+                claimed = [job for job in
+                           (layouts.claim_job(f) for f in layouts.queued_jobs())
+                           if job is not None]
+                if claimed:
+                    start = time.time()
+                    results = pool.map(run_job, claimed)
+                    if int(self.verbosity) > 1:
+                        self.stdout.write('Ran %d of %d queued jobs in %.2f sec' %
+                            (sum(results), len(claimed), time.time() - start))
+                if options['once']:
+                    break
+                if not claimed:
+                    time.sleep(options['interval'])
+        finally:
+            pool.terminate()
+            pool.join()
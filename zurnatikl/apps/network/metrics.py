@@ -0,0 +1,128 @@
+# centrality metrics for network graphs.  Metrics are too slow to
+# calculate on request for the larger networks, so they are calculated
+# offline (see the build_networks manage command) or by the layout worker
+# once per network data version, and stored as compact arrays aligned with
+# the graph vertices; views annotate graphs with the stored values, and
+# serve graphs without metrics until they are ready.
+import array
+from collections import OrderedDict
+import logging
+import time
+
+from django.conf import settings
+
+from . import artifacts, graph_cache, layouts
+from .communities import edge_weights, undirected_projection
+
+
+logger = logging.getLogger(__name__)
+
+#: default path length cutoff for approximate betweenness; paths
+#: longer than this are not considered
+BETWEENNESS_CUTOFF = 4
+
+
+def betweenness_cutoff():
+    '''Path length cutoff for approximate betweenness centrality
+    (``NETWORK_BETWEENNESS_CUTOFF`` in django settings); None for
+    exact betweenness.'''
+    return getattr(settings, 'NETWORK_BETWEENNESS_CUTOFF', BETWEENNESS_CUTOFF)
+
+
+def pagerank(graph):
+    return graph.pagerank(weights=edge_weights(graph))
+
+
+def eigenvector_centrality(graph):
+    # eigenvector centrality is not well-defined for directed graphs
+    # with vertices that have no incoming edges; use undirected graph
+    if graph.is_directed():
+        graph = undirected_projection(graph)
+    return graph.eigenvector_centrality(directed=False, scale=True,
+                                        weights=edge_weights(graph))
+
+
+def betweenness(graph):
+    # only paths up to the cutoff length are considered, which is
+    # much faster on large graphs and close enough for ranking
+    return graph.betweenness(directed=False, cutoff=betweenness_cutoff())
+
+
+def closeness(graph):
+    return graph.closeness(mode='all')
+
+
+def kcore(graph):
+    return graph.coreness(mode='all')
+
+
+#: available metrics; method and array typecode for storing values
+METRICS = OrderedDict([
+    ('pagerank', (pagerank, 'f')),
+    ('eigenvector_centrality', (eigenvector_centrality, 'f')),
+    ('betweenness', (betweenness, 'f')),
+    ('closeness', (closeness, 'f')),
+    ('kcore', (kcore, 'i')),
+])
+
+
+def compute_metrics(graph):
+    '''Calculate all :data:`METRICS` for a graph.  Returns a dictionary
+    with an array of values for each metric and the list of vertex names,
+    so the values can be matched to the graph they were generated from.'''
+    data = {'names': graph.vs['name']}
+    for name, (method, typecode) in METRICS.iteritems():
+        start = time.time()
+        data[name] = array.array(typecode, method(graph))
+        logger.debug('Calculated %s in %.2f sec', name, time.time() - start)
+    return data
+
+
+def graph_metrics(name, get_graph):
+    '''Metrics for a named graph, from the precomputed network data
+    if it matches the current graph, otherwise calculated and cached
+    for the current network data version.  Metrics are calculated by
+    the layout worker if a layout queue is configured (see
+    :mod:`zurnatikl.apps.network.layouts`); returns None until they
+    are ready.  Takes a method to get the graph, so that the graph is
+    only loaded when metrics are not already cached.'''
+    cache_key = '%s-metrics' % name
+    data = graph_cache.get(cache_key)
+    if data is None:
+        version = graph_cache.network_version()
+        graph = get_graph()
+        data = artifacts.load(cache_key, stale=True)
+        if artifacts.aligned(graph, data, 'names') is None:
+            if layouts.queue_dir() is not None:
+                if layouts.queue_job(cache_key, version, graph=graph,
+                                     metrics=True):
+                    logger.debug('Queued metrics for %s', name)
+                return None
+            data = compute_metrics(graph)
+        graph_cache.set(cache_key, data, version=version)
+    return data
+
+
+def has_metrics(graph):
+    '''Check if graph vertices are annotated with all :data:`METRICS`.'''
+    return set(METRICS).issubset(graph.vs.attribute_names())
+
+
+def metric_value(value):
+    # convert stored value for output, without float32 noise
+    if isinstance(value, float):
+        return float('%.6g' % value)
+    return value
+
+
+def annotate_metrics(graph, data):
+    '''Annotate graph vertices with metric values.  Vertices are
+    matched by name, so the graph can be a subgraph of the graph the
+    metrics were calculated for (e.g., an egograph).'''
+    index = dict((name, i) for i, name in enumerate(data['names']))
+    positions = [index.get(name) for name in graph.vs['name']]
+    for metric in METRICS:
+        values = data[metric]
+        graph.vs[metric] = [metric_value(values[i]) if i is not None else None
+                            for i in positions]
+    return graph
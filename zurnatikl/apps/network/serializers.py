@@ -0,0 +1,290 @@
+# streaming serializers for exporting network graphs as GraphML, GML,
+# and GEXF.  Output is generated incrementally, so it can be returned
+# via a streaming response, and the graph is never modified.
+from datetime import datetime
+import re
+import unicodedata
+from xml.sax.saxutils import escape, quoteattr
+
+from zurnatikl import __version__
+
+
+#: size of output chunks, in bytes
+CHUNK_SIZE = 64 * 1024
+
+
+def chunked(lines, size=CHUNK_SIZE):
+    '''Combine a sequence of unicode strings into chunks of UTF-8 encoded
+    output of approximately the specified size.'''
+    chunk = []
+    length = 0
+    for line in lines:
+        line = line.encode('utf-8')
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def attribute_value(value):
+    '''Normalize an attribute value for output.  Returns None for empty
+    values, which should not be included in the output; byte strings are
+    decoded as UTF-8 and lists are converted to comma-separated strings.'''
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    elif isinstance(value, (list, tuple)):
+        value = u', '.join(unicode(v) for v in value)
+    if value is None or value == u'':
+        return None
+    return value
+
+
+def attribute_types(seq):
+    '''Determine the type of each attribute of a vertex or edge sequence
+    from the non-empty values present, as one of boolean, int, float, or
+    string.  Attributes with no values are not included.'''
+    types = {}
+    for obj in seq:
+        for name, value in obj.attributes().iteritems():
+            value = attribute_value(value)
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                value_type = 'boolean'
+            elif isinstance(value, (int, long)):
+                value_type = 'int'
+            elif isinstance(value, float):
+                value_type = 'float'
+            else:
+                value_type = 'string'
+
+            current_type = types.get(name, value_type)
+            if current_type != value_type:
+                if set([current_type, value_type]) == set(['int', 'float']):
+                    value_type = 'float'
+                else:
+                    value_type = 'string'
+            types[name] = value_type
+    return types
+
+
+def attributes(obj, types, exclude=None):
+    '''Non-empty attributes for a vertex or edge, in a consistent order,
+    as tuples of name, value, and type.'''
+    attrs = obj.attributes()
+    for name in sorted(types):
+        if exclude and name in exclude:
+            continue
+        value = attribute_value(attrs.get(name))
+        if value is not None:
+            yield name, value, types[name]
+
+
+def xml_value(value, value_type):
+    # format an attribute value for xml output; returns unescaped text
+    if value_type == 'boolean':
+        return u'true' if value else u'false'
+    return unicode(value)
+
+
+#: attribute types for GraphML
+GRAPHML_TYPES = {'boolean': 'boolean', 'int': 'long', 'float': 'double',
+                 'string': 'string'}
+
+
+def graphml_lines(graph):
+    # generate graphml output, one line at a time
+    vertex_types = attribute_types(graph.vs)
+    edge_types = attribute_types(graph.es)
+
+    yield u'<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield u'<graphml xmlns="http://graphml.graphdrawing.org/xmlns"\n' + \
+        u'         xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n' + \
+        u'         xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns ' + \
+        u'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n'
+    yield u'<!-- Created by zurnatikl %s -->\n' % __version__
+    for prefix, domain, types in [('v', 'node', vertex_types),
+                                  ('e', 'edge', edge_types)]:
+        for name in sorted(types):
+            yield u'  <key id=%s for="%s" attr.name=%s attr.type="%s"/>\n' % \
+                (quoteattr('%s_%s' % (prefix, name)), domain,
+                 quoteattr(name), GRAPHML_TYPES[types[name]])
+
+    yield u'  <graph id="G" edgedefault="%s">\n' % \
+        ('directed' if graph.is_directed() else 'undirected')
+    for vtx in graph.vs:
+        yield u'    <node id="n%d">\n' % vtx.index
+        for name, value, value_type in attributes(vtx, vertex_types):
+            yield u'      <data key=%s>%s</data>\n' % \
+                (quoteattr('v_%s' % name), escape(xml_value(value, value_type)))
+        yield u'    </node>\n'
+    for edge in graph.es:
+        yield u'    <edge source="n%d" target="n%d">\n' % (edge.source, edge.target)
+        for name, value, value_type in attributes(edge, edge_types):
+            yield u'      <data key=%s>%s</data>\n' % \
+                (quoteattr('e_%s' % name), escape(xml_value(value, value_type)))
+        yield u'    </edge>\n'
+    yield u'  </graph>\n'
+    yield u'</graphml>\n'
+
+
+def graphml(graph):
+    '''Serialize a graph as GraphML, as a generator of UTF-8 encoded
+    chunks.  Empty attributes are not included.'''
+    return chunked(graphml_lines(graph))
+
+
+def gml_key(name):
+    # GML keys may only include alphanumeric characters and must
+    # start with a letter
+    key = re.sub(r'[^A-Za-z0-9]', '', name)
+    if not key or not key[0].isalpha():
+        key = 'a%s' % key
+    return key
+
+
+def gml_value(value, value_type):
+    # format an attribute value for gml output
+    if value_type == 'boolean':
+        return '1' if value else '0'
+    if value_type in ['int', 'float']:
+        return unicode(value)
+    # gml is an ascii format; convert accented characters to
+    # non-accented equivalents where possible
+    value = unicodedata.normalize('NFD', unicode(value)) \
+                       .encode('ascii', 'ignore')
+    return u'"%s"' % value.replace('"', '&quot;')
+
+
+def gml_lines(graph):
+    # generate gml output, one line at a time
+    vertex_types = attribute_types(graph.vs)
+    edge_types = attribute_types(graph.es)
+
+    yield u'Creator "zurnatikl %s %s"\n' % (__version__, datetime.now())
+    yield u'graph\n[\n'
+    yield u'  directed %d\n' % (1 if graph.is_directed() else 0)
+    for vtx in graph.vs:
+        yield u'  node\n  [\n    id %d\n' % vtx.index
+        for name, value, value_type in attributes(vtx, vertex_types,
+                                                  exclude=['id']):
+            yield u'    %s %s\n' % (gml_key(name), gml_value(value, value_type))
+        yield u'  ]\n'
+    for edge in graph.es:
+        yield u'  edge\n  [\n    source %d\n    target %d\n' % \
+            (edge.source, edge.target)
+        for name, value, value_type in attributes(edge, edge_types,
+                                                  exclude=['source', 'target']):
+            yield u'    %s %s\n' % (gml_key(name), gml_value(value, value_type))
+        yield u'  ]\n'
+    yield u']\n'
+
+
+def gml(graph):
+    '''Serialize a graph as GML, as a generator of output chunks.
+    Empty attributes are not included, and unicode values are converted
+    to ascii.'''
+    return chunked(gml_lines(graph))
+
+
+#: attribute types for GEXF
+GEXF_TYPES = {'boolean': 'boolean', 'int': 'long', 'float': 'double',
+              'string': 'string'}
+
+
+def gexf_lines(graph):
+    # generate gexf output, one line at a time
+    vertex_types = attribute_types(graph.vs)
+    edge_types = attribute_types(graph.es)
+    # name and label are used for node id and label; weight and label
+    # are supported natively for edges
+    vertex_exclude = ['name', 'label']
+    edge_exclude = ['weight', 'label']
+    vertex_attr_ids = dict((name, i) for i, name in enumerate(sorted(
+        n for n in vertex_types if n not in vertex_exclude)))
+    edge_attr_ids = dict((name, i) for i, name in enumerate(sorted(
+        n for n in edge_types if n not in edge_exclude)))
+    has_names = 'name' in vertex_types
+
+    def node_id(index):
+        if has_names:
+            return quoteattr(unicode(attribute_value(graph.vs[index]['name'])))
+        return '"%d"' % index
+
+    yield u'<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield u'<gexf xmlns="http://www.gexf.net/1.2draft" version="1.2">\n'
+    yield u'  <meta lastmodifieddate="%s">\n' % datetime.now().strftime('%Y-%m-%d')
+    yield u'    <creator>zurnatikl %s</creator>\n' % __version__
+    yield u'  </meta>\n'
+    yield u'  <graph defaultedgetype="%s" mode="static">\n' % \
+        ('directed' if graph.is_directed() else 'undirected')
+    for cls, types, attr_ids in [('node', vertex_types, vertex_attr_ids),
+                                 ('edge', edge_types, edge_attr_ids)]:
+        if attr_ids:
+            yield u'    <attributes class="%s">\n' % cls
+            for name in sorted(attr_ids):
+                yield u'      <attribute id="%d" title=%s type="%s"/>\n' % \
+                    (attr_ids[name], quoteattr(name), GEXF_TYPES[types[name]])
+            yield u'    </attributes>\n'
+
+    yield u'    <nodes>\n'
+    for vtx in graph.vs:
+        label = attribute_value(vtx['label']) if 'label' in vertex_types else None
+        yield u'      <node id=%s%s>\n' % (node_id(vtx.index),
+            u' label=%s' % quoteattr(unicode(label)) if label is not None else u'')
+        attvalues = [u'          <attvalue for="%d" value=%s/>\n' %
+                     (vertex_attr_ids[name],
+                      quoteattr(xml_value(value, value_type)))
+                     for name, value, value_type in attributes(
+                        vtx, vertex_types, exclude=vertex_exclude)]
+        if attvalues:
+            yield u'        <attvalues>\n'
+            for attvalue in attvalues:
+                yield attvalue
+            yield u'        </attvalues>\n'
+        yield u'      </node>\n'
+    yield u'    </nodes>\n'
+
+    yield u'    <edges>\n'
+    for edge in graph.es:
+        attrs = edge.attributes()
+        extra = u''
+        if attrs.get('weight') is not None:
+            extra += u' weight="%s"' % attrs['weight']
+        if attribute_value(attrs.get('label')) is not None:
+            extra += u' label=%s' % quoteattr(attribute_value(attrs['label']))
+        yield u'      <edge id="%d" source=%s target=%s%s>\n' % \
+            (edge.index, node_id(edge.source), node_id(edge.target), extra)
+        attvalues = [u'          <attvalue for="%d" value=%s/>\n' %
+                     (edge_attr_ids[name],
+                      quoteattr(xml_value(value, value_type)))
+                     for name, value, value_type in attributes(
+                        edge, edge_types, exclude=edge_exclude)]
+        if attvalues:
+            yield u'        <attvalues>\n'
+            for attvalue in attvalues:
+                yield attvalue
+            yield u'        </attvalues>\n'
+        yield u'      </edge>\n'
+    yield u'    </edges>\n'
+    yield u'  </graph>\n'
+    yield u'</gexf>\n'
+
+
+def gexf(graph):
+    '''Serialize a graph as GEXF, as a generator of UTF-8 encoded
+    chunks.  Empty attributes are not included.'''
+    return chunked(gexf_lines(graph))
+
+
+#: supported export formats; serializer method and mimetype
+FORMATS = {
+    'graphml': (graphml, 'application/graphml+xml'),
+    # gml is an ascii format; unclear if it has a unique mimetype
+    'gml': (gml, 'text/plain'),
+    'gexf': (gexf, 'application/gexf+xml'),
+}
@@ -0,0 +1,71 @@
+# signal handlers to update the network data version whenever
+# data used to generate network graphs changes
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from zurnatikl.apps.geo.models import Location
+from zurnatikl.apps.journals.models import Journal, Issue, Item, \
+    CreatorName, Genre, PlaceName
+from zurnatikl.apps.people.models import Person, School
+from . import artifacts, graph_cache
+
+
+# Changes to the contributor network are applied to the cached network
+# in place and update the network data version when they are committed
+# (see :mod:`zurnatikl.apps.journals.signals`), so only precomputed
+# network data needs to be marked out of date for them here; other
+# changes also update the version, carrying over the contributor network.
+
+#: models and relations used to generate the contributor network
+CONTRIBUTOR_SENDERS = [
+    Journal, Issue, Item, CreatorName, Person, School,
+    Issue.editors.through, Item.translators.through,
+    Journal.schools.through, Person.schools.through,
+]
+#: other models and relations used to generate network graphs
+NETWORK_SENDERS = [
+    Location, Genre, PlaceName,
+    Issue.contributing_editors.through, Issue.mailing_addresses.through,
+    Item.genre.through, Item.persons_mentioned.through,
+    Item.addresses.through, School.locations.through,
+    Person.dwellings.through,
+]
+
+
+def network_data_changed():
+    # precomputed network data no longer matches the database
+    artifacts.invalidate()
+    # the cached contributor network has not changed, so it can be
+    # carried over
+    graph_cache.bump_network_version(carry_over=[
+        Journal.contributor_network_cache_key,
+        Journal.contributor_edges_cache_key
+    ])
+
+
+def data_changed(sender):
+    # update network data once the change is committed
+    if sender in CONTRIBUTOR_SENDERS:
+        transaction.on_commit(artifacts.invalidate)
+    else:
+        transaction.on_commit(network_data_changed)
+
+
+def update_network_version(sender, **kwargs):
+    if not kwargs.get('raw'):
+        data_changed(sender)
+
+
+def update_network_version_m2m(sender, action, **kwargs):
+    if action.startswith('post_'):
+        data_changed(sender)
+
+
+for model in CONTRIBUTOR_SENDERS + NETWORK_SENDERS:
+    if model._meta.auto_created:
+        # through table for a many-to-many relation
+        m2m_changed.connect(update_network_version_m2m, sender=model)
+    else:
+        post_save.connect(update_network_version, sender=model)
+        post_delete.connect(update_network_version, sender=model)
@@ -2,6 +2,10 @@ function init_sigma_graph(opts) {
 
     var defaults = {
         // required configuration: json_url
+        // optional: binary_url, to load the more compact binary format
+        // when the browser supports it; overview_url, to load and
+        // display a small overview of the graph (e.g., with communities
+        // contracted to single nodes) while the full graph loads
 
         // sigma settings
         sigma: {
@@ -91,11 +95,47 @@ function init_sigma_graph(opts) {
         settings: settings.sigma
     });
 
-    console.log('loading data');
-    status.text('Loading data');
+    // load graph data via binary format if available, otherwise json
+    var parse = sigma.parsers.json,
+        data_url = settings.json_url;
+    if (settings.binary_url && sigma.parsers.binary &&
+        typeof ArrayBuffer !== 'undefined') {
+        parse = sigma.parsers.binary;
+        data_url = settings.binary_url;
+    }
+
+    if (settings.overview_url) {
+        console.log('loading overview');
+        status.text('Loading overview');
+        $.getJSON(settings.overview_url).done(function(data) {
+            s.graph.clear();
+            s.graph.read(data);
+            $.each(s.graph.edges(), function(i, edge) {
+                edge.type = 'curve';
+            });
+            $('#graph-container').trigger('graph:overview_loaded');
+            s.refresh();
+        }).always(load_data);
+    } else {
+        load_data();
+    }
 
-    // load graph data via json
-    sigma.parsers.json(settings.json_url, s, function() {
+    function load_data() {
+        // load the full graph; replaces the overview, if any
+        console.log('loading data');
+        status.text('Loading data');
+        if (parse === sigma.parsers.binary) {
+            // fall back to json if binary data can't be loaded
+            parse(data_url, s, data_loaded, function(xhr, err) {
+                console.log('binary data not loaded (' + err + '); loading json');
+                sigma.parsers.json(settings.json_url, s, data_loaded);
+            });
+        } else {
+            parse(data_url, s, data_loaded);
+        }
+    }
+
+    function data_loaded() {
         console.log('data loaded (' + s.graph.nodes().length + ' nodes, ' +
             s.graph.edges().length + ' edges)');
         $('#graph-container').trigger('graph:data_loaded');
@@ -123,7 +163,7 @@ function init_sigma_graph(opts) {
         s.refresh();
 
         $('#graph-status').hide();
-    });
+    }
 
     // configure fullscreen button
     s.renderers[0].fullScreen({
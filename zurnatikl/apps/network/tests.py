@@ -1,15 +1,29 @@
 # -*- coding: utf-8 -*-
 import codecs
+from cStringIO import StringIO
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.http import StreamingHttpResponse
-from mock import patch
+from lxml import etree
+from igraph import Graph, VertexClustering
+from mock import Mock, patch
 
 from zurnatikl.apps.network.views import generate_network_graph
-from zurnatikl.apps.network.base_views import CsvResponseMixin
+from zurnatikl.apps.network import artifacts, binary, communities, \
+    checks, graph_cache, layouts, metrics, serializers
+from zurnatikl.apps.network.base_views import CsvResponseMixin, \
+    accepted_encodings
+from zurnatikl.apps.network.utils import node_link_data, shortest_path
 from zurnatikl.apps.geo.models import Location
 from zurnatikl.apps.journals.models import Journal, Issue, Item
-from zurnatikl.apps.people.models import Person, School
+from zurnatikl.apps.people.models import Name, Person, School
 
 class GenerateNetworkTest(TestCase):
     fixtures = ['test_network.json']
@@ -61,6 +75,24 @@ class GenerateNetworkTest(TestCase):
         self.assertEqual(yugen.title.encode('utf-8'), ynode['label'],
             'unicode should be encoded for output by default')
 
+    def test_generate_network_queries(self):
+        # node attributes and edges are retrieved in bulk, so the number
+        # of queries should not depend on the amount of data
+        with self.assertNumQueries(25):
+            graph = generate_network_graph()
+
+        # all nodes and edges should match per-object network data
+        for model in [Location, Person, School, Journal, Issue, Item]:
+            for obj in model.objects.all():
+                node = graph.vs.find(name=obj.network_id)
+                for k, v in obj.network_attributes.iteritems():
+                    if isinstance(v, unicode):
+                        v = v.encode('utf-8')
+                    self.assertEqual(v, node[k])
+                if obj.has_network_edges:
+                    edge_count = len(graph.es.select(_source=node.index))
+                    self.assertEqual(len(obj.network_edges), edge_count)
+
     def test_ascii_output(self):
         graph = generate_network_graph(use_ascii=True)
         # check for journal title with unicode character Yūgen
@@ -90,12 +122,42 @@ class GenerateNetworkTest(TestCase):
         disposition = response['Content-Disposition']
         self.assert_(disposition.endswith('.gml'),
             'content-disposition filename should end in .gml')
-        self.assertContains(response, 'Creator "igraph version',
-            msg_prefix='output should be in gml xml format')
+        self.assertContains(response, 'Creator "zurnatikl',
+            msg_prefix='output should be in gml format')
         self.assertContains(response, 'Yugen',
             msg_prefix='gml should convert unicode to ascii')
 
+    def test_export_network_gexf(self):
+        response = self.client.get(reverse('network:data', kwargs={'fmt': 'gexf'}))
+        self.assertEqual('application/gexf+xml', response['Content-Type'],
+            'mimetype should be set as gexf')
+        self.assert_(response['Content-Disposition'].endswith('.gexf'),
+            'content-disposition filename should end in .gexf')
+        yugen = Journal.objects.filter(title__startswith='Y', title__endswith='gen').first()
+        self.assertContains(response, '<gexf',
+            msg_prefix='output should be in gexf xml format')
+        self.assertContains(response, '<node id="%s"' % yugen.network_id,
+            msg_prefix='gexf node ids should be network ids')
+
+    def test_export_serializers(self):
+        graph = generate_network_graph()
+        attributes = [vtx.attributes() for vtx in graph.vs]
+        for fmt, (serialize, mimetype) in serializers.FORMATS.iteritems():
+            content = ''.join(serialize(graph))
+            # empty attributes should not be included
+            self.assertNotIn('""', content)
+            self.assertNotIn('None', content)
+            if fmt != 'gml':
+                self.assertNotIn('></data>', content)
+                # should be valid xml
+                etree.fromstring(content)
+        # exporting should not modify the graph
+        self.assertEqual(attributes, [vtx.attributes() for vtx in graph.vs])
+
 
+# graph views calculate layouts on request in tests, instead of
+# queueing them for the layout worker
+@override_settings(NETWORK_LAYOUT_QUEUE=None)
 class NetworkViewsTestCase(TestCase):
     fixtures = ['test_network.json']
 
@@ -115,6 +177,105 @@ class NetworkViewsTestCase(TestCase):
         self.assert_('edges' in response.content)
         self.assert_('nodes' in response.content)
 
+    def test_cached_json(self):
+        cache.clear()
+        url = reverse('network:schools-json', kwargs={'slug': 'donald-allen'})
+        response = self.client.get(url)
+        # encoded json is cached; serving it again requires no queries
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url)
+        self.assertEqual(response.content, cached_response.content)
+        self.assertEqual('application/json', cached_response['content-type'])
+
+    def test_schools_binary(self):
+        cache.clear()
+        json_data = json.loads(self.client.get(reverse('network:schools-json',
+            kwargs={'slug': 'donald-allen'})).content)
+        response = self.client.get(reverse('network:schools-binary',
+            kwargs={'slug': 'donald-allen'}))
+        self.assertEqual(binary.CONTENT_TYPE, response['content-type'])
+        data = binary.decode(response.content)
+        # binary data has the same graph and layout as the json
+        self.assertEqual(len(json_data['nodes']), len(data['nodes']))
+        self.assertEqual(len(json_data['edges']), len(data['edges']))
+        for json_node, node in zip(json_data['nodes'], data['nodes']):
+            self.assertEqual(json_node['label'], node['label'])
+            self.assertEqual(json_node['type'], node['type'])
+            self.assertAlmostEqual(json_node['x'], node['x'], places=2)
+        self.assertLess(len(response.content), len(json.dumps(json_data)))
+
+    def test_community_detection(self):
+        cache.clear()
+        url = reverse('journals:contributor-network-json')
+        data = json.loads(self.client.get(url).content)
+        self.assertEqual('walktrap', data['community_detection']['algorithm'])
+        self.assert_('modularity' in data['community_detection'])
+        self.assert_(all('community' in node for node in data['nodes']))
+
+        # algorithm can be selected by request parameter
+        data = json.loads(self.client.get(url, {'community': 'multilevel'}).content)
+        self.assertEqual('multilevel', data['community_detection']['algorithm'])
+        self.assert_(graph_cache.get('%s-community-multilevel' % url))
+        # unknown algorithm uses the default
+        data = json.loads(self.client.get(url, {'community': 'bogus'}).content)
+        self.assertEqual('walktrap', data['community_detection']['algorithm'])
+
+    def test_json_compression(self):
+        cache.clear()
+        url = reverse('network:schools-json', kwargs={'slug': 'donald-allen'})
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        gzip_response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual('gzip', gzip_response['Content-Encoding'])
+        self.assertEqual(response.content, gzip.GzipFile(
+            fileobj=StringIO(gzip_response.content)).read())
+        self.assertNotEqual(response['ETag'], gzip_response['ETag'])
+
+        # encodings with a quality value of 0 are not acceptable
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='*;q=0.5, gzip;q=0')
+        self.assertNotEqual('gzip', response.get('Content-Encoding'))
+
+    def test_accepted_encodings(self):
+        self.assertEqual({'gzip': 1.0, 'br': 0.5, 'identity': 0.0},
+                         accepted_encodings('gzip, br;q=0.5, identity; q=0'))
+        self.assertEqual({'deflate': 1.0},
+                         accepted_encodings('deflate, gzip;q=bogus, '))
+        self.assertEqual({}, accepted_encodings(''))
+
+    def test_json_etag(self):
+        cache.clear()
+        url = reverse('network:schools-json', kwargs={'slug': 'donald-allen'})
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assert_(etag)
+
+        # matching etag should return not modified without generating data
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+        # etag for a compressed encoding matches when the same encoding
+        # is negotiated, and the response has the negotiated etag
+        gzip_etag = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=gzip_etag,
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(gzip_etag, response['ETag'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=gzip_etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+
+        # etag changes when network data changes
+        Location.objects.first().save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
     def test_egograph_export(self):
         # basic testing that the view is configured correctly
 
@@ -128,7 +289,408 @@ class NetworkViewsTestCase(TestCase):
         response = self.client.get(reverse('network:schools-export',
             kwargs={'slug': 'donald-allen', 'fmt': 'gml'}))
         self.assertEqual(response['content-type'], 'text/plain')
-        self.assertContains(response, 'Creator "igraph version')
+        self.assertContains(response, 'Creator "zurnatikl')
+
+
+class NodeLinkDataTest(TestCase):
+
+    def test_node_link_data(self):
+        graph = Graph([(0, 1), (1, 2), (3, 4)], directed=True)
+        graph.vs['name'] = ['a', 'b', 'c', 'd', 'e']
+        graph.es['label'] = ['x', 'y', 'z']
+        cluster = VertexClustering(graph, [0, 0, 0, 1, 1])
+        layout = graph.layout('circle')
+        data = node_link_data(graph, layout, cluster)
+
+        self.assertTrue(data['directed'])
+        self.assertEqual(len(graph.vs), len(data['nodes']))
+        for vtx, node in zip(graph.vs, data['nodes']):
+            self.assertEqual(vtx.index, node['id'])
+            self.assertEqual(vtx['name'], node['name'])
+            self.assertEqual(cluster.membership[vtx.index], node['community'])
+            self.assertEqual(list(layout[vtx.index]), [node['x'], node['y']])
+        for edge, edge_data in zip(graph.es, data['edges']):
+            self.assertEqual(edge.index, edge_data['id'])
+            self.assertEqual(edge.source, edge_data['source'])
+            self.assertEqual(edge.target, edge_data['target'])
+            self.assertEqual(edge['label'], edge_data['label'])
+
+
+class ShortestPathTest(TestCase):
+
+    def test_shortest_path(self):
+        # direct weak connection and a two-step strong connection
+        graph = Graph([(0, 1), (0, 2), (2, 1), (3, 4)], directed=True)
+        graph.vs['name'] = ['a', 'b', 'c', 'd', 'e']
+        graph.es['weight'] = [1, 5, 5, 1]
+        path = shortest_path(graph, 1, 0)
+        self.assertEqual(['a', 'b'], path.vs['name'])
+        self.assertEqual([1, 0], path.vs['step'])
+        self.assertEqual(1, len(path.es))
+
+        # weighted path prefers stronger connections
+        distances = [1.0 / w for w in graph.es['weight']]
+        path = shortest_path(graph, 0, 1, distances)
+        self.assertEqual([0, 2, 1], path.vs['step'])
+        self.assertEqual(2, len(path.es))
+
+        # no path
+        path = shortest_path(graph, 0, 3)
+        self.assertEqual(0, len(path.vs))
+        self.assertEqual([], path.vs['step'])
+        # same vertex
+        self.assertEqual(['a'], shortest_path(graph, 0, 0).vs['name'])
+
+
+class BinaryFormatTest(TestCase):
+
+    def test_encode_decode(self):
+        data = {
+            'directed': True,
+            'multigraph': False,
+            'nodes': [
+                {'id': 0, 'x': 0.5, 'y': -1.0, 'type': 'Person',
+                 'label': u'Ren\xe9', 'degree': 3, 'community': 0},
+                {'id': 1, 'x': 1.0, 'y': 2.0, 'type': 'Journal',
+                 'label': 'Yugen', 'degree': 1, 'community': 1,
+                 'schools': ['Beat', 'Black Mountain']},
+                {'id': 2, 'x': 0, 'y': 0, 'label': 'Place', 'degree': 2},
+            ],
+            'edges': [
+                {'id': 0, 'source': 0, 'target': 1, 'label': 'editor',
+                 'weight': 2},
+                {'id': 1, 'source': 2, 'target': 0, 'label': 'editor'},
+            ]
+        }
+        content = binary.encode(data)
+        self.assertEqual(binary.MAGIC, content[:4])
+        self.assertEqual(0, len(content) % 4)
+        self.assertEqual(data, binary.decode(content))
+
+        self.assertRaises(ValueError, binary.decode, 'not a graph')
+
+
+class CommunitiesTest(TestCase):
+
+    def test_detect_communities(self):
+        # two connected triangles
+        graph = Graph([(0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3), (2, 3)],
+                      directed=True)
+        graph.es['weight'] = [2, 2, 2, 2, 2, 2, 1]
+        for algorithm in communities.ALGORITHMS:
+            clustering = communities.detect_communities(graph, algorithm)
+            self.assertEqual(algorithm, clustering['algorithm'])
+            self.assertEqual(len(graph.vs), len(clustering['membership']))
+            self.assert_(isinstance(clustering['modularity'], float))
+        clustering = communities.detect_communities(graph, 'multilevel')
+        self.assertEqual([0, 0, 0, 1, 1, 1], clustering['membership'])
+        # projection does not modify the original graph
+        self.assertTrue(graph.is_directed())
+
+
+class MetricsTest(TestCase):
+
+    def test_compute_metrics(self):
+        # star with a connected pair of leaves
+        graph = Graph([(0, 1), (0, 2), (0, 3), (0, 4), (1, 2)], directed=True)
+        graph.vs['name'] = ['a', 'b', 'c', 'd', 'e']
+        data = metrics.compute_metrics(graph)
+        self.assertEqual(graph.vs['name'], data['names'])
+        for metric in metrics.METRICS:
+            self.assertEqual(len(graph.vs), len(data[metric]))
+        # center is most central by every measure
+        for metric in ['eigenvector_centrality', 'betweenness', 'closeness']:
+            self.assertEqual(max(data[metric]), data[metric][0])
+        self.assertEqual([2, 2, 2, 1, 1], list(data['kcore']))
+
+        # annotate a subgraph, matching vertices by name
+        subgraph = graph.subgraph([1, 2])
+        subgraph.add_vertex(name='f')
+        metrics.annotate_metrics(subgraph, data)
+        self.assertEqual(data['kcore'][1], subgraph.vs[0]['kcore'])
+        self.assertAlmostEqual(data['pagerank'][2], subgraph.vs[1]['pagerank'])
+        self.assertEqual(None, subgraph.vs[2]['pagerank'])
+
+    @override_settings(NETWORK_LAYOUT_QUEUE=None)
+    def test_graph_metrics(self):
+        cache.clear()
+        graph = Graph([(0, 1), (1, 2)])
+        graph.vs['name'] = ['a', 'b', 'c']
+        get_graph = Mock(return_value=graph)
+        # without a layout queue, metrics are calculated immediately
+        data = metrics.graph_metrics('test', get_graph)
+        self.assertEqual(graph.vs['name'], data['names'])
+        # metrics are cached; graph is not needed again
+        metrics.graph_metrics('test', get_graph)
+        self.assertEqual(1, get_graph.call_count)
+
+        # graphs are only annotated with metrics once they are available
+        self.assertFalse(metrics.has_metrics(graph))
+        metrics.annotate_metrics(graph, data)
+        self.assertTrue(metrics.has_metrics(graph))
+
+    def test_background_metrics(self):
+        cache.clear()
+        graph = Graph([(0, 1), (1, 2)])
+        graph.vs['name'] = ['a', 'b', 'c']
+        queue = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, queue)
+        with override_settings(NETWORK_LAYOUT_QUEUE=queue):
+            # metrics are not available until calculated by the worker
+            self.assertEqual(None, metrics.graph_metrics('test', lambda: graph))
+            self.assertEqual(None, metrics.graph_metrics('test', lambda: graph))
+            # calculation is only queued once
+            jobs = layouts.queued_jobs()
+            self.assertEqual(1, len(jobs))
+            self.assertTrue(layouts.run_job(layouts.claim_job(jobs[0])))
+            data = metrics.graph_metrics('test', Mock())
+            self.assertEqual(graph.vs['name'], data['names'])
+
+
+# graph views calculate layouts on request in tests, instead of
+# queueing them for the layout worker
+@override_settings(NETWORK_LAYOUT_QUEUE=None)
+class LayoutsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.graph = Graph([(0, 1), (1, 2), (2, 0), (2, 3)])
+        self.graph.vs['name'] = ['a', 'b', 'c', 'd']
+
+    def test_get_layout(self):
+        # without a layout queue, layout is calculated immediately
+        layout, current = layouts.get_layout('test-layout', self.graph)
+        self.assertTrue(current)
+        self.assertEqual(len(self.graph.vs), len(layout))
+        self.assertEqual(layout, graph_cache.get('test-layout'))
+
+    def test_background_layout(self):
+        queue = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, queue)
+        with override_settings(NETWORK_LAYOUT_QUEUE=queue):
+            layout, current = layouts.get_layout('test-layout', self.graph)
+            # fallback layout returned while layout is calculated
+            self.assertFalse(current)
+            self.assertEqual(len(self.graph.vs), len(layout))
+            self.assertEqual(1, len(layouts.queued_jobs()))
+            # layout calculation is only queued once
+            layouts.get_layout('test-layout', self.graph)
+            jobs = layouts.queued_jobs()
+            self.assertEqual(1, len(jobs))
+
+            # run the job, as the layout worker would
+            claimed = layouts.claim_job(jobs[0])
+            self.assert_(claimed)
+            self.assertEqual(None, layouts.claim_job(jobs[0]))
+            self.assertEqual([], layouts.queued_jobs())
+            self.assertTrue(layouts.run_job(claimed))
+            self.assertFalse(os.path.exists(claimed))
+            coords, current = layouts.get_layout('test-layout', self.graph)
+            self.assertTrue(current)
+            self.assertEqual(len(self.graph.vs), len(coords))
+
+            # jobs queued for a previous data version are skipped
+            graph_cache.bump_network_version()
+            layouts.get_layout('test-layout', self.graph)
+            graph_cache.bump_network_version()
+            claimed = layouts.claim_job(layouts.queued_jobs()[0])
+            self.assertFalse(layouts.run_job(claimed))
+            self.assertEqual(None, graph_cache.get('test-layout'))
+
+    @patch.object(layouts, 'LAST_LAYOUT_MIN_VERTICES', 0)
+    def test_last_layout(self):
+        coords, current = layouts.get_layout('test-layout', self.graph)
+        # when the data changes, last good layout is used, with
+        # fallback positions for new vertices
+        graph_cache.bump_network_version()
+        self.graph.add_vertex('e')
+        queue = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, queue)
+        with override_settings(NETWORK_LAYOUT_QUEUE=queue):
+            layout, current = layouts.get_layout('test-layout', self.graph)
+        self.assertFalse(current)
+        self.assertEqual(coords, layout[:4])
+        self.assertEqual(5, len(layout))
+
+        # last layout is only kept for large graphs
+        with patch.object(layouts, 'LAST_LAYOUT_MIN_VERTICES', 10):
+            layouts.store_layout('small-layout', self.graph.vs['name'],
+                                 layout, graph_cache.network_version())
+        self.assertEqual(None, cache.get(layouts.last_layout_key('small-layout')))
+        self.assertEqual(layout, graph_cache.get('small-layout'))
+
+    @patch.object(layouts, 'LAST_LAYOUT_MIN_VERTICES', 0)
+    def test_warm_start(self):
+        coords, current = layouts.get_layout('test-layout', self.graph)
+        graph_cache.bump_network_version()
+        # new vertex connected to an existing vertex
+        self.graph.add_vertex('e')
+        self.graph.add_edge('e', 'a')
+        last = cache.get(layouts.last_layout_key('test-layout'))
+        seed = layouts.seed_layout(self.graph, last)
+        self.assertEqual(coords, seed[:4])
+        # new vertex starts near its neighbor
+        self.assertAlmostEqual(coords[0][0], seed[4][0], delta=1)
+        self.assertAlmostEqual(coords[0][1], seed[4][1], delta=1)
+
+        # new layout is calculated starting from the previous layout
+        with patch.object(layouts, 'warm_start_layout',
+                          wraps=layouts.warm_start_layout) as mockwarm_start:
+            layout, current = layouts.get_layout('test-layout', self.graph)
+            self.assertTrue(current)
+            self.assertEqual(5, len(layout))
+            args = mockwarm_start.call_args[0]
+            self.assertEqual(coords, args[2][:4])
+
+        # no warm start if most vertices are new
+        self.graph.add_vertices(['f', 'g', 'h', 'i', 'j'])
+        self.assertEqual(None, layouts.seed_layout(
+            self.graph, {'names': ['a'], 'layout': [[0, 0]]}))
+
+
+# graph views calculate layouts on request in tests, instead of
+# queueing them for the layout worker
+@override_settings(NETWORK_LAYOUT_QUEUE=None)
+class GraphCacheTest(TestCase):
+    fixtures = ['test_network.json']
+
+    def setUp(self):
+        cache.clear()
+
+    def test_versioned_cache(self):
+        version = graph_cache.network_version()
+        graph_cache.set('foo', 'bar')
+        self.assertEqual('bar', graph_cache.get('foo'))
+        self.assertEqual(version + 1, graph_cache.bump_network_version())
+        # value should no longer be available; the old value is left
+        # to expire
+        self.assertEqual(None, graph_cache.get('foo'))
+
+        # carry over
+        graph_cache.set('foo', 'bar')
+        graph_cache.set('baz', 'qux')
+        graph_cache.bump_network_version(carry_over=['foo'])
+        self.assertEqual('bar', graph_cache.get('foo'))
+        self.assertEqual(None, graph_cache.get('baz'))
+
+    def test_shared_cache_check(self):
+        local_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': '127.0.0.1:11211'}}
+        with override_settings(DEBUG=False, CACHES=local_cache):
+            self.assertEqual(['network.W001'],
+                             [w.id for w in checks.check_shared_cache(None)])
+        with override_settings(DEBUG=True, CACHES=local_cache):
+            self.assertEqual([], checks.check_shared_cache(None))
+        with override_settings(DEBUG=False, CACHES=shared_cache):
+            self.assertEqual([], checks.check_shared_cache(None))
+
+    def test_lru_cache(self):
+        lru = graph_cache.LRUCache(size=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(1, lru.get('a'))
+        # least recently used value is removed when size is exceeded
+        lru.set('c', 3)
+        self.assertEqual(None, lru.get('b'))
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(3, lru.get('c'))
+
+    # test cases run in a transaction that is never committed; handle
+    # data changes immediately
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_data_changes(self):
+        graph = Journal.contributor_network()
+        version = graph_cache.network_version()
+        response = self.client.get(reverse('journals:contributor-network-json'))
+        self.assert_(graph_cache.get('%s-layout' % response.request['PATH_INFO']))
+
+        # any change to network data should update the version
+        loc = Location.objects.first()
+        loc.save()
+        self.assert_(graph_cache.network_version() > version)
+        # contributor network is carried over, layout is not
+        self.assertEqual(len(graph.vs), len(Journal.contributor_network().vs))
+        self.assertEqual(None,
+            graph_cache.get('%s-layout' % response.request['PATH_INFO']))
+
+        # contributor network changes update the version once
+        version = graph_cache.network_version()
+        Person.objects.first().save()
+        self.assertEqual(version + 1, graph_cache.network_version())
+        # changes to data not used in network graphs are ignored
+        Name.objects.create(person=Person.objects.first(), first_name='Ted',
+                            last_name='Berrigan')
+        self.assertEqual(version + 1, graph_cache.network_version())
+
+
+# graph views calculate layouts on request in tests, instead of
+# queueing them for the layout worker
+@override_settings(NETWORK_LAYOUT_QUEUE=None)
+class BuildNetworksTest(TestCase):
+    fixtures = ['test_network.json']
+
+    def setUp(self):
+        cache.clear()
+        self.data_dir = tempfile.mkdtemp(prefix='zurnatikl-network-')
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_build_networks(self):
+        with override_settings(NETWORK_DATA_DIR=self.data_dir):
+            self.assertEqual(None, artifacts.load('contributor-network'))
+            call_command('build_networks', keep=1)
+            current = artifacts.current_dir()
+            self.assert_(os.path.islink(current))
+
+            graph = artifacts.load('contributor-network')
+            self.assertEqual(Journal.build_contributor_network().vs['name'],
+                             graph.vs['name'])
+            # edges are stored along with the graph built from them
+            edges = artifacts.load('contributor-network-edges')
+            self.assertEqual(sorted(graph.es['weight']), sorted(
+                Journal.build_contributor_network(edges).es['weight']))
+            layout = artifacts.load('contributor-network-layout')
+            self.assertEqual(len(graph.vs), len(layout['layout']))
+            self.assert_(artifacts.aligned(graph, layout, 'layout'))
+            for name in ['full-network', 'schools-network-donald-allen',
+                         'contributor-network-community',
+                         'contributor-network-metrics',
+                         'contributor-network-years']:
+                self.assert_(artifacts.load(name) is not None)
+            # coarse community graph and community subgraphs
+            coarse = artifacts.load('contributor-network-communities')
+            subgraphs = artifacts.load('contributor-network-community-subgraphs')
+            self.assertEqual(len(subgraphs), coarse.vcount())
+            self.assertEqual(len(graph.vs), sum(len(g.vs) for g in subgraphs))
+
+            # community views use the precomputed graphs
+            cache.clear()
+            with patch('zurnatikl.apps.journals.views.contract_communities') \
+                    as mockcontract:
+                response = self.client.get(
+                    reverse('journals:contributor-communities-json'))
+                self.assertEqual(coarse.vcount(),
+                                 len(json.loads(response.content)['nodes']))
+                self.assertFalse(mockcontract.called)
+
+            # build again; only one version should be kept
+            first_build = os.path.realpath(current)
+            call_command('build_networks', keep=1)
+            self.assertNotEqual(first_build, os.path.realpath(current))
+            self.assertFalse(os.path.exists(first_build))
+
+            # changing data should stop precomputed graphs from being used;
+            # layouts can still be used if they match the current graph
+            Location.objects.first().save()
+            self.assertEqual(None, artifacts.load('contributor-network'))
+            layout = artifacts.load('contributor-network-layout', stale=True)
+            self.assert_(artifacts.aligned(Journal.contributor_network(),
+                                           layout, 'layout'))
 
 
 class CsvResponseMixinTest(TestCase):
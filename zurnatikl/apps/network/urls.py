@@ -6,13 +6,16 @@ urlpatterns = [
     url(r'^$', TemplateView.as_view(template_name="network/index.html"),
         name='index'),
 
-    url(r'^data.(?P<fmt>gml|graphml)$', views.FullNetworkExport.as_view(),
+    url(r'^data.(?P<fmt>gml|graphml|gexf)$', views.FullNetworkExport.as_view(),
         name='data'),
     # network graphs based on "schools"
     url(r'^schools/(?P<slug>[\w-]+)/$', views.SchoolsNetwork.as_view(),
         name='schools'),
     url(r'^schools/(?P<slug>[\w-]+).json$', views.SchoolsNetworkJSON.as_view(),
         name='schools-json'),
-    url(r'^schools/(?P<slug>[\w-]+).(?P<fmt>gml|graphml)$',
+    url(r'^schools/(?P<slug>[\w-]+).bin$',
+        views.SchoolsNetworkJSON.as_view(data_format='binary'),
+        name='schools-binary'),
+    url(r'^schools/(?P<slug>[\w-]+).(?P<fmt>gml|graphml|gexf)$',
         views.SchoolsNetworkExport.as_view(), name='schools-export'),
 ]
@@ -24,20 +24,123 @@ def encode_unicode(data):
 # NOTE: it might be cleaner to refactor into graph subclass with these methods
 
 
-def egograph(graph, vertex):  # support configurable radius?
-    '''Filter a graph around a specified vertex to generate an egograph.
-    Currently only supports a radius of one.'''
+def vertex_index(graph):
+    '''Dictionary of vertex name to vertex index for a graph, to find
+    vertices by name without scanning the vertex sequence.'''
+    return dict((name, i) for i, name in enumerate(graph.vs['name']))
 
-    # identify the set of vertices we want to keep: the central
-    # vertex and all its immediate neighbors
-    neighbors = graph.neighbors(vertex)
-    vertices = set([vertex]) | set(neighbors)
 
-    # NOTE: should be possible to support radius > 1 by iteratively
-    # fnding and adding neighbors of neighbors
+def egograph(graph, vertex, radius=1, edge_labels=None):
+    '''Filter a graph around a specified vertex to generate an egograph
+    including all vertices within the specified radius.  Optionally
+    takes a list of edge labels; if specified, only edges with those
+    labels are followed and included in the egograph.'''
+    if hasattr(vertex, 'index'):
+        vertex = vertex.index
+
+    # identify the set of vertices we want to keep: the central
+    # vertex and all its neighbors within the requested radius
+    if not edge_labels:
+        vertices = graph.neighborhood(vertex, order=radius, mode='all')
+    else:
+        # breadth-first search, following only edges with the
+        # requested labels; only looks at edges in the neighborhood
+        vertices = set([vertex])
+        frontier = [vertex]
+        for i in range(radius):
+            next_frontier = []
+            for vtx in frontier:
+                for eid in graph.incident(vtx, mode='all'):
+                    edge = graph.es[eid]
+                    if edge['label'] not in edge_labels:
+                        continue
+                    neighbor = edge.target if edge.source == vtx else edge.source
+                    if neighbor not in vertices:
+                        vertices.add(neighbor)
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
 
     # filter the graph to just the requested vertices
-    return graph.subgraph(vertices)
+    ego = graph.subgraph(vertices)
+    if edge_labels:
+        ego.delete_edges(ego.es.select(label_notin=edge_labels))
+    return ego
+
+
+def shortest_path(graph, source, target, weights=None):
+    '''Find the shortest path between two vertices, ignoring edge
+    direction, and return it as a subgraph of the vertices and edges
+    on the path.  Path vertices are annotated with their **step**
+    along the path, starting with 0 for the source vertex.  Optionally
+    takes a list of edge distances for a weighted shortest path.
+    If there is no path, returns an empty subgraph.'''
+    if hasattr(source, 'index'):
+        source = source.index
+    if hasattr(target, 'index'):
+        target = target.index
+
+    vertices = [source]
+    epath = []
+    if source != target:
+        epath = graph.get_shortest_paths(source, to=target, weights=weights,
+                                         mode='all', output='epath')[0]
+        if not epath:
+            path = graph.subgraph([])
+            path.vs['step'] = []
+            return path
+        # follow the path to put vertices in order
+        for eid in epath:
+            edge = graph.es[eid]
+            vertices.append(edge.target if edge.source == vertices[-1]
+                            else edge.source)
+
+    if epath:
+        path = graph.subgraph_edges(epath, delete_vertices=True)
+    else:
+        path = graph.subgraph(vertices)
+    steps = dict((graph.vs[vtx]['name'], i) for i, vtx in enumerate(vertices))
+    path.vs['step'] = [steps[name] for name in path.vs['name']]
+    return path
+
+
+def filter_graph(graph, edge_labels=None, min_weight=None,
+                 vertex_types=None, schools=None, focus=None):
+    '''Filter a graph to a subgraph without modifying it.  Edges can
+    be filtered by label and minimum weight; vertices can be filtered
+    by type and associated school names.  Focus restricts the graph to
+    a list of vertices (by name) and their neighbors, excluding other
+    vertices of the same type as the focus vertices (e.g., a subset of
+    journals and their contributors).  When edges are filtered,
+    vertices left without any edges are removed.'''
+    vertices = graph.vs
+    if vertex_types:
+        vertices = vertices.select(type_in=vertex_types)
+    if schools:
+        schools = set(schools)
+        vertices = vertices.select(lambda v: v['schools'] and
+                                   schools.intersection(v['schools']))
+    keep = set(vertices.indices)
+    if focus:
+        focus_vertices = graph.vs.select(name_in=focus)
+        focus_types = set(focus_vertices['type'])
+        neighbors = set(n for v in focus_vertices.indices
+                        for n in graph.neighbors(v)
+                        if graph.vs[n]['type'] not in focus_types)
+        keep &= set(focus_vertices.indices) | neighbors
+
+    if len(keep) == graph.vcount():
+        filtered = graph.copy()
+    else:
+        filtered = graph.subgraph(sorted(keep))
+
+    if edge_labels or min_weight:
+        edges = filtered.es
+        if edge_labels:
+            edges = edges.select(label_in=edge_labels)
+        if min_weight:
+            edges = edges.select(weight_ge=min_weight)
+        filtered = filtered.subgraph_edges(edges, delete_vertices=True)
+    return filtered
 
 
 def annotate_graph(graph, fields):
@@ -62,9 +165,8 @@ def annotate_graph(graph, fields):
         # add degree to as node data
         graph.vs['degree'] = degree
 
-    # NOTE: previous networkx annotate_graph method
-    # also supported betweenness_centrality and eigenvector_centrality,
-    # but those do not seem to be used anywhere currently
+    # NOTE: centrality measures are too slow to calculate on request;
+    # see :mod:`zurnatikl.apps.network.metrics`
 
     return graph
 
@@ -73,7 +175,12 @@ def node_link_data(graph, layout=None, cluster=None):
     '''Generate node and edge dictionary to be output as json
     for use with sigma.js.  If a layout is specified, it will be used
     to set coordinates on each node.  If a clustering is specified,
-    it will be used to set a community value on each node.'''
+    it will be used to set a community value on each node.
+
+    Node and edge data is generated from attribute lists retrieved
+    from the graph in bulk, and community values are read from
+    the clustering membership list, so generating the data takes
+    time proportional to the size of the graph.'''
     graph_data = OrderedDict([
         ('directed', graph.is_directed()),
         ('multigraph', any(graph.is_multiple())),
@@ -84,30 +191,31 @@ def node_link_data(graph, layout=None, cluster=None):
     # should layout and clustering algorithms be included in the
     # data so they can easily be reported to the user?
 
-    for i, vtx in enumerate(graph.vs):
-        # include any vertex attributes present in the graph
-        vtx_data = vtx.attributes()
-        vtx_data['id'] = vtx.index
-        # if layout is present, set x & y coords
-        if layout is not None:
-            x, y = layout[i]
-            vtx_data.update({'x': x, 'y': y})
-
-        if cluster is not None:
-            for i, comm in enumerate(cluster):
-                if vtx.index in comm:
-                    vtx_data['community'] = i
-                    break
+    # include any vertex attributes present in the graph
+    vtx_attrs = [(name, graph.vs[name]) for name in graph.vs.attribute_names()]
+    coords = None
+    if layout is not None:
+        coords = getattr(layout, 'coords', layout)
+    membership = cluster.membership if cluster is not None else None
 
+    for i in xrange(graph.vcount()):
+        vtx_data = dict((name, values[i]) for name, values in vtx_attrs)
+        vtx_data['id'] = i
+        # if layout is present, set x & y coords
+        if coords is not None:
+            vtx_data['x'], vtx_data['y'] = coords[i]
+        if membership is not None:
+            vtx_data['community'] = membership[i]
         graph_data['nodes'].append(vtx_data)
 
-    for edge in graph.es:
-        # include edge attributes, like labels and size
-        edge_data = edge.attributes()
+    # include edge attributes, like labels and size
+    edge_attrs = [(name, graph.es[name]) for name in graph.es.attribute_names()]
+    for i, (source, target) in enumerate(graph.get_edgelist()):
+        edge_data = dict((name, values[i]) for name, values in edge_attrs)
         edge_data.update({
-            'id': edge.index,
-            'source': edge.source,
-            'target': edge.target
+            'id': i,
+            'source': source,
+            'target': target
         })
         graph_data['edges'].append(edge_data)
 
@@ -9,6 +9,7 @@ from igraph import Graph
 from zurnatikl.apps.geo.models import Location
 from zurnatikl.apps.journals.models import Journal, Issue, Item
 from zurnatikl.apps.people.models import Person, School
+from . import artifacts, graph_cache
 from .utils import to_ascii, encode_unicode
 from .base_views import NetworkGraphExportView, SigmajsJSONView
 
@@ -17,14 +18,16 @@ logger = logging.getLogger(__name__)
 
 
 def generate_network_graph(use_ascii=False):
-    '''Generate a :class:`networkx.MultiGraph` from the connections among
+    '''Generate a :class:`igraph.Graph` from the connections among
     schools, people, locations, journals, issues, and items.
     Optionally convert unicode to ascii, if needed by the export tool.
+    Node attributes and edges are retrieved in bulk for each kind of
+    content, so the number of database queries does not depend on the
+    amount of data.
     '''
     start = time.time()
     # generate a graph for serialization
     # TODO: probably need to add caching on this graph
-    graph = Graph()
     # igraph requires numerical id; zurnatikl uses network id to
     # differentiate content types & database ids
 
@@ -39,59 +42,34 @@ def generate_network_graph(use_ascii=False):
             # see https://github.com/igraph/python-igraph/issues/5
             return encode_unicode(attributes)
 
-    schools = School.objects.all()
+    names = []
+    node_attrs = []
     edges = []
-    for school in schools:
-        graph.add_vertex(school.network_id,
-                         **attr(school.network_attributes))
+    for manager in [School.objects, Person.objects, Location.objects,
+                    Journal.objects, Issue.objects, Item.objects]:
+        nodes, node_edges = manager.network_data()
+        for network_id, attributes in nodes:
+            names.append(network_id)
+            node_attrs.append(attr(attributes))
         # edges can't be added until both source and target nodes exist
-        if school.has_network_edges:
-            edges.extend(school.network_edges)
-
-    people = Person.objects.all().prefetch_related('schools', 'dwellings')
-    for person in people:
-        graph.add_vertex(person.network_id,
-                         **attr(person.network_attributes))
-        if person.has_network_edges:
-            edges.extend(person.network_edges)
-
-    locations = Location.objects.all().prefetch_related('placename_set')
-    for loc in locations:
-        graph.add_vertex(loc.network_id,
-                         **attr(loc.network_attributes))
-        if loc.has_network_edges:
-            edges.extend(loc.network_edges)
-
-    journals = Journal.objects.all()
-    for journal in journals:
-        graph.add_vertex(journal.network_id,
-                         **attr(journal.network_attributes))
-        if journal.has_network_edges:
-            edges.extend(journal.network_edges)
-
-    issues = Issue.objects.all().prefetch_related('editors',
-        'contributing_editors', 'publication_address', 'print_address',
-        'mailing_addresses')
-    for issue in issues:
-        graph.add_vertex(issue.network_id,
-                         **attr(issue.network_attributes))
-        if issue.has_network_edges:
-            edges.extend(issue.network_edges)
-    items = Item.objects.all().prefetch_related('issue', 'creators',
-        'translators', 'persons_mentioned', 'addresses', 'genre')
-    for item in items:
-        graph.add_vertex(item.network_id,
-                         **attr(item.network_attributes))
-        if item.has_network_edges:
-            edges.extend(item.network_edges)
-
-    # some edges have edge attributes, others do not
-    # edges without attributes can be added en masse
-    simple_edges = [edge for edge in edges if len(edge) == 2]
-    graph.add_edges(simple_edges)
-    edge_attrs = [edge for edge in edges if len(edge) > 2]
-    for source, target, attributes in edge_attrs:
-        graph.add_edge(source, target, **attributes)
+        edges.extend(node_edges)
+
+    # add all nodes at once; nodes without a value for an attribute
+    # are set to None, as they would be when added individually
+    graph = Graph(n=len(names))
+    graph.vs['name'] = names
+    attr_names = set(itertools.chain.from_iterable(node_attrs))
+    for attr_name in attr_names:
+        graph.vs[attr_name] = [a.get(attr_name) for a in node_attrs]
+
+    # some edges have edge attributes, others do not;
+    # add all edges at once by vertex index, then set labels
+    vertex_index = dict((name, i) for i, name in enumerate(names))
+    graph.add_edges([(vertex_index[edge[0]], vertex_index[edge[1]])
+                     for edge in edges])
+    if any(len(edge) > 2 for edge in edges):
+        graph.es['label'] = [edge[2].get('label') if len(edge) > 2 else None
+                             for edge in edges]
 
     logger.debug('Generated full graph in %.2f sec' % (time.time() - start))
     return graph
@@ -101,8 +79,12 @@ class FullNetworkExport(NetworkGraphExportView):
     filename = 'network_data'
 
     def get_context_data(self, **kwargs):
-        use_ascii = (self.export_format == 'gml')
-        return generate_network_graph(use_ascii=use_ascii)
+        # use precomputed network graph if available; export
+        # serializers handle ascii conversion where needed
+        graph = artifacts.load('full-network')
+        if graph is None:
+            graph = generate_network_graph()
+        return graph
 
 
 class SchoolsNetwork(ListView):
@@ -119,13 +101,25 @@ class SchoolsNetworkBaseView(SchoolsNetwork):
     for use in disseminating the graph as JSON, GEXF, or GraphML.'''
 
     def get_context_data(self, **kwargs):
-        return School.schools_network(self.get_queryset())
+        # cache the generated graph for the current network data version
+        cache_key = 'schools-network-%s' % self.kwargs['slug']
+        graph = graph_cache.get(cache_key)
+        if graph is None:
+            # use precomputed network graph if available
+            graph = artifacts.load(cache_key)
+            if graph is None:
+                graph = School.schools_network(self.get_queryset())
+            graph_cache.set(cache_key, graph)
+        return graph
 
 
 class SchoolsNetworkJSON(SigmajsJSONView, SchoolsNetworkBaseView):
     '''Network graph based on a number of :class:`~zurnatikl.apps.people.models.School`
     objects in a JSON format appropriate for use with Sigma.js'''
 
+    def get_artifact_name(self):
+        return 'schools-network-%s' % self.kwargs['slug']
+
 
 class SchoolsNetworkExport(NetworkGraphExportView, SchoolsNetworkBaseView):
     '''Downloadable eggograph for a
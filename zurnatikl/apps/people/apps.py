@@ -0,0 +1,11 @@
+# zurnatikl/apps/people/apps.py
+
+from django.apps import AppConfig
+
+class PeopleConfig(AppConfig):
+    name = 'zurnatikl.apps.people'
+
+    def ready(self):
+        # connect signal handlers that keep the in-memory person
+        # name index up to date
+        from zurnatikl.apps.people import signals
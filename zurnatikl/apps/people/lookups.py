@@ -1,9 +1,6 @@
-import re
-from django.core.urlresolvers import reverse
-from django.db.models import Q
 from django.utils.html import escape
-from django.template.defaultfilters import pluralize
 from ajax_select import LookupChannel
+from zurnatikl.apps.people import name_index
 from zurnatikl.apps.people.models import Person
 
 
@@ -20,25 +17,11 @@ class PersonLookup(LookupChannel):
             ' or pen name.'
 
     def get_query(self, q, request):
-        # NOTE: could configure mysql full-text indexing to allow using
-        # a search filter
-
-        # split the query into words (on spaces or comma space)
-        # and match any field on any word
-        words = re.split(',? +', q)
-        people = Person.objects.all().order_by('last_name').distinct()
-        # distinct required in case a term matches multiple names
-
-        for w in words:
-            people = people.filter(
-                Q(first_name__icontains=w) |
-                Q(last_name__icontains=w) |
-                Q(name__first_name__icontains=w) |
-                Q(name__last_name__icontains=w) |
-                Q(penname__name__icontains=w))
-
-        return people
-
+        # search the in-memory name index, so that lookups don't
+        # require a multi-table database query; words in the query
+        # (split on spaces or punctuation) must all match the start of
+        # some part of the person's name, alternate names, or pen names
+        return name_index.search(q)
 
     def name_info(self, obj):
         # formatted name info for display in match & item display
@@ -52,38 +35,22 @@ class PersonLookup(LookupChannel):
         }
         return names
 
+    def get_match(self, obj):
+        # indexed name info with pre-rendered html for a person
+        if isinstance(obj, name_index.PersonMatch):
+            return obj
+        return name_index.get_person(obj.pk)
+
     def format_match(self, obj):
         """HTML formatted item for display in the dropdown """
-        name_info = self.name_info(obj)
-        name_info['break'] = name_info['btw'] = ''
-        if name_info['alt_names'] or name_info['pennames']:
-            name_info['break'] = '<br/>'
-        if name_info['alt_names'] and name_info['pennames']:
-            name_info['btw'] = '; '
-        # NOTE: using bold to help differentiate name from alternate names
-        return u'''<div>
-           <b>%(name)s</b> %(break)s
-           <span class="small">%(alt_names)s%(btw)s%(pennames)s</span>
-           </div>''' % name_info
-
+        match = self.get_match(obj)
+        if match is not None:
+            return match.match
+        return name_index.match_html(**self.name_info(obj))
 
     def format_item_display(self, obj):
         """HTML formatted item for display in the selected area"""
-        names = self.name_info(obj)
-        formatted_names = {
-            'name': names['name'],
-            'alt_names': '<i>Alternate names:</i> %(alt_names)s' % names
-                          if names['alt_names'] else '',
-            'pennames': '<i>Pen names:</i> %(pennames)s' % names
-                         if names['pennames'] else '',
-        }
-        formatted_names['break'] = formatted_names['btw'] = ''
-        if formatted_names['alt_names'] or formatted_names['pennames']:
-            formatted_names['break'] = '<br/>'
-        if formatted_names['alt_names'] and formatted_names['pennames']:
-            formatted_names['btw'] = '; '
-
-        return u'''<div>
-           <b>%(name)s</b>
-           %(break)s<span class="small">%(alt_names)s%(btw)s%(pennames)s</span>
-           </div>''' % formatted_names
+        match = self.get_match(obj)
+        if match is not None:
+            return match.display
+        return name_index.display_html(**self.name_info(obj))
@@ -21,6 +21,17 @@ class SchoolManager(models.Manager):
     def get_by_natural_key(self, name):
         return self.get(name=name)
 
+    def network_data(self):
+        '''Network nodes and edges for all schools, equivalent to
+        :attr:`School.network_attributes` and :attr:`School.network_edges`
+        but generated with a fixed number of queries.  Returns a list
+        of tuples of network id and node attributes, and a list of edges.'''
+        nodes = [(s.network_id, s.network_attributes) for s in self.all()]
+        edges = [('school:%s' % school_id, 'location:%s' % location_id)
+                 for school_id, location_id in self.model.locations.through \
+                    .objects.values_list('school_id', 'location_id')]
+        return nodes, edges
+
 
 class School(models.Model):
     '''School of poetry'''
@@ -98,48 +109,72 @@ class School(models.Model):
         # igraph requires numerical id; zurnatikl uses network id to
         # differentiate content types & database ids
 
-        # prefetch related people and locations for efficiency
-        schools = schools.prefetch_related('person_set', 'locations')
-
         graph_start = time.time()
-        graph = Graph()
-
-        for s in schools:
-            # add the school itself to the graph
-            graph.add_vertex(s.network_id, label=unicode(s),
-                             type=s.network_type)
-
-            # add people, places, & journals associated with each school
-            start = time.time()
-            # a school may have one or more locations
-            for loc in s.locations.all():
-                # only add location if it is not already in the graph
-                if loc.network_id not in graph.vs['name']:
-                    graph.add_vertex(loc.network_id, label=loc.short_label,
-                                     type=loc.network_type)
-                graph.add_edge(s.network_id, loc.network_id)
-
-            # people can be associated with one or more schools
-            for p in s.person_set.all():
-                # only add person if not already in the graph
-                if p.network_id not in graph.vs['name']:
-                    graph.add_vertex(p.network_id, label=p.firstname_lastname,
-                                     type=p.network_type)
-                graph.add_edge(s.network_id, p.network_id)
-
-            # journals can also be associated with a school
-            for j in s.journal_set.all():
-                if j.network_id not in graph.vs['name']:
-                    graph.add_vertex(j.network_id, label=unicode(j),
-                                     type=j.network_type)
-                graph.add_edge(s.network_id, j.network_id)
-
-            logger.debug('Added %d locations, %s people, and %d journals for %s in %.2f sec',
-                         s.locations.all().count(), s.person_set.all().count(),
-                         s.journal_set.all().count(), s, time.time() - start)
-
-        logger.debug('schools network graph generated in %.2f sec',
-                     time.time() - graph_start)
+        # vertex network ids, attributes, and index, and edges by index;
+        # associated content is retrieved with one query per relation
+        names = []
+        labels = []
+        types = []
+        vertex_index = {}
+        edges = []
+
+        def add_vertex(network_id, label, network_type):
+            # only add a vertex if it is not already in the graph
+            if network_id not in vertex_index:
+                vertex_index[network_id] = len(names)
+                names.append(network_id)
+                labels.append(label)
+                types.append(network_type)
+            return vertex_index[network_id]
+
+        school_ids = []
+        for school_id, name in schools.values_list('id', 'name'):
+            add_vertex('school:%s' % school_id, name, cls.network_type)
+            school_ids.append(school_id)
+
+        # a school may have one or more locations
+        locations = Location.objects.filter(schools__in=school_ids) \
+                                    .select_related('state', 'country') \
+                                    .distinct()
+        location_labels = dict((loc.id, loc.short_label) for loc in locations)
+        for school_id, location_id in cls.locations.through.objects \
+                .filter(school__in=school_ids).order_by('school', 'location') \
+                .values_list('school_id', 'location_id'):
+            edges.append((vertex_index['school:%s' % school_id],
+                          add_vertex('location:%s' % location_id,
+                                     location_labels[location_id],
+                                     Location.network_type)))
+
+        # people can be associated with one or more schools
+        for school_id, person_id, first_name, last_name in \
+                cls.person_set.through.objects \
+                .filter(school__in=school_ids).order_by('school', 'person') \
+                .values_list('school_id', 'person_id', 'person__first_name',
+                             'person__last_name'):
+            edges.append((vertex_index['school:%s' % school_id],
+                          add_vertex('person:%s' % person_id,
+                                     ' '.join([n for n in [first_name, last_name] if n]),
+                                     Person.network_type)))
+
+        # journals can also be associated with a school
+        # (journal model accessed via the relation to avoid circular import)
+        journal_type = cls.journal_set.field.model.network_type
+        for school_id, journal_id, title in cls.journal_set.through.objects \
+                .filter(school__in=school_ids).order_by('school', 'journal') \
+                .values_list('school_id', 'journal_id', 'journal__title'):
+            edges.append((vertex_index['school:%s' % school_id],
+                          add_vertex('journal:%s' % journal_id, title,
+                                     journal_type)))
+
+        # add all vertices and edges at once
+        graph = Graph(n=len(names))
+        graph.vs['name'] = names
+        graph.vs['label'] = labels
+        graph.vs['type'] = types
+        graph.add_edges(edges)
+
+        logger.debug('schools network graph with %d schools generated in %.2f sec',
+                     len(school_ids), time.time() - graph_start)
         return graph
 
 
@@ -179,6 +214,36 @@ class PersonManager(models.Manager):
                     models.Q(num_translated__gt=0)) \
             .distinct()
 
+    def network_data(self):
+        '''Network nodes and edges for all people, equivalent to
+        :attr:`Person.network_attributes` and :attr:`Person.network_edges`
+        but generated with a fixed number of queries.  Returns a list
+        of tuples of network id and node attributes, and a list of edges.'''
+        # ids of people with each kind of relation
+        related = {}
+        for rel in ['issues_edited', 'issues_contrib_edited', 'items_created',
+                    'items_translated', 'items_mentioned_in']:
+            related[rel] = set(self.filter(**{'%s__isnull' % rel: False})
+                                   .order_by().values_list('id', flat=True)
+                                   .distinct())
+        nodes = []
+        for person in self.all():
+            nodes.append((person.network_id, person.get_network_attributes(
+                editor=person.id in related['issues_edited'] or
+                       person.id in related['issues_contrib_edited'],
+                creator=person.id in related['items_created'],
+                translator=person.id in related['items_translated'],
+                mentioned=person.id in related['items_mentioned_in'])))
+
+        # schools and dwelling locations
+        edges = [('person:%s' % person_id, 'school:%s' % school_id)
+                 for person_id, school_id in self.model.schools.through \
+                    .objects.values_list('person_id', 'school_id')]
+        edges.extend(('person:%s' % person_id, 'location:%s' % location_id)
+                     for person_id, location_id in self.model.dwellings.through \
+                        .objects.values_list('person_id', 'location_id'))
+        return nodes, edges
+
 
 
 class Person(models.Model):
@@ -286,16 +351,25 @@ class Person(models.Model):
     @property
     def network_attributes(self):
         #: data to be included as node attributes when generating a network
+        return self.get_network_attributes(
+            editor=self.issues_edited.exists() or self.issues_contrib_edited.exists(),
+            creator=self.items_created.exists(),
+            translator=self.items_translated.exists(),
+            mentioned=self.items_mentioned_in.exists())
+
+    def get_network_attributes(self, editor, creator, translator, mentioned):
+        # network attributes with relation flags calculated elsewhere,
+        # so they can be generated in bulk
         attrs = {
             'type': self.network_type,
             'label': unicode(self),
             'last name': self.last_name,
             # yes/no flags for kinds of relations, to enable easily
             # filtering in tools like Gephi
-            'editor': self.issues_edited.exists() or self.issues_contrib_edited.exists(),
-            'creator': self.items_created.exists(),
-            'translator': self.items_translated.exists(),
-            'mentioned': self.items_mentioned_in.exists()
+            'editor': editor,
+            'creator': creator,
+            'translator': translator,
+            'mentioned': mentioned
         }
         if self.first_name:
             attrs['first name'] = self.first_name
@@ -0,0 +1,210 @@
+# in-memory prefix index of person names, for fast autocompletion in
+# the admin (see :class:`zurnatikl.apps.people.lookups.PersonLookup`).
+# The index is kept in process memory so that lookups don't require
+# any database queries, and holds pre-rendered html for each person.
+# Changes to people and their names are applied to the index by signal
+# handlers (see :mod:`zurnatikl.apps.people.signals`); other processes
+# rebuild their copy of the index the next time it is used (see
+# :mod:`zurnatikl.indexes`).
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+import logging
+import time
+
+from django.utils.html import escape
+
+from zurnatikl.indexes import SharedIndex, tokenize
+from .models import Name, PenName, Person
+
+
+logger = logging.getLogger(__name__)
+
+
+def match_html(name, alt_names, pennames):
+    '''HTML for a person in the autocomplete dropdown, given escaped
+    main name and semicolon-delimited alternate names and pen names.'''
+    info = {'name': name, 'alt_names': alt_names, 'pennames': pennames,
+            'break': '', 'btw': ''}
+    if alt_names or pennames:
+        info['break'] = '<br/>'
+    if alt_names and pennames:
+        info['btw'] = '; '
+    # NOTE: using bold to help differentiate name from alternate names
+    return u'''<div>
+           <b>%(name)s</b> %(break)s
+           <span class="small">%(alt_names)s%(btw)s%(pennames)s</span>
+           </div>''' % info
+
+
+def display_html(name, alt_names, pennames):
+    '''HTML for a selected person, given escaped main name and
+    semicolon-delimited alternate names and pen names.'''
+    info = {
+        'name': name,
+        'alt_names': '<i>Alternate names:</i> %s' % alt_names
+                     if alt_names else '',
+        'pennames': '<i>Pen names:</i> %s' % pennames if pennames else '',
+        'break': '', 'btw': '',
+    }
+    if info['alt_names'] or info['pennames']:
+        info['break'] = '<br/>'
+    if info['alt_names'] and info['pennames']:
+        info['btw'] = '; '
+    return u'''<div>
+           <b>%(name)s</b>
+           %(break)s<span class="small">%(alt_names)s%(btw)s%(pennames)s</span>
+           </div>''' % info
+
+
+class PersonMatch(namedtuple('PersonMatch',
+                             ['pk', 'name', 'sort_key', 'match', 'display'])):
+    '''Indexed person, with pre-rendered html for the autocomplete
+    dropdown (**match**) and the selected area (**display**).  Stands
+    in for a :class:`~zurnatikl.apps.people.models.Person` in lookup
+    results.'''
+
+    def __unicode__(self):
+        return self.name
+
+
+class NameIndex(object):
+    '''Sorted index of tokens from all forms of each person's name
+    (main name, alternate names, and pen names), so that query words
+    can match tokens that start with them.'''
+
+    def __init__(self):
+        #: sorted list of tuples of token and person id
+        self.entries = []
+        #: person id to :class:`PersonMatch`
+        self.people = {}
+        #: person id to indexed tokens, for updating people
+        self.person_tokens = {}
+
+    def add_person(self, person, names, pen_names):
+        '''Index a person with lists of their alternate
+        :class:`~zurnatikl.apps.people.models.Name` and
+        :class:`~zurnatikl.apps.people.models.PenName`.  Replaces any
+        existing entry for the person.'''
+        self.remove_person(person.pk)
+        name = unicode(person)
+        alt_names = '; '.join(escape(unicode(n)) for n in names)
+        pennames = '; '.join(escape(unicode(n)) for n in pen_names)
+        self.people[person.pk] = PersonMatch(
+            person.pk, name,
+            (person.last_name.lower(), person.first_name.lower(), person.pk),
+            match_html(escape(name), alt_names, pennames),
+            display_html(escape(name), alt_names, pennames))
+
+        tokens = set(tokenize(person.first_name)) | \
+            set(tokenize(person.last_name))
+        for n in names:
+            tokens.update(tokenize(n.first_name))
+            tokens.update(tokenize(n.last_name))
+        for n in pen_names:
+            tokens.update(tokenize(n.name))
+        for token in tokens:
+            insort(self.entries, (token, person.pk))
+        self.person_tokens[person.pk] = tokens
+
+    def remove_person(self, person_id):
+        for token in self.person_tokens.pop(person_id, []):
+            del self.entries[bisect_left(self.entries, (token, person_id))]
+        self.people.pop(person_id, None)
+
+    def matching_ids(self, word):
+        # ids of people with a token that starts with a query word
+        ids = set()
+        i = bisect_left(self.entries, (word, ))
+        while i < len(self.entries) and self.entries[i][0].startswith(word):
+            ids.add(self.entries[i][1])
+            i += 1
+        return ids
+
+    def search(self, query):
+        '''Find people with names matching all the words in a query;
+        words match the start of any part of any name.  Returns a list
+        of :class:`PersonMatch`, sorted by last name and first name.'''
+        words = tokenize(query)
+        if not words:
+            return []
+        ids = None
+        for word in set(words):
+            word_ids = self.matching_ids(word)
+            ids = word_ids if ids is None else ids & word_ids
+            if not ids:
+                return []
+        return sorted((self.people[i] for i in ids),
+                      key=lambda match: match.sort_key)
+
+
+def person_names(person_ids=None):
+    '''People with lists of their alternate names and pen names,
+    as a dictionary of person id to tuple of person, names, and pen
+    names.  Uses a fixed number of queries; optionally restrict to
+    a list of person ids.'''
+    people = Person.objects.only('first_name', 'last_name')
+    names = Name.objects.only('first_name', 'last_name', 'person')
+    pen_names = PenName.objects.only('name', 'person')
+    if person_ids is not None:
+        people = people.filter(pk__in=person_ids)
+        names = names.filter(person__in=person_ids)
+        pen_names = pen_names.filter(person__in=person_ids)
+
+    alt_names = defaultdict(list)
+    for name in names.order_by('pk'):
+        alt_names[name.person_id].append(name)
+    person_pen_names = defaultdict(list)
+    for pen_name in pen_names.order_by('pk'):
+        person_pen_names[pen_name.person_id].append(pen_name)
+    return dict((person.pk, (person, alt_names[person.pk],
+                             person_pen_names[person.pk]))
+                for person in people.order_by())
+
+
+def build_index():
+    '''Build the name index for all people from the database.'''
+    start = time.time()
+    index = NameIndex()
+    for person, names, pen_names in person_names().itervalues():
+        index.add_person(person, names, pen_names)
+    logger.debug('Built person name index (%d people, %d tokens) in %.2f sec',
+                 len(index.people), len(index.entries), time.time() - start)
+    return index
+
+
+#: name index for the current process
+shared_index = SharedIndex('person-name-index', build_index)
+
+
+def update_people(person_ids):
+    '''Update the name index for the specified people, adding,
+    re-indexing, or removing them as needed.  The index for the current
+    process is updated in place if it is loaded and current; other
+    processes rebuild their index when it is next used.'''
+    person_ids = [pk for pk in person_ids if pk is not None]
+    if not person_ids:
+        return
+
+    def update(index):
+        people = person_names(person_ids)
+        for person_id in person_ids:
+            if person_id in people:
+                index.add_person(*people[person_id])
+            else:
+                # person has been deleted
+                index.remove_person(person_id)
+
+    shared_index.changed(update)
+
+
+def search(query):
+    '''Search people by any form of their name.  Returns a list of
+    :class:`PersonMatch`.'''
+    with shared_index.use() as index:
+        return index.search(query)
+
+
+def get_person(person_id):
+    ''':class:`PersonMatch` for a person id, or None if not indexed.'''
+    with shared_index.use() as index:
+        return index.people.get(person_id)
@@ -0,0 +1,40 @@
+# signal handlers to keep the in-memory person name index used for
+# autocompletion in sync with the database
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import name_index
+from .models import Name, PenName, Person
+
+
+def update_people(person_ids):
+    # update the name index when the current transaction commits, so
+    # other processes never load uncommitted data into the index
+    person_ids = list(person_ids)
+    transaction.on_commit(lambda: name_index.update_people(person_ids))
+
+
+@receiver(pre_save, sender=Name)
+@receiver(pre_save, sender=PenName)
+def collect_name_person(sender, instance, **kwargs):
+    # store the person a name belonged to before it changes
+    if instance.pk is not None:
+        instance._name_index_people = set(
+            sender.objects.filter(pk=instance.pk)
+                          .values_list('person_id', flat=True))
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def update_person_names(sender, instance, **kwargs):
+    update_people([instance.pk])
+
+
+@receiver(post_save, sender=Name)
+@receiver(post_delete, sender=Name)
+@receiver(post_save, sender=PenName)
+@receiver(post_delete, sender=PenName)
+def update_name_person(sender, instance, **kwargs):
+    update_people(getattr(instance, '_name_index_people', set()) |
+                  set([instance.person_id]))
@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
+import json
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db.models import Q
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from mock import patch
 
 from zurnatikl.apps.geo.models import Location
-from zurnatikl.apps.journals.models import Journal
-from .models import Person, School, Name
-from .views import PeopleCSV
+from zurnatikl.apps.journals.models import Journal, Issue
+from zurnatikl.apps.network import layouts
+from . import name_index
+from .lookups import PersonLookup
+from .models import Person, School, Name, PenName
+from .views import PeopleCSV, EgographBaseView, PathBaseView
 
 
 class SchoolTestCase(TestCase):
@@ -35,8 +41,10 @@ class SchoolTestCase(TestCase):
 
     def test_schools_network(self):
         schools = School.objects.all()
-        # generate network from all schools in our fixture data
-        graph = School.schools_network(schools)
+        # generate network from all schools in our fixture data;
+        # associated content is retrieved in bulk
+        with self.assertNumQueries(5):
+            graph = School.schools_network(schools)
 
         # each school and every associated person, place, and journal
         # should be included in the network and have an edge
@@ -83,6 +91,12 @@ class SchoolTestCase(TestCase):
                 self.assert_(graph.es.find(_source=sch_node.index,
                                            _target=node.index))
 
+        # one edge for each school association
+        self.assertEqual(
+            sum(s.locations.count() + s.person_set.count() + s.journal_set.count()
+                for s in schools),
+            len(graph.es))
+
 
 class PeopleTestCase(TestCase):
     fixtures = ['test_network.json']
@@ -203,7 +217,54 @@ class PeopleTestCase(TestCase):
             self.assertEqual(contrib.num_translated,
                              contrib.items_translated.all().count())
 
-
+    # apply changes to the name index immediately, since test cases
+    # are never committed
+    @patch('django.db.transaction.on_commit', lambda func: func())
+    def test_person_lookup(self):
+        cache.clear()
+        lookup = PersonLookup()
+        name_index.shared_index.load()
+        berrigan = Person.objects.get(last_name='Berrigan')
+        # index is in memory; lookups don't query the database
+        with self.assertNumQueries(0):
+            results = lookup.get_query('berr', None)
+            self.assertEqual([berrigan.pk], [r.pk for r in results])
+            self.assertEqual(unicode(berrigan), unicode(results[0]))
+            self.assert_('<b>Berrigan, Ted</b>' in
+                         lookup.format_match(results[0]))
+        # all words must match the start of some part of a name
+        self.assertEqual([berrigan.pk],
+                         [r.pk for r in lookup.get_query('ted, berrigan', None)])
+        self.assertEqual([], lookup.get_query('errigan', None))
+        self.assertEqual([], lookup.get_query('ted kelly', None))
+
+        # alternate names and pen names are indexed as they are added
+        Name.objects.create(person=berrigan, first_name='Edmund',
+                            last_name='Berrigan')
+        pen_name = PenName.objects.create(person=berrigan, name='Tedward')
+        self.assertEqual([berrigan.pk],
+                         [r.pk for r in lookup.get_query('edmund', None)])
+        result = lookup.get_query('tedw', None)[0]
+        self.assert_('Edmund Berrigan; Tedward' in lookup.format_match(result))
+        self.assert_('<i>Pen names:</i> Tedward' in
+                     lookup.format_item_display(berrigan))
+        pen_name.delete()
+        self.assertEqual([], lookup.get_query('tedw', None))
+        berrigan.delete()
+        self.assertEqual([], lookup.get_query('edmund', None))
+
+        # the index is rebuilt when another process has changed it
+        # (bulk create doesn't send signals, so only the version changes)
+        Person.objects.bulk_create([Person(first_name='Diane',
+                                           last_name='di Prima')])
+        cache.incr(name_index.shared_index.version_key)
+        self.assertEqual(['di Prima, Diane'],
+                         [unicode(r) for r in lookup.get_query('di pri', None)])
+
+
+# graph views calculate layouts on request in tests, instead of
+# queueing them for the layout worker
+@override_settings(NETWORK_LAYOUT_QUEUE=None)
 class PeopleViewsTestCase(TestCase):
     fixtures = ['test_network.json']
 
@@ -230,6 +291,26 @@ class PeopleViewsTestCase(TestCase):
             self.assertNotContains(response, unicode(m),
                 msg_prefix='mentioned people should not be listed on person browse')
 
+    def test_list_people_sort(self):
+        cache.clear()
+        response = self.client.get(reverse('people:list'), {'sort': 'pagerank'})
+        self.assertEqual('pagerank', response.context['sort'])
+        people = response.context['object_list']
+        values = [p.centrality for p in people]
+        # most central people are listed first
+        self.assertEqual(sorted(values, reverse=True), values)
+        self.assertContains(response, 'PageRank:')
+        # unknown sort option uses default name sort
+        response = self.client.get(reverse('people:list'), {'sort': 'bogus'})
+        self.assertEqual('name', response.context['sort'])
+        # sorted by name while metrics are being calculated
+        with patch('zurnatikl.apps.people.views.contributor_network_metrics',
+                   return_value=None):
+            response = self.client.get(reverse('people:list'),
+                                       {'sort': 'pagerank'})
+        self.assertEqual('name', response.context['sort'])
+        self.assertNotContains(response, 'PageRank:')
+
     def test_person_detail(self):
         # berrigan - edited one issue in test data, no items created
         berrigan = Person.objects.get(last_name='Berrigan')
@@ -318,6 +399,26 @@ class PeopleViewsTestCase(TestCase):
         self.assert_('edges' in response.content)
         self.assert_('nodes' in response.content)
 
+    def test_egograph_json_layout(self):
+        cache.clear()
+        berrigan = Person.objects.get(last_name='Berrigan')
+        url = reverse('people:egograph-json', kwargs={'slug': berrigan.slug})
+        # without a full network layout, egograph layout is calculated
+        with patch('zurnatikl.apps.network.layouts.get_layout',
+                   wraps=layouts.get_layout) as mockget_layout:
+            self.client.get(url)
+            self.assertEqual(1, mockget_layout.call_count)
+
+        # once the full network has a layout, egograph layout is based on it
+        self.client.get(reverse('journals:contributor-network-json'))
+        with patch('zurnatikl.apps.network.layouts.get_layout') as mockget_layout:
+            response = self.client.get(url, {'radius': 2})
+            mockget_layout.assert_not_called()
+        data = json.loads(response.content)
+        for node in data['nodes']:
+            self.assert_(-1 <= node['x'] <= 1)
+            self.assert_(-1 <= node['y'] <= 1)
+
     def test_egograph_export(self):
         berrigan = Person.objects.get(last_name='Berrigan')
         # basic testing that the export formats are correct
@@ -336,10 +437,113 @@ class PeopleViewsTestCase(TestCase):
         response = self.client.get(reverse('people:egograph-export',
             kwargs={'slug': berrigan.slug, 'fmt': 'gml'}))
         self.assertEqual(response['content-type'], 'text/plain')
-        self.assertContains(response, 'Creator "igraph version')
+        self.assertContains(response, 'Creator "zurnatikl')
         self.assertContains(response, berrigan.network_id)
         self.assertContains(response, berrigan.firstname_lastname)
 
+    def test_egograph_options(self):
+        cache.clear()
+        EgographBaseView.egographs.clear()
+        berrigan = Person.objects.get(last_name='Berrigan')
+        graph = Journal.contributor_network()
+        node = graph.vs.find(name=berrigan.network_id)
+        url = reverse('people:egograph-export',
+                      kwargs={'slug': berrigan.slug, 'fmt': 'gexf'})
+
+        # default radius of one
+        response = self.client.get(url)
+        for neighbor in node.neighbors():
+            self.assertContains(response, neighbor['name'])
+
+        # radius two includes neighbors of neighbors
+        neighbors2 = graph.neighborhood(node, order=2)
+        response = self.client.get(url, {'radius': 2})
+        for index in neighbors2:
+            self.assertContains(response, graph.vs[index]['name'])
+        # invalid radius falls back to the default
+        response = self.client.get(url, {'radius': 'all'})
+        self.assertEqual(200, response.status_code)
+
+        # filter by edge label
+        response = self.client.get(url, {'edge_label': 'editor'})
+        self.assertContains(response, 'label="editor"')
+        self.assertNotContains(response, 'label="edited"')
+        self.assertNotContains(response, 'label="co-editor"')
+        # unknown edge labels are ignored; only unknown labels is a 404
+        response = self.client.get(url, {'edge_label': ['editor', 'bogus']})
+        self.assertContains(response, 'label="editor"')
+        self.assertNotContains(response, 'label="edited"')
+        response = self.client.get(url, {'edge_label': u'caf\xe9 au lait'})
+        self.assertEqual(404, response.status_code)
+
+        # egographs are cached; only the person is looked up
+        with self.assertNumQueries(1):
+            self.client.get(url, {'radius': 2})
+
+    def test_path(self):
+        cache.clear()
+        PathBaseView.paths.clear()
+        berrigan = Person.objects.get(last_name='Berrigan')
+        graph = Journal.contributor_network()
+        source = graph.vs.find(name=berrigan.network_id)
+        # furthest person connected to berrigan
+        distances = graph.shortest_paths(source, mode='all')[0]
+        people = [(d, v['name']) for d, v in zip(distances, graph.vs)
+                  if v['type'] == 'Person' and d != float('inf')]
+        distance, network_id = max(people)
+        other = Person.objects.get(pk=network_id.split(':')[1])
+
+        url = reverse('people:path-json',
+                      kwargs={'slug': berrigan.slug, 'other_slug': other.slug})
+        data = json.loads(self.client.get(url).content)
+        self.assertEqual(distance, data['path']['length'])
+        self.assertEqual(distance + 1, len(data['nodes']))
+        steps = data['path']['steps']
+        self.assertEqual(berrigan.network_id, steps[0]['name'])
+        self.assertEqual(other.network_id, steps[-1]['name'])
+        self.assertEqual(distance, len(data['path']['connections']))
+        self.assert_(all(c['label'] for c in data['path']['connections']))
+
+        # paths are cached; only the people are looked up
+        with self.assertNumQueries(2):
+            self.client.get(url, {'weighted': 1})
+            self.client.get(url, {'weighted': 1})
+
+        # export
+        response = self.client.get(reverse('people:path-export',
+            kwargs={'slug': berrigan.slug, 'other_slug': other.slug,
+                    'fmt': 'graphml'}))
+        self.assertContains(response, other.network_id)
+        self.assertContains(response, 'attr.name="step"')
+
+        # unknown person
+        response = self.client.get(reverse('people:path-json',
+            kwargs={'slug': berrigan.slug, 'other_slug': 'nobody'}))
+        self.assertEqual(404, response.status_code)
+
+    def test_path_not_connected(self):
+        # editor of a new journal is not connected to anyone in the network
+        journal = Journal.objects.create(title='A Journal')
+        issue = Issue.objects.create(issue=1, journal=journal)
+        editor = Person.objects.create(first_name='Jane', last_name='Doe')
+        issue.editors.add(editor)
+        cache.clear()
+        PathBaseView.paths.clear()
+        berrigan = Person.objects.get(last_name='Berrigan')
+        graph = Journal.contributor_network()
+        self.assertEqual(float('inf'), graph.shortest_paths(
+            graph.vs.find(name=berrigan.network_id),
+            graph.vs.find(name=editor.network_id), mode='all')[0][0])
+
+        url = reverse('people:path-json',
+                      kwargs={'slug': berrigan.slug, 'other_slug': editor.slug})
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        data = json.loads(response.content)
+        self.assertEqual(None, data['path']['length'])
+        self.assertEqual([], data['path']['steps'])
+        self.assertEqual([], data['nodes'])
+
     def test_csv_export(self):
         response = self.client.get(reverse('people:csv'))
         self.assertEqual(response['content-type'],
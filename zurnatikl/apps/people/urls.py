@@ -1,6 +1,6 @@
 from django.conf.urls import url
 from .views import PeopleList, PersonDetail, Egograph, \
-   EgographJSON, EgographExport, PeopleCSV
+   EgographJSON, EgographExport, PathJSON, PathExport, PeopleCSV
 
 urlpatterns = [
     url(r'^$', PeopleList.as_view(), name='list'),
@@ -9,7 +9,13 @@ urlpatterns = [
         name='egograph'),
     url(r'^(?P<slug>[\w-]+)/egograph.json$', EgographJSON.as_view(),
         name='egograph-json'),
-    url(r'^(?P<slug>[\w-]+)/egograph.(?P<fmt>graphml|gml)$', EgographExport.as_view(),
+    url(r'^(?P<slug>[\w-]+)/egograph.bin$', EgographJSON.as_view(data_format='binary'),
+        name='egograph-binary'),
+    url(r'^(?P<slug>[\w-]+)/egograph.(?P<fmt>graphml|gml|gexf)$', EgographExport.as_view(),
         name='egograph-export'),
+    url(r'^(?P<slug>[\w-]+)/path/(?P<other_slug>[\w-]+).json$', PathJSON.as_view(),
+        name='path-json'),
+    url(r'^(?P<slug>[\w-]+)/path/(?P<other_slug>[\w-]+).(?P<fmt>graphml|gml|gexf)$',
+        PathExport.as_view(), name='path-export'),
     url(r'^data/people.csv$', PeopleCSV.as_view(), name='csv'),
 ]
\ No newline at end of file
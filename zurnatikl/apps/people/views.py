@@ -1,13 +1,22 @@
+from collections import OrderedDict
+import hashlib
 import logging
 from django.db.models import Count
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from django.views.generic import ListView, DetailView
 from django.views.generic.detail import SingleObjectMixin
 
 from .models import Person
 from zurnatikl.apps.journals.models import Journal
+from zurnatikl.apps.journals.views import contributor_network, \
+    contributor_network_layout, contributor_network_metrics
 from zurnatikl.apps.network.base_views import SigmajsJSONView, \
    NetworkGraphExportView, CsvView
-from zurnatikl.apps.network.utils import egograph
+from zurnatikl.apps.network import graph_cache, layouts
+from zurnatikl.apps.network.metrics import has_metrics
+from zurnatikl.apps.network.utils import egograph, shortest_path, \
+    vertex_index
 
 
 logger = logging.getLogger(__name__)
@@ -22,12 +31,69 @@ class PeopleList(ListView):
     Queryset is annotated with counts for the number of items created,
     items translated, and issues edited so that the totals can
     be displayed.
+
+    The list can be sorted by contributor network centrality with
+    a **sort** request parameter (see :attr:`sort_options`); the list
+    is sorted by name while metrics are still being calculated.
     '''
     model = Person
 
     queryset = Person.objects.journal_contributors_with_counts() \
                      .prefetch_related('name_set')
 
+    #: available sort options; name or centrality metric for the
+    #: contributor network (see :mod:`zurnatikl.apps.network.metrics`)
+    sort_options = OrderedDict([
+        ('name', 'Name'),
+        ('pagerank', 'PageRank'),
+        ('eigenvector_centrality', 'Eigenvector centrality'),
+        ('betweenness', 'Betweenness'),
+        ('closeness', 'Closeness'),
+        ('kcore', 'k-core'),
+    ])
+
+    #: sort for the current request
+    sort = None
+
+    def get_sort(self):
+        if self.sort is None:
+            self.sort = self.request.GET.get('sort')
+            if self.sort not in self.sort_options:
+                self.sort = 'name'
+        return self.sort
+
+    def get_queryset(self):
+        people = super(PeopleList, self).get_queryset()
+        sort = self.get_sort()
+        if sort == 'name':
+            return people
+
+        # sort by precomputed centrality, most central first;
+        # people not in the network are listed last
+        data = contributor_network_metrics()
+        if data is None:
+            # metrics are still being calculated; sort by name until
+            # they are ready
+            self.sort = 'name'
+            return people
+        index = dict((name, i) for i, name in enumerate(data['names']))
+        values = data[sort]
+        people = list(people)
+        for person in people:
+            i = index.get(person.network_id)
+            person.centrality = values[i] if i is not None else None
+        return sorted(people, key=lambda p: p.centrality, reverse=True)
+
+    def get_context_data(self, **kwargs):
+        context = super(PeopleList, self).get_context_data(**kwargs)
+        sort = self.get_sort()
+        context.update({
+            'sort': sort,
+            'sort_label': self.sort_options[sort],
+            'sort_options': self.sort_options,
+        })
+        return context
+
 
 class PersonDetail(DetailView):
     '''Display details for a single
@@ -62,24 +128,95 @@ class Egograph(DetailView):
 
 class EgographBaseView(SingleObjectMixin):
     '''Base view for generating an egograph for a single person,
-    for use in disseminating the graph as JSON, GEXF, or GraphML.'''
+    for use in disseminating the graph as JSON, GEXF, or GraphML.
+
+    Supports optional **radius** and **edge_label** request parameters
+    to configure the size of the egograph and restrict it to particular
+    kinds of connections, e.g. ``?radius=2&edge_label=editor``.
+    Generated egographs are cached in memory for the current network
+    data version.'''
     model = Person
 
+    #: default egograph radius
+    radius = 1
+    #: maximum egograph radius; larger egographs for well-connected
+    #: people approach the full network
+    max_radius = 3
+
+    #: in-process cache of generated egographs and the contributor
+    #: network vertex index
+    egographs = graph_cache.LRUCache(size=256)
+
+    def egograph_options(self):
+        '''Egograph radius and edge labels requested via request
+        parameters, normalized for use in cache keys.  Only contributor
+        network edge labels are used; raises :class:`~django.http.Http404`
+        if edge labels are requested but none of them are valid.'''
+        try:
+            radius = int(self.request.GET.get('radius', self.radius))
+        except ValueError:
+            radius = self.radius
+        radius = max(1, min(radius, self.max_radius))
+        edge_labels = set(l for l in self.request.GET.getlist('edge_label') if l)
+        if edge_labels:
+            edge_labels = edge_labels.intersection(Journal.contributor_edge_labels)
+            if not edge_labels:
+                raise Http404
+        return radius, tuple(sorted(edge_labels))
+
     def get_context_data(self, **kwargs):
         person = self.get_object()
-
-        # get the full journal-author-editor network
-        graph = Journal.contributor_network()
-        # restrict graph to an egograph around the current person
-        # with a radius of 1 before export
-        node = graph.vs.find(name=person.network_id)
-        return egograph(graph, node)
+        radius, edge_labels = self.egograph_options()
+        version = graph_cache.network_version()
+        key = ('egograph', person.network_id, radius, edge_labels, version)
+        ego = self.egographs.get(key)
+        if ego is None:
+            # get the full journal-author-editor network, with
+            # centrality metrics for the full network
+            graph = contributor_network()
+            index_key = ('vertex-index', version)
+            index = self.egographs.get(index_key)
+            if index is None:
+                index = vertex_index(graph)
+                self.egographs.set(index_key, index)
+            if person.network_id not in index:
+                raise Http404
+            # restrict graph to an egograph around the current person
+            ego = egograph(graph, index[person.network_id], radius,
+                           edge_labels)
+            # metrics are still being calculated; don't cache the egograph
+            self.data_current = has_metrics(graph)
+            if self.data_current:
+                self.egographs.set(key, ego)
+        # return a copy, so the cached egograph is not modified
+        # when it is annotated for display
+        return ego.copy()
 
 
 class EgographJSON(SigmajsJSONView, EgographBaseView):
     '''Egograph for a single :class:`~zurnatikl.apps.people.models.Person`
     in a JSON format appropriate for use with Sigma.js'''
-    pass
+
+    def cache_key_prefix(self):
+        # cache json data separately for each radius and edge filter;
+        # edge labels are hashed to keep cache keys short
+        radius, edge_labels = self.egograph_options()
+        return '%s-%d-%s' % (self.graph_path(), radius,
+                             hashlib.md5(','.join(edge_labels)).hexdigest())
+
+    #: position egograph vertices based on the full contributor network
+    #: layout instead of calculating a new layout
+    slice_layout = True
+    #: refine sliced layouts with a short force-directed layout pass
+    refine_layout = False
+
+    def get_graph_layout(self, graph):
+        if self.slice_layout:
+            layout = layouts.slice_layout(graph, contributor_network_layout(),
+                                          refine=self.refine_layout)
+            if layout is not None:
+                return layout
+        return super(EgographJSON, self).get_graph_layout(graph)
 
 
 class EgographExport(NetworkGraphExportView, EgographBaseView):
@@ -93,6 +230,112 @@ class EgographExport(NetworkGraphExportView, EgographBaseView):
         return super(EgographExport, self).get_context_data(**kwargs)
 
 
+class PathBaseView(SingleObjectMixin):
+    '''Base view for finding how two people are connected, as the
+    shortest path between them in the contributor network, for use in
+    disseminating the path as JSON, GEXF, or GraphML.  Connections are
+    followed in either direction.
+
+    By default, the path with the fewest steps is found; with a
+    **weighted** request parameter, paths through stronger connections
+    (relationships that occur more often) are preferred.  Paths are
+    cached in memory for the current network data version.'''
+    model = Person
+
+    #: in-process cache of paths, and the contributor network vertex
+    #: index and edge distances used to find them
+    paths = graph_cache.LRUCache(size=256)
+
+    def get_people(self):
+        person = self.get_object()
+        other = get_object_or_404(Person, slug=self.kwargs['other_slug'])
+        return person, other
+
+    def is_weighted(self):
+        return self.request.GET.get('weighted', '') not in ['', '0', 'false']
+
+    def get_context_data(self, **kwargs):
+        person, other = self.get_people()
+        weighted = self.is_weighted()
+        version = graph_cache.network_version()
+        key = ('path', person.network_id, other.network_id, weighted, version)
+        path = self.paths.get(key)
+        if path is None:
+            graph = contributor_network()
+            index_key = ('vertex-index', version)
+            index = self.paths.get(index_key)
+            if index is None:
+                index = vertex_index(graph)
+                self.paths.set(index_key, index)
+            if person.network_id not in index or other.network_id not in index:
+                raise Http404
+
+            distances = None
+            if weighted:
+                # stronger connections are shorter distances
+                distances_key = ('distances', version)
+                distances = self.paths.get(distances_key)
+                if distances is None:
+                    distances = [1.0 / weight for weight in graph.es['weight']]
+                    self.paths.set(distances_key, distances)
+            path = shortest_path(graph, index[person.network_id],
+                                 index[other.network_id], distances)
+            # metrics are still being calculated; don't cache the path
+            self.data_current = has_metrics(graph)
+            if self.data_current:
+                self.paths.set(key, path)
+        # return a copy, so the cached path is not modified
+        # when it is annotated for display
+        return path.copy()
+
+
+class PathJSON(SigmajsJSONView, PathBaseView):
+    '''Shortest path between two
+    :class:`~zurnatikl.apps.people.models.Person` in a JSON format
+    appropriate for use with Sigma.js, with a summary of the steps
+    and connections along the path.'''
+
+    def cache_key_prefix(self):
+        return '%s-%s' % (self.graph_path(), self.is_weighted())
+
+    def get_graph_layout(self, graph):
+        # lay out the path in a line, in order from the first person
+        return [(float(step), 0.0) for step in graph.vs['step']]
+
+    def get_context_data(self, **kwargs):
+        data = super(PathJSON, self).get_context_data(**kwargs)
+        nodes = sorted(data['nodes'], key=lambda n: n['step'])
+        steps = dict((node['id'], node['step']) for node in nodes)
+        names = dict((node['id'], node['name']) for node in nodes)
+        edges = sorted(data['edges'], key=lambda e: min(steps[e['source']],
+                                                        steps[e['target']]))
+        data['path'] = OrderedDict([
+            # path length is None if the people are not connected
+            ('length', len(edges) if nodes else None),
+            ('weighted', self.is_weighted()),
+            ('steps', [OrderedDict((attr, node.get(attr))
+                                   for attr in ['name', 'label', 'type'])
+                       for node in nodes]),
+            ('connections', [OrderedDict([
+                ('source', names[edge['source']]),
+                ('target', names[edge['target']]),
+                ('label', edge.get('label')),
+                ('weight', edge.get('weight'))
+            ]) for edge in edges]),
+        ])
+        return data
+
+
+class PathExport(NetworkGraphExportView, PathBaseView):
+    '''Downloadable shortest path between two
+    :class:`~zurnatikl.apps.people.models.Person` in GEXF or GraphML.'''
+
+    def get_context_data(self, **kwargs):
+        # set person slugs as base filename
+        self.filename = '%s-%s' % (kwargs['slug'], kwargs['other_slug'])
+        return super(PathExport, self).get_context_data(**kwargs)
+
+
 class PeopleCSV(CsvView):
     '''Export journal contributor person data as CSV'''
     filename = 'people'
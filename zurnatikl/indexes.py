@@ -0,0 +1,99 @@
+# shared support for search and autocomplete indexes that are kept in
+# process memory (see :mod:`zurnatikl.apps.journals.search`,
+# :mod:`zurnatikl.apps.people.name_index`, and
+# :mod:`zurnatikl.apps.geo.location_index`), so that searches don't
+# require any database queries.  Each process builds its own copy of
+# an index; changes are applied to the copy in the process where they
+# are made, and other processes are notified via a version number in
+# the django cache and rebuild their copy the next time it is used.
+# The django cache must be shared between processes (e.g., memcached).
+from contextlib import contextmanager
+import random
+import re
+import threading
+import unicodedata
+
+from django.core.cache import cache
+
+
+def tokenize(text):
+    '''Split text into lower case terms for indexing or searching,
+    converting accented characters to non-accented equivalents so
+    searches match with or without accents.'''
+    if not text:
+        return []
+    text = unicodedata.normalize('NFD', unicode(text)) \
+                      .encode('ascii', 'ignore').lower()
+    return [term for term in re.split(r'\W+', text) if term]
+
+
+class SharedIndex(object):
+    '''An index kept in process memory, built on first use with the
+    specified function, and versioned with a number in the django cache
+    so that changes made in any process are seen by all of them.
+    The index is only read and updated while holding a lock, since
+    updates modify it in place.'''
+
+    def __init__(self, name, build):
+        #: cache key for the current version number of the index
+        self.version_key = '%s-version' % name
+        #: function to build the index from the database
+        self.build = build
+        #: index for the current process
+        self.index = None
+        #: version the index for the current process is up to date with
+        self.version = None
+        self.lock = threading.RLock()
+
+    def current_version(self):
+        '''Current version number of the index, shared between
+        processes via the django cache.'''
+        version = cache.get(self.version_key)
+        if version is None:
+            # start at a random number, so that a process with an index
+            # from before the cache was cleared doesn't take it as current
+            cache.add(self.version_key, random.randint(1, 2 ** 31), None)
+            version = cache.get(self.version_key)
+        return version
+
+    @contextmanager
+    def use(self):
+        '''Context manager that provides the index for the current
+        process, holding the lock so it can't be updated while in use.
+        The index is built if not yet loaded or if it has been changed
+        by another process.'''
+        version = self.current_version()
+        with self.lock:
+            if self.index is None or self.version != version:
+                self.index = self.build()
+                self.version = version
+            yield self.index
+
+    def load(self):
+        '''Make sure the index for the current process is loaded and
+        up to date, e.g. so the first search doesn't have to wait for
+        it to be built.'''
+        with self.use():
+            pass
+
+    def changed(self, update):
+        '''Record a change to the data in the index, so that other
+        processes rebuild their copy.  If the index for the current
+        process is loaded and no other process has changed the index
+        since it was built or last updated, it is updated in place by
+        calling ``update`` with the index; otherwise it is rebuilt the
+        next time it is used.'''
+        with self.lock:
+            try:
+                version = cache.incr(self.version_key)
+            except ValueError:
+                # version was removed from the cache
+                self.current_version()
+                self.index = None
+                return
+            if self.index is None or self.version != version - 1:
+                # not loaded or out of date; rebuilt when next used
+                self.index = None
+                return
+            update(self.index)
+            self.version = version
@@ -128,6 +128,11 @@ ADMIN_REORDER = (
     ("journals", ('Journal', 'Issue', 'IssueItem', 'Genre'))
 )
 
+# directory for queueing network graph layouts to be calculated by the
+# layout_worker manage command, so requests never wait on a layout;
+# set to None to calculate layouts on request instead (e.g. in development)
+NETWORK_LAYOUT_QUEUE = os.path.join(BASE_DIR, 'layout_queue')
+
 # lookup channels for ajax autocompletes on the site
 AJAX_LOOKUP_CHANNELS = {
     #  simple: search Person.objects.filter(name__icontains=q)